@@ -1,7 +1,22 @@
 import os 
+import sys
+import time
+import importlib
 import streamlit as st
 from modules.styles import apply_custom_styles, render_header
-from views import dashboard, graphs, history, settings
+from modules.metrics import start_metrics_server, touch_session
+from modules.profiling import run_view
+
+# Vistas cargadas bajo demanda: plotly, openpyxl, etc. solo se importan al abrir su página
+VIEW_MODULES = {
+    'inicio': 'views.dashboard',
+    'graficas': 'views.graphs',
+    'datos': 'views.history',
+    'configuracion': 'views.settings',
+}
+
+# STARTUP_TIMING=1 imprime cuánto tarda cada import de vista la primera vez que se abre
+STARTUP_TIMING = os.getenv("STARTUP_TIMING", "").lower() in ("1", "true", "yes")
 
 # --- LOAD SECRETS TO ENV (Compatibilidad Streamlit Cloud) ---
 def load_secrets_to_env():
@@ -19,6 +34,19 @@ def load_secrets_to_env():
         pass
 
 load_secrets_to_env()
+# METRICS_PORT (opcional): métricas Prometheus en un puerto aparte, un servidor por proceso
+start_metrics_server()
+
+
+def track_session():
+    """Registra actividad de la sesión para la métrica de sesiones activas."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            touch_session(ctx.session_id)
+    except Exception:
+        pass
 
 
 def initialize_session_state():
@@ -57,17 +85,34 @@ def render_navigation():
                     st.rerun()
 
 
+def load_view(page_key: str):
+    """Importa la vista de la página (una sola vez por proceso; luego sale de sys.modules)."""
+    module_name = VIEW_MODULES[page_key]
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    modules_before = set(sys.modules)
+    t0 = time.perf_counter()
+    module = importlib.import_module(module_name)
+    elapsed = time.perf_counter() - t0
+
+    if STARTUP_TIMING:
+        new_modules = set(sys.modules) - modules_before
+        stdlib = getattr(sys, 'stdlib_module_names', ())
+        heavy = sorted({name.split('.')[0] for name in new_modules}
+                       - set(stdlib) - {'views', 'modules'})
+        heavy = [name for name in heavy if not name.startswith('_')]
+        print(f"[home.py] Import {module_name}: {elapsed * 1000:.0f} ms, {len(new_modules)} módulos nuevos "
+              f"(paquetes: {', '.join(heavy) or 'ninguno'})")
+    return module
+
+
 def route_to_page():
     current_page = st.session_state.current_page
     
-    if current_page == 'inicio':
-        dashboard.show_view()
-    elif current_page == 'graficas':
-        graphs.show_view()
-    elif current_page == 'datos':
-        history.show_view()
-    elif current_page == 'configuracion':
-        settings.show_view()
+    if current_page in VIEW_MODULES:
+        # ?profile=1 (o PROFILE_VIEWS=1): desglose de tiempos del rerun al pie de la página
+        run_view(current_page, load_view(current_page).show_view)
 
 
 def show_login_page():
@@ -207,6 +252,7 @@ def main():
         layout="wide",
         initial_sidebar_state="collapsed"
     )
+    track_session()
     
     # Inicializar estado de autenticación
     if 'authenticated' not in st.session_state:
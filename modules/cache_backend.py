@@ -0,0 +1,198 @@
+"""
+Caché compartido entre réplicas (segundo nivel del FrameCache).
+
+Con varias réplicas de Streamlit detrás de un balanceador, cada una tenía su
+propia copia del historial y consultaba Atlas por su cuenta. Este backend guarda
+las tablas serializadas en formato Arrow IPC en un almacén compartido, con TTL y
+claves versionadas, para que la carga de una réplica sirva a todas:
+
+    L1  FrameCache en memoria del proceso (modules/frame_cache.py)
+    L2  CacheBackend compartido (este módulo)
+    L3  MongoDB
+
+Backends (variable CACHE_BACKEND):
+    none    (por defecto) sin caché compartido
+    sqlite  archivo SQLite en CACHE_SQLITE_PATH, p.ej. un volumen montado en todas
+            las réplicas del mismo host. SQLite sobre NFS no es confiable: para varios
+            hosts conviene implementar CacheBackend sobre Redis u otro almacén.
+
+Mientras una réplica carga una clave toma un "lease": las demás esperan su
+resultado en lugar de repetir la misma consulta contra MongoDB.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Hashable, Optional
+
+import pyarrow as pa
+import streamlit as st
+
+# Subir al cambiar el formato de los frames cacheados (invalida todo lo guardado)
+CACHE_SCHEMA_VERSION = 1
+DEFAULT_SQLITE_PATH = os.path.join(".cache", "frames.sqlite")
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# Resolución del último acceso que usa el desalojo LRU
+ACCESS_TOUCH_SECONDS = 60
+
+
+def cache_key(namespace: str, key: Hashable) -> str:
+    """Clave estable entre procesos: versión + namespace + hash de los argumentos."""
+    version = f"v{CACHE_SCHEMA_VERSION}.{os.getenv('CACHE_KEY_VERSION', '0')}"
+    digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+    return f"{version}:{namespace}:{digest}"
+
+
+def table_to_bytes(table: pa.Table) -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def table_from_bytes(data: bytes) -> pa.Table:
+    return pa.ipc.open_stream(pa.py_buffer(data)).read_all()
+
+
+class CacheBackend:
+    """Interfaz del caché compartido (implementación nula: no guarda nada)."""
+
+    name = "none"
+
+    def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    def set(self, key: str, data: bytes, ttl: Optional[float] = None):
+        pass
+
+    def clear(self, namespace: Optional[str] = None):
+        pass
+
+    def acquire_lease(self, key: str, ttl: float) -> bool:
+        """True si este proceso debe cargar la clave (ningún otro la está cargando)."""
+        return True
+
+    def release_lease(self, key: str):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class SQLiteBackend(CacheBackend):
+    """Tablas Arrow IPC en un archivo SQLite (modo WAL, varias réplicas del mismo host)."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.owner = uuid.uuid4().hex
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, value BLOB NOT NULL, nbytes INTEGER NOT NULL,
+            expires_at REAL, last_access REAL NOT NULL)""")
+        conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo (los reruns de Streamlit corren en hilos distintos)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at, last_access FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at, last_access = row
+        if expires_at is not None and expires_at < now:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        # Un hit es solo lectura: el acceso (para el LRU) se anota a lo más una vez por
+        # ACCESS_TOUCH_SECONDS, así los lectores no se turnan el lock de escritura
+        if now - last_access > ACCESS_TOUCH_SECONDS:
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+        return bytes(value)
+
+    def set(self, key: str, data: bytes, ttl: Optional[float] = None):
+        if len(data) > self.max_bytes:
+            print(f"[cache_backend] {key} ocupa {len(data) / 1e6:.1f} MB, más que el límite: no se guarda")
+            return
+        conn = self._conn()
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO entries (key, value, nbytes, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                     (key, sqlite3.Binary(data), len(data), now + ttl if ttl else None, now))
+        conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+        self._evict(conn)
+        conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # LRU: borrar las menos usadas hasta quedar bajo el límite
+        for key, nbytes in conn.execute("SELECT key, nbytes FROM entries ORDER BY last_access").fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= nbytes
+            print(f"[cache_backend] Desalojado {key} ({nbytes / 1e6:.1f} MB)")
+            if total <= self.max_bytes:
+                break
+
+    def clear(self, namespace: Optional[str] = None):
+        conn = self._conn()
+        if namespace is None:
+            conn.execute("DELETE FROM entries")
+        else:
+            conn.execute("DELETE FROM entries WHERE key LIKE ?", (f"%:{namespace}:%",))
+        conn.commit()
+
+    def acquire_lease(self, key: str, ttl: float) -> bool:
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at < ?", (key, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                                  (key, self.owner, now + ttl))
+        return cursor.rowcount == 1
+
+    def release_lease(self, key: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner))
+
+    def stats(self) -> Dict[str, Any]:
+        entries, nbytes = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM entries").fetchone()
+        return {"backend": self.name, "path": self.path, "entries": entries, "bytes": nbytes, "max_bytes": self.max_bytes}
+
+
+@st.cache_resource(show_spinner=False)
+def get_cache_backend() -> CacheBackend:
+    """Backend configurado por entorno (uno por proceso)."""
+    kind = os.getenv("CACHE_BACKEND", "none").lower()
+    if kind == "sqlite":
+        path = os.getenv("CACHE_SQLITE_PATH", DEFAULT_SQLITE_PATH)
+        max_bytes = int(os.getenv("CACHE_BACKEND_MAX_BYTES", DEFAULT_MAX_BYTES))
+        try:
+            backend = SQLiteBackend(path, max_bytes)
+            print(f"[cache_backend] SQLite compartido en {path} (límite {max_bytes / 1e6:.0f} MB)")
+            return backend
+        except Exception as e:
+            print(f"[cache_backend] No se pudo abrir {path}: {e}. Sin caché compartido.")
+    elif kind not in ("none", ""):
+        print(f"[cache_backend] CACHE_BACKEND desconocido '{kind}'. Sin caché compartido.")
+    return CacheBackend()
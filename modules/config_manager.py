@@ -1,15 +1,25 @@
-from typing import Dict, Any, Optional
+import hashlib
+import time
+from typing import Dict, Any, Optional, Set, Tuple
 from modules.database import DatabaseConnection
 from modules.sensor_registry import SensorRegistry
+from modules.sensor_aliases import parse_threshold_fields
 
 
 class ConfigManager:
     
     CONFIG_ID = "sensor_thresholds"
+    # Cada cuánto se vuelve a verificar contra la BD un conjunto de sensores ya sincronizado
+    SYNC_TTL_SECONDS = 300
+    # Compartido por todas las sesiones del proceso: config_id -> (hash de sensores detectados, momento)
+    _sync_cache: Dict[str, Tuple[str, float]] = {}
+    # Metadatos de dispositivos: cada tarjeta y filtro del dashboard los consulta; se reutilizan por este tiempo
+    METADATA_TTL_SECONDS = 30
     
     def __init__(self, db: DatabaseConnection):
         self.db = db
         self._cached_config = None
+        self._cached_metadata: Optional[Tuple[float, Dict[str, Dict[str, Any]]]] = None
     
     def get_sensor_config(self, force_refresh: bool = False) -> Dict[str, Any]:
         if self._cached_config is not None and not force_refresh:
@@ -63,7 +73,7 @@ class ConfigManager:
         success = self.db.save_config(self.CONFIG_ID, config)
         
         if success:
-            self._cached_config = None
+            self._invalidate()
         
         return success
     
@@ -82,7 +92,7 @@ class ConfigManager:
         success = self.db.save_config(self.CONFIG_ID, config)
         
         if success:
-            self._cached_config = None
+            self._invalidate()
         
         return success
     
@@ -97,7 +107,7 @@ class ConfigManager:
         success = self.db.save_config(self.CONFIG_ID, config)
         
         if success:
-            self._cached_config = None
+            self._invalidate()
         
         return success
     
@@ -112,30 +122,65 @@ class ConfigManager:
         success = self.db.save_config(self.CONFIG_ID, config)
         
         if success:
-            self._cached_config = None
+            self._invalidate()
         
         return success
     
     def sync_with_detected_sensors(self, detected_sensors: set) -> bool:
-        config = self.get_sensor_config(force_refresh=True)
-        
-        updated_config = SensorRegistry.merge_configs(config, detected_sensors)
-        
-        success = self.db.save_config(self.CONFIG_ID, updated_config)
-        
+        """
+        Agrega a la config los sensores detectados que aún no tiene (con sus defaults).
+        En estado estable no toca la BD: si el mismo conjunto de sensores ya se sincronizó
+        hace menos de SYNC_TTL_SECONDS no se lee ni se escribe nada, y si hay sensores
+        nuevos se escriben solo esos con $set.
+        """
+        detected = {str(s) for s in detected_sensors}
+        detected_hash = self._detected_hash(detected)
+        cached = ConfigManager._sync_cache.get(self.CONFIG_ID)
+        if cached and cached[0] == detected_hash and time.monotonic() - cached[1] < self.SYNC_TTL_SECONDS:
+            return True
+
+        missing = detected - set(self.get_sensor_config().get("sensors", {}))
+        if missing:
+            # Confirmar contra la BD antes de escribir (otra sesión pudo agregarlos)
+            missing = detected - set(self.get_sensor_config(force_refresh=True).get("sensors", {}))
+
+        success = True
+        if missing:
+            if any("." in name or name.startswith("$") for name in missing):
+                # Nombres no válidos como ruta de $set: reescribir el documento completo
+                config = self.get_sensor_config(force_refresh=True)
+                success = self.db.save_config(self.CONFIG_ID, SensorRegistry.merge_configs(config, detected))
+            else:
+                fields = {f"sensors.{name}": SensorRegistry.get_default_metadata(name).to_dict() for name in sorted(missing)}
+                success = self.db.update_config_fields(self.CONFIG_ID, fields)
+            if success:
+                print(f"[config_manager] Sensores nuevos agregados a la config: {', '.join(sorted(missing))}")
+                self._invalidate()
+
         if success:
-            self._cached_config = None
-        
+            ConfigManager._sync_cache[self.CONFIG_ID] = (detected_hash, time.monotonic())
         return success
     
+    @staticmethod
+    def _detected_hash(detected_sensors: Set[str]) -> str:
+        return hashlib.sha1("\n".join(sorted(detected_sensors)).encode("utf-8")).hexdigest()
+
+    def _invalidate(self):
+        self._cached_config = None
+        ConfigManager._sync_cache.pop(self.CONFIG_ID, None)
+    
     def get_all_configured_sensors(self) -> Dict[str, Dict[str, Any]]:
         config = self.get_sensor_config()
         return config.get("sensors", {})
     
     DEVICES_CONFIG_ID = "device_metadata"
 
-    def get_device_metadata(self) -> Dict[str, Dict[str, str]]:
+    def get_device_metadata(self, force_refresh: bool = False) -> Dict[str, Dict[str, str]]:
         """Recupera los metadatos de dispositivos (alias, ubicación, umbrales)."""
+        if (self._cached_metadata is not None and not force_refresh
+                and time.monotonic() - self._cached_metadata[0] < self.METADATA_TTL_SECONDS):
+            return self._cached_metadata[1]
+
         all_devices = self.db.get_all_devices_metadata()
         
         # Mapear nombre->alias, ubicacion->location, umbrales->thresholds para compatibilidad
@@ -143,62 +188,17 @@ class ConfigManager:
         for dev_id, dev_data in all_devices.items():
             raw_umbrales = dev_data.get("umbrales", {})
             
-            # CONVERTIR formato plano (temp_min, ph_max) a formato estructurado
+            # CONVERTIR formato plano (temp_min, ph_max) a formato estructurado con nombre canónico
             # Entrada: {temp_min: 16, temp_max: 29, ph_min: 6, ph_max: 8.2}
-            # Salida: {temperatura: {min_value: 16, max_value: 29}, ph: {min_value: 6, max_value: 8.2}}
-            structured_thresholds = {}
-            
-            # Mapeo de prefijos a nombres de sensores
-            prefix_to_sensor = {
-                'temp': 'temperatura',
-                'temperatura': 'temperatura',
-                'temperature': 'temperatura',  # Formato nuevo (nombre canónico)
-                'ph': 'ph',
-                'do': 'do',             # Dissolved oxygen
-                'oxygen': 'do',         # Alias de oxígeno
-                'orp': 'orp',           # ORP
-                'ec': 'ec',             # Electrical conductivity
-                'turbidez': 'turbidez',
-                'saturation': 'saturation',
-                'ammonia': 'ammonia',
-                'nitrite': 'nitrite',
-                'nitrate': 'nitrate',
-                'alkalinity': 'alkalinity',
-                'phosphate': 'phosphate',
-                'hardness': 'hardness',
-                'tss': 'tss',
-                'biofloc_index': 'biofloc_index',
-            }
-            
-            for key, value in raw_umbrales.items():
-                # Ignorar objetos anidados (formato antiguo ya convertido)
-                if isinstance(value, dict) or isinstance(value, list):
-                    continue
-                
-                # Parsear keys como "temp_min", "ph_max", etc.
-                key_lower = key.lower()
-                parts = key_lower.rsplit('_', 1)  # Dividir desde la derecha
-                
-                if len(parts) == 2:
-                    prefix, threshold_type = parts
-                    
-                    # Obtener nombre del sensor normalizado
-                    sensor_name = prefix_to_sensor.get(prefix, prefix)
-                    
-                    if sensor_name not in structured_thresholds:
-                        structured_thresholds[sensor_name] = {}
-                    
-                    # Mapear el tipo de umbral
-                    if threshold_type == 'min':
-                        structured_thresholds[sensor_name]['min_value'] = float(value)
-                    elif threshold_type == 'max':
-                        structured_thresholds[sensor_name]['max_value'] = float(value)
+            # Salida: {temperature: {min_value: 16, max_value: 29}, ph: {min_value: 6, max_value: 8.2}}
+            structured_thresholds = parse_threshold_fields(raw_umbrales)
             
             result[dev_id] = {
                 "alias": dev_data.get("nombre", dev_id),
                 "location": dev_data.get("ubicacion", "Desconocido"),
                 "thresholds": structured_thresholds
             }
+        self._cached_metadata = (time.monotonic(), result)
         return result
 
     def update_device_metadata(self, device_id: str, alias: str, location: str) -> bool:
@@ -209,6 +209,7 @@ class ConfigManager:
             "ubicacion": location  # Guardamos en 'ubicacion' (español)
         }
         
+        self._cached_metadata = None
         return self.db.update_device_fields(device_id, update_data)
 
     def get_device_info(self, device_id: str) -> Dict[str, str]:
@@ -230,4 +231,5 @@ class ConfigManager:
             f"umbrales.{sensor_name}": threshold_data
         }
         
+        self._cached_metadata = None
         return self.db.update_device_fields(device_id, update_data)
\ No newline at end of file
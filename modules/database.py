@@ -1,30 +1,107 @@
+import importlib.util
 import os
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import streamlit as st
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 import certifi
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 from datetime import datetime, timedelta, timezone
 
+from modules.local_time import to_local, to_local_series, to_utc
+from modules.timestamp_decoder import decode_timestamps
+from modules.sensor_aliases import canonical_sensor, raw_field_names
+from modules.metrics import (MONGO_POOL_CHECKED_OUT, MONGO_POOL_CONNECTIONS, NORMALIZE_SECONDS,
+                             NORMALIZED_DOCUMENTS, timed_query)
+
 # Cargar variables de entorno
 load_dotenv()
 
+# Compresión del protocolo: zstd/snappy solo si su paquete está instalado (zlib viene con Python)
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def wire_compressors() -> List[str]:
+    """Compresores pedidos en MONGO_COMPRESSORS (por defecto zstd,snappy,zlib) que están disponibles."""
+    requested = [c.strip().lower() for c in os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib").split(",") if c.strip()]
+    return [c for c in requested
+            if c in COMPRESSOR_MODULES and importlib.util.find_spec(COMPRESSOR_MODULES[c]) is not None]
+
+
+# Últimas lecturas por dispositivo: agregación en colecciones chicas, find_one por
+# dispositivo (O(dispositivos × log n) con índice) en las grandes
+LATEST_POINT_MIN_DOCS = 200_000
+LATEST_POINT_WORKERS = 8
+LATEST_STRATEGY_TTL_SECONDS = 300
+LATEST_POINT_INDEXES = ((("device_id", 1), ("timestamp", -1)), (("dispositivo_id", 1), ("timestamp", -1)))
+_latest_strategy_cache: Dict[Tuple[str, str], Tuple[float, str]] = {}
+_latest_strategy_lock = threading.Lock()
+
+
+# --- Métricas del pool de conexiones (modules/metrics.py) ---
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Se pasa a MongoClient(event_listeners=[...]) para medir el uso del pool."""
+
+    def pool_created(self, event):
+        MONGO_POOL_CONNECTIONS.set(0, address=_address(event))
+        MONGO_POOL_CHECKED_OUT.set(0, address=_address(event))
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.inc(address=_address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.dec(address=_address(event))
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_CHECKED_OUT.inc(address=_address(event))
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.dec(address=_address(event))
+
+
+def _address(event) -> str:
+    host, port = event.address
+    return f"{host}:{port}"
+
+
 # --- PATRÓN SINGLETON (CONEXIÓN ROBUSTA) ---
 @st.cache_resource(ttl=3600, show_spinner=False)
 def get_mongo_client(uri: str) -> Optional[MongoClient]:
     if not uri: return None
     try:
-        client = MongoClient(
-            uri,
-            connectTimeoutMS=30000,
-            retryWrites=True,
-            tls=True,
-            tlsCAFile=certifi.where(),
-            tz_aware=True
-        )
+        options = {"connectTimeoutMS": 30000, "retryWrites": True, "tz_aware": True,
+                   "event_listeners": [PoolMetricsListener()]}
+        compressors = wire_compressors()
+        if compressors:
+            # El servidor elige el primero que soporte; Atlas acepta los tres
+            options["compressors"] = ",".join(compressors)
+        # TLS obligatorio en Atlas; MONGO_TLS=false permite un mongod local (benchmarks/pruebas de carga)
+        if os.getenv("MONGO_TLS", "true").lower() not in ("0", "false", "no"):
+            options.update(tls=True, tlsCAFile=certifi.where())
+        client = MongoClient(uri, **options)
         # Ping rapido para validar
         client.admin.command('ping')
         return client
@@ -34,6 +111,15 @@ def get_mongo_client(uri: str) -> Optional[MongoClient]:
 
 class DatabaseConnection:
     CONFIG_COLLECTION = "system_config"
+    # Escritas por scripts/alert_evaluator.py
+    ALERTS_EVENTS_COLLECTION = "alerts_events"
+    ALERTS_STATE_COLLECTION = "alerts_state"
+    EVALUATOR_STATE_ID = "__evaluator__"
+    # Sensores por dispositivo (modules/sensor_catalog.py)
+    SENSOR_CATALOG_COLLECTION = "sensor_catalog"
+
+    # Campos de una lectura que usa _normalize_document: lo demás no viaja por la red
+    READING_BASE_FIELDS = ("_id", "timestamp", "device_id", "dispositivo_id", "metadata.device_id", "location", "alerts")
 
     def __init__(self):
         # 1. Configuración de Fuente Única
@@ -65,9 +151,44 @@ class DatabaseConnection:
             return self.db[devices_coll]
         return None
 
+    @classmethod
+    def reading_projection(cls, sensors: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        Proyección mínima para leer lecturas. Sin `sensors` trae los subdocumentos
+        sensors/datos completos; con una lista de sensores (nombres canónicos) trae solo
+        esos campos (sensors.ph, datos.ph y sus alias).
+        """
+        projection = {field: 1 for field in cls.READING_BASE_FIELDS}
+        if not sensors:
+            projection.update({"sensors": 1, "datos": 1})
+            return projection
+        for name in raw_field_names(sensors):
+            projection[f"sensors.{name}"] = 1
+            projection[f"datos.{name}"] = 1
+        return projection
+
     # --- MÉTODOS ADAPTER (Normalización) ---
-    def _normalize_document(self, doc: Dict[str, Any]) -> Dict[str, Any]:
-        """ADAPTER: Normaliza documentos de diferentes esquemas a un formato unificado."""
+    def _normalize_documents(self, raw_docs: List[Dict[str, Any]], label: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        _normalize_document para un lote: los timestamps de texto se decodifican juntos
+        (formato detectado una vez y parseo vectorizado) en lugar de documento por documento.
+        """
+        started = time.perf_counter()
+        norm_docs = [self._normalize_document(doc, parse_strings=False) for doc in raw_docs]
+        pending = [i for i, doc in enumerate(norm_docs) if isinstance(doc.get("timestamp"), str)]
+        if pending:
+            decoded = decode_timestamps([norm_docs[i]["timestamp"] for i in pending], label=label)
+            for i, ts in zip(pending, decoded):
+                norm_docs[i]["timestamp"] = ts
+        NORMALIZED_DOCUMENTS.inc(len(norm_docs), label=label or "")
+        NORMALIZE_SECONDS.inc(time.perf_counter() - started, label=label or "")
+        return norm_docs
+
+    def _normalize_document(self, doc: Dict[str, Any], parse_strings: bool = True) -> Dict[str, Any]:
+        """
+        ADAPTER: Normaliza documentos de diferentes esquemas a un formato unificado.
+        Con parse_strings=False un timestamp de texto se deja tal cual (lo decodifica _normalize_documents).
+        """
         if not doc: return {}
         
         # 1. Normalizar ID de Dispositivo
@@ -91,17 +212,13 @@ class DatabaseConnection:
                 raw_ts = raw_ts["$date"]
                 
             if isinstance(raw_ts, (int, float)):
-                # Forzar interpretation como UTC
-                if raw_ts > 1e11: 
-                    final_ts = pd.to_datetime(raw_ts, unit='ms', utc=True).to_pydatetime()
-                else:
-                    final_ts = pd.to_datetime(raw_ts, unit='s', utc=True).to_pydatetime()
+                # Epoch en UTC (ms si es muy grande)
+                final_ts = datetime.fromtimestamp(raw_ts / 1000 if raw_ts > 1e11 else raw_ts, tz=timezone.utc)
             elif isinstance(raw_ts, str):
-                final_ts = pd.to_datetime(raw_ts, errors='coerce', utc=True)
-                if not pd.isna(final_ts):
-                     final_ts = final_ts.to_pydatetime()
+                if parse_strings:
+                    final_ts = decode_timestamps([raw_ts])[0]
                 else:
-                     final_ts = None
+                    final_ts = raw_ts
             elif isinstance(raw_ts, datetime):
                 final_ts = raw_ts
                 # Si pymongo nos da naive, asumimos UTC manualmente (caso raro con tz_aware=True)
@@ -109,13 +226,8 @@ class DatabaseConnection:
                     final_ts = final_ts.replace(tzinfo=timezone.utc)
         except Exception:
             final_ts = None
-        
-        if final_ts is not None:
-             if final_ts.tzinfo is not None:
-                 # Si viene con zona horaria (UTC de Mongo), convertir a Chile (UTC-3)
-                 chile_tz = timezone(timedelta(hours=-3))
-                 final_ts = final_ts.astimezone(chile_tz)
-                 final_ts = final_ts.replace(tzinfo=None) # Hacer naive para compatibilidad interna
+        # El timestamp queda en UTC (aware): la conversión a hora local se hace por columna
+        # al armar el DataFrame (_rows_to_dataframe / _parse_historical_flat)
         
         # Normalizar ID de config/mongo para evitar conflictos si se usa como key
         oid = str(doc.get("_id", ""))
@@ -126,13 +238,8 @@ class DatabaseConnection:
         # - Anidado: {"temperature": {"value": 19.85, "unit": "C", "valid": true}}
         normalized_sensors = {}
         for key, value in sensors.items():
-            norm_key = key.lower().strip()
-            
-            # Manejar aliases comunes
-            if norm_key in ["temp", "temperatura"]:
-                norm_key = "temperature"
-            elif norm_key in ["oxigeno", "od", "do"]:
-                norm_key = "oxygen"
+            # Nombre canónico (temp/temperatura -> temperature, do/od -> oxygen, ...)
+            norm_key = canonical_sensor(key)
             
             # Extraer el valor numérico
             final_value = None
@@ -160,28 +267,122 @@ class DatabaseConnection:
         }
 
     # --- MÉTODO PARA DASHBOARD (Single-DB Optimized) ---
-    def get_latest_by_device(self) -> pd.DataFrame:
+    def _latest_by_device_pipeline(self, device_ids: Optional[List[str]] = None,
+                                   until_id: Optional[Any] = None) -> List[Dict[str, Any]]:
+        """Pipeline de get_latest_by_device (expuesto para explain/benchmarks)."""
+        # AGREGACIÓN para obtener el documento más reciente de CADA dispositivo
+        # Esto soluciona el problema de dispositivos inactivos que quedan fuera del limit(1000) simple
+        # Con device_ids (p.ej. la página visible del dashboard) solo se ordenan sus lecturas
+        query = self.device_filter(device_ids) if device_ids else {}
+        if until_id is not None:
+            query["_id"] = {"$lte": until_id}
+        match = [{"$match": query}] if query else []
+        return match + [
+            {"$sort": {"timestamp": -1}},
+            # Solo los campos que se normalizan (antes viajaba $$ROOT completo)
+            {"$project": self.reading_projection()},
+            {"$group": {
+                "_id": {
+                    "$ifNull": ["$device_id", "$dispositivo_id"] # Manejar ambos nombres de campo ID
+                },
+                "latest_doc": {"$first": "$$ROOT"}
+            }},
+            {"$replaceRoot": {"newRoot": "$latest_doc"}}
+        ]
+
+    def _latest_strategy(self) -> str:
+        """
+        "aggregate" (ordenar y agrupar todo el histórico) o "point" (un find_one por
+        dispositivo). Se elige con LATEST_STRATEGY; en "auto" se usan consultas puntuales
+        solo si la colección supera LATEST_POINT_MIN_DOCS documentos y tiene los índices
+        (device_id, timestamp) y (dispositivo_id, timestamp). Sin índice cada find_one
+        recorrería la colección entera, peor que la agregación.
+        """
+        requested = os.getenv("LATEST_STRATEGY", "auto").lower()
+        if requested in ("aggregate", "point"):
+            return requested
+
+        key = (self.db_name, self.coll_name)
+        with _latest_strategy_lock:
+            cached = _latest_strategy_cache.get(key)
+            if cached and time.monotonic() - cached[0] < LATEST_STRATEGY_TTL_SECONDS:
+                return cached[1]
+
+        strategy = "aggregate"
+        try:
+            min_docs = int(os.getenv("LATEST_POINT_MIN_DOCS", str(LATEST_POINT_MIN_DOCS)))
+            if self.collection.estimated_document_count() >= min_docs:
+                indexed = {tuple(tuple(k) for k in info.get("key", []))
+                           for info in self.collection.index_information().values()}
+                if all(keys in indexed for keys in LATEST_POINT_INDEXES):
+                    strategy = "point"
+                else:
+                    print("[database] Colección grande sin índices (device_id, timestamp): "
+                          "últimas lecturas por agregación")
+        except Exception as e:
+            print(f"[database] No se pudo elegir estrategia de últimas lecturas: {e}")
+
+        with _latest_strategy_lock:
+            _latest_strategy_cache[key] = (time.monotonic(), strategy)
+        return strategy
+
+    def known_device_ids(self, include_registry: bool = True) -> List[str]:
+        """
+        IDs de dispositivo conocidos: el registro (devices_data) más los distintos de la
+        colección de lecturas, que con índice en device_id/dispositivo_id se resuelven
+        recorriendo solo las claves del índice. Con include_registry=False, solo los
+        dispositivos que tienen lecturas.
+        """
+        ids = set()
+        try:
+            if include_registry and self.devices_collection is not None:
+                ids.update(self.devices_collection.distinct("_id"))
+            ids.update(self.collection.distinct("device_id"))
+            ids.update(self.collection.distinct("dispositivo_id"))
+        except Exception as e:
+            print(f"[database] Error listando dispositivos: {e}")
+        return sorted(str(i) for i in ids if i not in (None, "", "unknown"))
+
+    def _latest_by_point_queries(self, device_ids: List[str], until_id: Optional[Any] = None) -> List[Dict[str, Any]]:
+        """Última lectura de cada dispositivo con find_one concurrentes (uno por ID, vía índice)."""
+        projection = self.reading_projection()
+        bound = {"_id": {"$lte": until_id}} if until_id is not None else {}
+
+        def latest(device_id: str) -> Optional[Dict[str, Any]]:
+            return self.collection.find_one(
+                {"$or": [{"device_id": device_id}, {"dispositivo_id": device_id}], **bound},
+                projection, sort=[("timestamp", -1)])
+
+        if not device_ids:
+            return []
+        with ThreadPoolExecutor(max_workers=min(LATEST_POINT_WORKERS, len(device_ids))) as pool:
+            return [doc for doc in pool.map(latest, device_ids) if doc]
+
+    def latest_documents(self, device_ids: Optional[List[str]] = None, strategy: Optional[str] = None,
+                         until_id: Optional[Any] = None) -> List[Dict[str, Any]]:
+        """
+        Documentos crudos (proyección de lectura) de la última lectura por dispositivo.
+        Con `until_id` solo se consideran lecturas con _id <= until_id.
+        """
+        if (strategy or self._latest_strategy()) == "point":
+            ids = list(device_ids) if device_ids else self.known_device_ids()
+            return self._latest_by_point_queries(ids, until_id)
+        return list(self.collection.aggregate(self._latest_by_device_pipeline(device_ids, until_id)))
+
+    @timed_query
+    def get_latest_by_device(self, device_ids: Optional[List[str]] = None,
+                             strategy: Optional[str] = None) -> pd.DataFrame:
+        """
+        Última lectura de cada dispositivo (o solo de `device_ids`). `strategy` fuerza
+        "aggregate" o "point"; por defecto se elige según el tamaño de la colección.
+        """
         if self.collection is None: return pd.DataFrame()
         
         try:
-            # AGREGACIÓN para obtener el documento más reciente de CADA dispositivo
-            # Esto soluciona el problema de dispositivos inactivos que quedan fuera del limit(1000) simple
-            pipeline = [
-                {"$sort": {"timestamp": -1}},
-                {"$group": {
-                    "_id": {
-                        "$ifNull": ["$device_id", "$dispositivo_id"] # Manejar ambos nombres de campo ID
-                    },
-                    "latest_doc": {"$first": "$$ROOT"}
-                }},
-                {"$replaceRoot": {"newRoot": "$latest_doc"}}
-            ]
-            
-            documents = list(self.collection.aggregate(pipeline))
+            documents = self.latest_documents(device_ids, strategy)
             
             all_docs = []
-            for raw_doc in documents:
-                norm_doc = self._normalize_document(raw_doc)
+            for norm_doc in self._normalize_documents(documents, label="dashboard"):
                 if norm_doc["device_id"] and norm_doc["device_id"] != "unknown":
                     all_docs.append(norm_doc)
                     
@@ -191,6 +392,7 @@ class DatabaseConnection:
             print(f"Error fetching latest devices: {str(e)}")
             return pd.DataFrame()
 
+    @timed_query
     def get_latest_for_single_device(self, device_id: str) -> pd.DataFrame:
         """Busca el dispositivo en la fuente única."""
         if self.collection is None: return pd.DataFrame()
@@ -203,7 +405,7 @@ class DatabaseConnection:
                 ]
             }
             
-            doc = self.collection.find_one(query, sort=[("timestamp", -1)])
+            doc = self.collection.find_one(query, self.reading_projection(), sort=[("timestamp", -1)])
             if doc:
                 norm_doc = self._normalize_document(doc)
                 return self._rows_to_dataframe([norm_doc])
@@ -214,7 +416,8 @@ class DatabaseConnection:
         return pd.DataFrame()
 
     # --- METODOS PARA HISTORIAL Y GRAFICOS ---
-    def fetch_data(self, start_date=None, end_date=None, device_ids=None, limit=5000) -> pd.DataFrame:
+    @timed_query
+    def fetch_data(self, start_date=None, end_date=None, device_ids=None, limit=5000, sensors=None) -> pd.DataFrame:
         if self.collection is None: return pd.DataFrame()
         
         try:
@@ -231,24 +434,24 @@ class DatabaseConnection:
             # Por seguridad lo mantenemos en Python como estaba, pero se podría optimizar aquí.
             
             raw_documents = []
+            projection = self.reading_projection(sensors)
             try:
-                cursor = self.collection.find(mongo_query).sort("_id", -1).limit(limit)
+                cursor = self.collection.find(mongo_query, projection).sort("_id", -1).limit(limit)
                 raw_documents = list(cursor)
             except Exception as sort_error:
                  # Fallback si falla el sort por memoria
-                cursor = self.collection.find(mongo_query).limit(limit)
+                cursor = self.collection.find(mongo_query, projection).limit(limit)
                 raw_documents = list(cursor)
             
-            all_norm_docs = [self._normalize_document(d) for d in raw_documents]
+            all_norm_docs = self._normalize_documents(raw_documents, label="fetch_data")
             
             if not all_norm_docs:
                 return pd.DataFrame()
-                
-            # Ordenar por fecha descendente
-            all_norm_docs.sort(key=lambda x: x["timestamp"] or datetime.min, reverse=True)
             
-            # Convertir a DataFrame historial plano
+            # Convertir a DataFrame historial plano, ordenado por fecha descendente
             df = self._parse_historical_flat(all_norm_docs)
+            if "timestamp" in df.columns:
+                df = df.sort_values("timestamp", ascending=False, kind="stable", na_position="last")
             
             # Filtro de fechas en memoria (Pandas)
             if not df.empty and (start_date or end_date):
@@ -269,6 +472,331 @@ class DatabaseConnection:
             st.warning(f"Error fetching historical data: {str(e)}")
             return pd.DataFrame()
 
+    # --- PAGINACIÓN KEYSET DEL HISTORIAL ---
+    # Los timestamps conviven en tres tipos BSON (Date, string ISO, epoch numérico). Mongo ordena
+    # por tipo antes que por valor (desc: Date > string > número) y sus comparaciones son por tipo,
+    # así que cada tipo es un "tramo" del orden y el cursor (timestamp, _id) avanza dentro de su tramo.
+    HISTORY_PAGE_SORT = [("timestamp", -1), ("_id", -1)]
+
+    def _history_time_branches(self, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
+        """
+        Filtro de rango por tipo de timestamp (Date, string ISO, epoch en s, epoch en ms).
+        Cada tramo por separado ordena por tiempo real; juntos, MongoDB los ordena por tipo
+        BSON (y todo epoch en ms antes que todo epoch en s), por eso se recorren por separado.
+        """
+        start_utc, end_utc = to_utc(start_date), to_utc(end_date)
+        # Strings: pueden traer cualquier offset, se busca con 1 día de margen y se recorta en Python
+        str_start = (start_utc - timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S")
+        str_end = (end_utc + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S")
+        s_start, s_end = int(start_utc.timestamp()), int(end_utc.timestamp()) + 1
+        return [
+            {"timestamp": {"$gte": start_utc, "$lte": end_utc}},
+            {"timestamp": {"$gte": str_start, "$lte": str_end}},
+            {"timestamp": {"$gte": s_start, "$lte": s_end}},
+            {"timestamp": {"$gte": s_start * 1000, "$lte": s_end * 1000}},
+        ]
+
+    @staticmethod
+    def device_filter(device_ids: Optional[List[str]] = None, locations: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Filtro Mongo por dispositivos (device_id o dispositivo_id) y/o ubicaciones (OR entre ambos)."""
+        clauses = []
+        if device_ids:
+            clauses += [{"device_id": {"$in": list(device_ids)}}, {"dispositivo_id": {"$in": list(device_ids)}}]
+        if locations:
+            clauses.append({"location": {"$in": list(locations)}})
+        return {"$or": clauses} if clauses else {}
+
+    @timed_query
+    def fetch_history_page(self, start_date: datetime, end_date: datetime, device_ids: Optional[List[str]] = None,
+                           after: Optional[Dict[str, Any]] = None, page_size: int = 500,
+                           extra_filter: Optional[Dict[str, Any]] = None,
+                           sensors: Optional[Iterable[str]] = None) -> Tuple[pd.DataFrame, Optional[Dict[str, Any]]]:
+        """
+        Una página del historial (más reciente primero) sin materializar el rango completo.
+        Cada tipo de timestamp (_history_time_branches) se lee con su propio cursor keyset
+        sobre (timestamp, _id) y las cabezas se mezclan por hora real.
+        `after` es el cursor devuelto por la página anterior ({"positions": posición por tramo,
+        "offset": registros en páginas anteriores}); devuelve (DataFrame de la página, cursor
+        de la siguiente o None si no hay más).
+        Fechas de entrada en hora local naive, igual que cargar_datos_rango.
+        `sensors` limita los campos de sensores que se traen (todos por defecto).
+        """
+        if self.collection is None: return pd.DataFrame(), None
+
+        try:
+            while True:
+                taken, next_cursor = self._history_page_merge(start_date, end_date, device_ids, after,
+                                                              page_size, extra_filter, sensors)
+                # Una tanda completa fuera de rango (margen del tramo string) no deja filas: seguir
+                if taken or next_cursor is None:
+                    break
+                after = next_cursor
+
+            if not taken:
+                return pd.DataFrame(), next_cursor
+            df = self._parse_historical_flat(taken)
+            return df.sort_values("timestamp", ascending=False, kind="stable"), next_cursor
+
+        except Exception as e:
+            print(f"Error fetching history page: {str(e)}")
+            return pd.DataFrame(), None
+
+    def _history_page_merge(self, start_date: datetime, end_date: datetime, device_ids: Optional[List[str]],
+                            after: Optional[Dict[str, Any]], page_size: int,
+                            extra_filter: Optional[Dict[str, Any]],
+                            sensors: Optional[Iterable[str]]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Mezcla por hora real de los tramos de fetch_history_page: (docs normalizados, cursor siguiente)."""
+        branches = self._history_time_branches(start_date, end_date)
+        # Posición por tramo: None = desde el inicio, {"ts", "id"} = después de esa lectura, False = agotado
+        positions = list((after or {}).get("positions") or [None] * len(branches))
+        filters = [f for f in (self.device_filter(device_ids), extra_filter) if f]
+        projection = self.reading_projection(sensors)
+        start_utc, end_utc = to_utc(start_date), to_utc(end_date)
+
+        buffers: Dict[int, deque] = {}
+        has_more: Dict[int, bool] = {}
+        for i, branch in enumerate(branches):
+            position = positions[i]
+            if position is False:
+                continue
+            clauses = [branch] + filters
+            if position:
+                # Estrictamente después del cursor en orden (timestamp, _id) desc
+                clauses.append({"$or": [
+                    {"timestamp": {"$lt": position["ts"]}},
+                    {"timestamp": position["ts"], "_id": {"$lt": position["id"]}},
+                ]})
+            raw_docs = list(self.collection.find({"$and": clauses}, projection)
+                            .sort(self.HISTORY_PAGE_SORT).limit(page_size))
+            norm_docs = self._normalize_documents(raw_docs, label="history page")
+            buffers[i] = deque(zip(raw_docs, norm_docs))
+            has_more[i] = len(raw_docs) == page_size
+
+        def in_range(norm: Dict[str, Any]) -> bool:
+            # Recorte exacto en UTC (el tramo string se consulta con margen)
+            ts = norm.get("timestamp")
+            return ts is not None and norm.get("device_id") != "unknown" and start_utc <= ts <= end_utc
+
+        def advance(i: int) -> Dict[str, Any]:
+            raw, norm = buffers[i].popleft()
+            positions[i] = {"ts": raw.get("timestamp"), "id": raw.get("_id")}
+            return norm
+
+        taken = []
+        while len(taken) < page_size:
+            heads = {}
+            blocked = False
+            for i, buffer in buffers.items():
+                while buffer and not in_range(buffer[0][1]):
+                    advance(i)
+                if buffer:
+                    heads[i] = buffer[0]
+                elif has_more[i]:
+                    # Este tramo puede tener lecturas más nuevas que las otras cabezas en el servidor
+                    blocked = True
+            if blocked or not heads:
+                break
+            newest = max(heads, key=lambda i: (heads[i][1]["timestamp"], str(heads[i][0].get("_id"))))
+            taken.append(advance(newest))
+
+        for i, buffer in buffers.items():
+            if not buffer and not has_more[i]:
+                positions[i] = False
+        if all(position is False for position in positions):
+            return taken, None
+        return taken, {"positions": positions, "offset": (after or {}).get("offset", 0) + len(taken)}
+
+    @staticmethod
+    def timestamp_as_date(field: str = "$timestamp") -> Dict[str, Any]:
+        """
+        Expresión de agregación que lleva un timestamp crudo (Date, string ISO, epoch en s
+        o ms) a Date, con las mismas reglas que _normalize_document. Sin ella $min/$max/$sort
+        compararían por tipo BSON y los epoch en s contra ms como números.
+        """
+        return {"$switch": {
+            "branches": [
+                {"case": {"$eq": [{"$type": field}, "date"]}, "then": field},
+                {"case": {"$eq": [{"$type": field}, "string"]},
+                 "then": {"$dateFromString": {"dateString": field, "onError": None}}},
+                {"case": {"$gt": [field, 1e11]}, "then": {"$toDate": field}},
+            ],
+            "default": {"$toDate": {"$multiply": [field, 1000]}},
+        }}
+
+    @timed_query
+    def count_history_by_device(self, start_date: datetime, end_date: datetime,
+                                device_ids: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Resumen del rango calculado en el servidor: registros y primer/último timestamp por
+        (device_id, location). Permite mostrar métricas sin traer los documentos.
+        """
+        if self.collection is None: return pd.DataFrame()
+
+        start_utc, end_utc = to_utc(start_date), to_utc(end_date)
+        clauses = [{"$or": self._history_time_branches(start_date, end_date)}]
+        if device_ids:
+            clauses.append(self.device_filter(device_ids))
+
+        pipeline = [
+            {"$match": {"$and": clauses}},
+            # Timestamp unificado a Date para el recorte exacto
+            {"$project": {
+                "device_id": {"$ifNull": ["$device_id", {"$ifNull": ["$dispositivo_id", "$metadata.device_id"]}]},
+                "location": {"$ifNull": ["$location", "Sin Asignar"]},
+                "ts": self.timestamp_as_date(),
+            }},
+            {"$match": {"ts": {"$gte": start_utc, "$lte": end_utc}}},
+            {"$group": {
+                "_id": {"device_id": "$device_id", "location": "$location"},
+                "count": {"$sum": 1},
+                "t_min": {"$min": "$ts"},
+                "t_max": {"$max": "$ts"},
+            }},
+        ]
+
+        try:
+            rows = []
+            for group in self.collection.aggregate(pipeline, allowDiskUse=True):
+                rows.append({
+                    "device_id": group["_id"].get("device_id"),
+                    "location": group["_id"].get("location"),
+                    "count": group["count"],
+                    "t_min": to_local(group["t_min"]),
+                    "t_max": to_local(group["t_max"]),
+                })
+            df = pd.DataFrame(rows, columns=["device_id", "location", "count", "t_min", "t_max"])
+            return df.dropna(subset=["device_id"]).sort_values("count", ascending=False, ignore_index=True)
+        except Exception as e:
+            print(f"Error counting history: {str(e)}")
+            return pd.DataFrame()
+
+    # --- SALUD PRECALCULADA (EVALUADOR EN SEGUNDO PLANO) ---
+    @timed_query
+    def get_precomputed_health(self, max_age_seconds: int = 120) -> Dict[str, Dict[str, Any]]:
+        """
+        Salud por dispositivo escrita por el evaluador: {device_id: {"health", "timestamp", ...}}.
+        Devuelve {} si el evaluador no reportó actividad en los últimos `max_age_seconds`
+        (el dashboard evalúa en vivo como respaldo).
+        """
+        if self.db is None: return {}
+        try:
+            state_coll = self.db[self.ALERTS_STATE_COLLECTION]
+            if not self._evaluator_alive(state_coll, max_age_seconds):
+                return {}
+
+            result = {}
+            for doc in state_coll.find({"_id": {"$ne": self.EVALUATOR_STATE_ID}},
+                                       {"health": 1, "timestamp": 1, "updated_at": 1}):
+                result[str(doc["_id"])] = doc
+            return result
+        except Exception as e:
+            print(f"Error reading precomputed health: {str(e)}")
+            return {}
+
+    def _evaluator_alive(self, state_coll, max_age_seconds: int) -> bool:
+        """True si el evaluador escribió su heartbeat en los últimos `max_age_seconds`."""
+        evaluator = state_coll.find_one({"_id": self.EVALUATOR_STATE_ID}, {"heartbeat_at": 1})
+        heartbeat = (evaluator or {}).get("heartbeat_at")
+        if heartbeat is None:
+            return False
+        if heartbeat.tzinfo is None:
+            heartbeat = heartbeat.replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - heartbeat).total_seconds() <= max_age_seconds
+
+    @timed_query
+    def get_device_status_index(self, max_age_seconds: int = 120) -> pd.DataFrame:
+        """
+        Índice liviano de la flota desde el estado del evaluador, un documento chico por
+        dispositivo: device_id, location, timestamp (última lectura evaluada, hora local) y
+        health. Sirve para filtrar y paginar sin traer lecturas. Vacío si el evaluador no
+        está activo. Solo incluye dispositivos que el evaluador ya vio (al arrancar siembra
+        el estado de los que tienen lecturas; ver scripts/alert_evaluator.py).
+        """
+        if self.db is None: return pd.DataFrame()
+        try:
+            state_coll = self.db[self.ALERTS_STATE_COLLECTION]
+            if not self._evaluator_alive(state_coll, max_age_seconds):
+                return pd.DataFrame()
+            rows = [{
+                "device_id": str(doc["_id"]),
+                "location": doc.get("location") or "Sin Asignar",
+                "timestamp": doc.get("timestamp"),
+                "health": doc.get("health"),
+            } for doc in state_coll.find({"_id": {"$ne": self.EVALUATOR_STATE_ID}},
+                                         {"location": 1, "timestamp": 1, "health": 1})]
+            df = pd.DataFrame(rows, columns=["device_id", "location", "timestamp", "health"])
+            if not df.empty:
+                df["timestamp"] = to_local_series(df["timestamp"])
+            return df
+        except Exception as e:
+            print(f"Error reading device status index: {str(e)}")
+            return pd.DataFrame()
+
+    @timed_query
+    def count_devices_by_status(self, offline_after_seconds: int, max_age_seconds: int = 120) -> Dict[str, int]:
+        """
+        KPIs del dashboard contados en MongoDB sobre el estado del evaluador ({} si no está activo).
+        Mismo criterio que DeviceManager: online si la última lectura tiene menos de
+        `offline_after_seconds`; ok/warning/critical solo cuentan dispositivos online.
+        """
+        if self.db is None: return {}
+        try:
+            state_coll = self.db[self.ALERTS_STATE_COLLECTION]
+            if not self._evaluator_alive(state_coll, max_age_seconds):
+                return {}
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=offline_after_seconds)
+            online = {"$gte": ["$timestamp", cutoff]}
+
+            def online_with(health: str) -> Dict[str, Any]:
+                return {"$sum": {"$cond": [{"$and": [online, {"$eq": ["$health", health]}]}, 1, 0]}}
+
+            pipeline = [
+                {"$match": {"_id": {"$ne": self.EVALUATOR_STATE_ID}}},
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "online": {"$sum": {"$cond": [online, 1, 0]}},
+                    "ok": online_with("ok"),
+                    "warning": online_with("warning"),
+                    "critical": online_with("critical"),
+                }},
+            ]
+            doc = next(iter(state_coll.aggregate(pipeline)), None) or {}
+            counts = {key: int(doc.get(key, 0)) for key in ("total", "online", "ok", "warning", "critical")}
+            counts["offline"] = counts["total"] - counts["online"]
+            return counts
+        except Exception as e:
+            print(f"Error counting devices by status: {str(e)}")
+            return {}
+
+    # --- CATÁLOGO DE SENSORES ---
+    @staticmethod
+    def _as_utc(value: datetime) -> datetime:
+        # Fechas guardadas por la app: UTC (naive solo si el cliente no es tz_aware)
+        return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+    @timed_query
+    def get_sensor_catalog(self, active_since: Optional[datetime] = None) -> Dict[str, List[str]]:
+        """
+        {device_id: [sensores]} del catálogo persistente ({} si no existe).
+        Con `active_since` (UTC) solo dispositivos y sensores con lecturas desde ese momento.
+        """
+        if self.db is None: return {}
+        try:
+            query = {"last_seen": {"$gte": active_since}} if active_since else {}
+            result = {}
+            for doc in self.db[self.SENSOR_CATALOG_COLLECTION].find(query, {"sensors": 1}):
+                sensors = doc.get("sensors") or {}
+                if active_since:
+                    sensors = {name: info for name, info in sensors.items()
+                               if not isinstance(info, dict) or info.get("last_seen") is None
+                               or self._as_utc(info["last_seen"]) >= active_since}
+                result[str(doc["_id"])] = sorted(sensors.keys())
+            return result
+        except Exception as e:
+            print(f"Error reading sensor catalog: {str(e)}")
+            return {}
+
     # --- MÉTODOS DE CONFIGURACIÓN ---
     
     def _get_config_collection(self):
@@ -276,6 +804,7 @@ class DatabaseConnection:
              return self.db[self.CONFIG_COLLECTION]
         return None
 
+    @timed_query
     def get_config(self, config_id: str = "sensor_thresholds") -> Optional[Dict[str, Any]]:
         coll = self._get_config_collection()
         if coll is None: return None
@@ -296,8 +825,21 @@ class DatabaseConnection:
             st.error(f"Error al guardar config: {str(e)}")
             return False
 
+    def update_config_fields(self, config_id: str, fields: Dict[str, Any]) -> bool:
+        """Actualiza solo los campos dados de una config con $set (dot notation), sin reescribir el documento."""
+        coll = self._get_config_collection()
+        if coll is None: return False
+        try:
+            update = dict(fields, last_updated=datetime.now().isoformat())
+            result = coll.update_one({"_id": config_id}, {"$set": update}, upsert=True)
+            return result.acknowledged
+        except Exception as e:
+            st.error(f"Error al actualizar config: {str(e)}")
+            return False
+
     # --- MÉTODOS DE METADATOS DE DISPOSITIVOS ---
     
+    @timed_query
     def get_device_metadata(self, device_id: str) -> Optional[Dict[str, Any]]:
         """Obtiene el documento de metadatos de un dispositivo específico."""
         if self.devices_collection is None:
@@ -308,6 +850,7 @@ class DatabaseConnection:
             print(f"Error al obtener metadata del dispositivo {device_id}: {e}")
             return None
     
+    @timed_query
     def get_all_devices_metadata(self) -> Dict[str, Dict[str, Any]]:
         """Obtiene todos los documentos de dispositivos como un diccionario."""
         if self.devices_collection is None:
@@ -382,7 +925,7 @@ class DatabaseConnection:
             
         df = pd.DataFrame(processed)
         if "timestamp" in df.columns and not df.empty:
-             df["timestamp"] = pd.to_datetime(df["timestamp"], errors='coerce')
+             df["timestamp"] = to_local_series(df["timestamp"])
         return df
 
     def _parse_historical_flat(self, norm_docs: List[Dict[str, Any]]) -> pd.DataFrame:
@@ -408,7 +951,8 @@ class DatabaseConnection:
         df = pd.DataFrame(flat_data)
         
         if "timestamp" in df.columns:
-            df["timestamp"] = pd.to_datetime(df["timestamp"], errors='coerce')
+            # UTC -> hora local, una sola vez para toda la columna
+            df["timestamp"] = to_local_series(df["timestamp"])
             
         # Asegurar tipos numéricos para columnas de sensores
         cols = df.columns.drop(['timestamp', 'device_id', 'location'], errors='ignore')
@@ -2,8 +2,11 @@ import pandas as pd
 import numpy as np
 from enum import Enum
 from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timezone, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timezone
+
+from modules.local_time import now_utc, to_utc
+from modules.sensor_aliases import canonical_sensor, canonicalize_keys
 
 # --- ENUMS ---
 class ConnectionStatus(Enum):
@@ -27,19 +30,58 @@ class DeviceInfo:
     sensor_data: Dict[str, float] = field(default_factory=dict)
     alerts: List[str] = field(default_factory=list)
 
+# Orden de severidad (para evaluación vectorizada y transiciones)
+HEALTH_SEVERITY = {HealthStatus.OK: 0, HealthStatus.WARNING: 1, HealthStatus.CRITICAL: 2}
+SEVERITY_HEALTH = {v: k for k, v in HEALTH_SEVERITY.items()}
+
+
+def resolve_limits(config: Dict[str, Any]) -> Tuple[float, float, float, float]:
+    """
+    Traduce una configuración de umbrales a (crit_min, crit_max, warn_min, warn_max):
+    crítico si v < crit_min o v > crit_max; alerta si v < warn_min o v > warn_max.
+    """
+    # Mapping robusto: Prioriza valores personalizados sobre defaults
+    # Personalizados: min_value, max_value, critical_min, critical_max
+    # Defaults JSON: min, max, optimal_min, optimal_max
+    
+    # Obtener rango seguro (óptimo)
+    o_min = float(config.get("min_value", config.get("optimal_min", config.get("min", -9999)))) 
+    o_max = float(config.get("max_value", config.get("optimal_max", config.get("max", 9999))))
+    
+    if "critical_min" in config or "critical_max" in config:
+        # Usar valores explícitos si están definidos (alerta = zona entre crítico y óptimo)
+        c_min = float(config.get("critical_min", config.get("min", -9999)))
+        c_max = float(config.get("critical_max", config.get("max", 9999)))
+        return c_min, c_max, o_min, o_max
+    
+    # Cálculo automático de zonas basado en 20% del rango
+    # Ejemplo: rango 0-10 → alerta <2 o >8, crítico <0 o >10
+    alert_margin = (o_max - o_min) * 0.20
+    return o_min, o_max, o_min + alert_margin, o_max - alert_margin
+
+
 # --- CLASE PRINCIPAL ---
 class DeviceManager:
     
     OFFLINE_TIMEOUT_SECONDS = 60 # Tiempo de tolerancia para Offline
     
-    def __init__(self, global_thresholds: Dict[str, Any], previous_health: Dict[str, HealthStatus] = None, device_specific_thresholds: Dict[str, Dict[str, Any]] = None):
+    def __init__(self, global_thresholds: Dict[str, Any], previous_health: Dict[str, HealthStatus] = None, device_specific_thresholds: Dict[str, Dict[str, Any]] = None,
+                 precomputed_health: Dict[str, Dict[str, Any]] = None):
         """
         global_thresholds: Configuración base para todos los sensores.
         device_specific_thresholds: {device_id: {sensor_name: config}}
+        precomputed_health: {device_id: {"health": "ok", "timestamp": ...}} del evaluador en segundo plano
         """
         self.global_thresholds = global_thresholds
         self.device_specific_thresholds = device_specific_thresholds or {}
         self._previous_health: Dict[str, HealthStatus] = previous_health or {}
+        self.precomputed_health = precomputed_health or {}
+        # Normalizar keys a nombre canónico una sola vez (mismo catálogo que los datos)
+        self._global_lower = canonicalize_keys(self.global_thresholds)
+        self._device_lower = {
+            dev: canonicalize_keys(cfg or {})
+            for dev, cfg in self.device_specific_thresholds.items()
+        }
     
     def get_health_states(self) -> Dict[str, HealthStatus]:
         return self._previous_health
@@ -50,6 +92,36 @@ class DeviceManager:
         records = df.to_dict('records')
         return [self._process_single_record(row) for row in records]
     
+    def get_status_infos(self, index_df: pd.DataFrame) -> List[DeviceInfo]:
+        """
+        DeviceInfo livianos (sin sensores ni alertas) desde el índice de estado del evaluador
+        (DatabaseConnection.get_device_status_index): conexión según el timestamp y salud
+        precalculada. Alcanzan para filtrar, ordenar y paginar la flota.
+        """
+        if index_df is None or index_df.empty:
+            return []
+        infos = []
+        for row in index_df.to_dict('records'):
+            ts = row.get("timestamp")
+            timestamp = None
+            if not pd.isna(ts):
+                timestamp = ts.to_pydatetime() if isinstance(ts, pd.Timestamp) else ts
+            connection = self._evaluate_connection(timestamp)
+            health = HealthStatus.UNKNOWN
+            if connection == ConnectionStatus.ONLINE:
+                try:
+                    health = HealthStatus(row.get("health"))
+                except ValueError:
+                    pass
+            infos.append(DeviceInfo(
+                device_id=str(row.get("device_id")),
+                location=str(row.get("location") or "Sin ubicacion"),
+                last_update=timestamp,
+                connection=connection,
+                health=health,
+            ))
+        return infos
+
     def _process_single_record(self, row: Dict) -> DeviceInfo:
         device_id = str(row.get("device_id", "Unknown"))
         location = str(row.get("location", "Sin ubicacion"))
@@ -74,7 +146,9 @@ class DeviceManager:
         connection = self._evaluate_connection(timestamp)
         
         if connection == ConnectionStatus.ONLINE:
-            health = self._evaluate_health(device_id, sensor_values, alerts)
+            health = self._precomputed_for(device_id, timestamp)
+            if health is None:
+                health = self._evaluate_health(device_id, sensor_values, alerts)
         else:
             health = HealthStatus.UNKNOWN # O mantener previous si queremos "memoria"
             # Para dashboard en tiempo real, si esta offline, el health es irrelevante o unknown
@@ -105,19 +179,40 @@ class DeviceManager:
     def _evaluate_connection(self, timestamp: Optional[datetime]) -> ConnectionStatus:
         if timestamp is None: return ConnectionStatus.OFFLINE
         
-        # Zona horaria de Chile (UTC-3)
-        chile_tz = timezone(timedelta(hours=-3))
-        
-        # Obtener hora actual en Chile (naive para comparar con timestamp normalizado)
-        now_chile = datetime.now(chile_tz).replace(tzinfo=None)
-        ts_clean = timestamp.replace(tzinfo=None) if timestamp.tzinfo else timestamp
-        
-        diff_seconds = abs((now_chile - ts_clean).total_seconds())
+        # El timestamp del DataFrame está en hora local naive: comparar en UTC
+        # (una resta entre horas locales fallaría en el cambio de horario)
+        diff_seconds = abs((now_utc() - to_utc(timestamp)).total_seconds())
         
         if diff_seconds > self.OFFLINE_TIMEOUT_SECONDS:
             return ConnectionStatus.OFFLINE
         return ConnectionStatus.ONLINE
 
+    def _precomputed_for(self, device_id: str, timestamp: Optional[datetime]) -> Optional[HealthStatus]:
+        """Salud calculada por el evaluador, solo si corresponde a esta lectura o a una más nueva."""
+        entry = self.precomputed_health.get(device_id)
+        if not entry or timestamp is None:
+            return None
+        evaluated_ts = entry.get("timestamp")
+        if evaluated_ts is None:
+            return None
+        # El evaluador guarda UTC (naive si el cliente no es tz_aware); la lectura viene en hora local
+        if evaluated_ts.tzinfo is None:
+            evaluated_ts = evaluated_ts.replace(tzinfo=timezone.utc)
+        if evaluated_ts < to_utc(timestamp):
+            return None
+        try:
+            health = HealthStatus(entry.get("health"))
+        except ValueError:
+            return None
+        self._previous_health[device_id] = health
+        return health
+
+    def threshold_config(self, device_id: str, sensor: str) -> Optional[Dict[str, Any]]:
+        """Config de umbrales para un sensor: Específica del dispositivo > Global."""
+        sensor_key = canonical_sensor(sensor)
+        # Buscar config: Específica > Global (ambas con nombre canónico)
+        return self._device_lower.get(device_id, {}).get(sensor_key, self._global_lower.get(sensor_key))
+
     def _evaluate_health(self, device_id: str, sensors: Dict[str, float], alerts: List[str]) -> HealthStatus:
         # 1. Alertas explicitas del dispositivo
         if alerts:
@@ -126,86 +221,21 @@ class DeviceManager:
             
         new_health = HealthStatus.OK
         
-        # Mapeo de nombres de sensores (inglés <-> español)
-        sensor_name_map = {
-            'temperature': 'temperatura',
-            'temp': 'temperatura',
-            'ph': 'ph',
-            'dissolved_oxygen': 'do',
-            'do': 'do',
-            'orp': 'orp',
-            'ec': 'ec',
-            'turbidity': 'turbidez',
-            'turbidez': 'turbidez'
-        }
-        
-        # Obtener Thresholds Específicos de este dispositivo (normalizar keys a lowercase)
-        raw_dev_thresholds = self.device_specific_thresholds.get(device_id, {})
-        dev_thresholds = {k.lower(): v for k, v in raw_dev_thresholds.items()}
-        
-        # Normalizar global thresholds también
-        global_lower = {k.lower(): v for k, v in self.global_thresholds.items()}
-        
         for sensor, value in sensors.items():
-            sensor_key = sensor.lower()
-            
-            # Normalizar nombre del sensor para buscar en umbrales
-            normalized_key = sensor_name_map.get(sensor_key, sensor_key)
-            
-            # Buscar config: Específica > Global (usando nombre normalizado)
-            config = dev_thresholds.get(normalized_key, global_lower.get(sensor_key))
+            config = self.threshold_config(device_id, sensor)
             
             if not config: continue
             
             # Interpretar Configuración de Umbrales
+            c_min, c_max, w_min, w_max = resolve_limits(config)
             
-            # Mapping robusto: Prioriza valores personalizados sobre defaults
-            # Personalizados: min_value, max_value, critical_min, critical_max
-            # Defaults JSON: min, max, optimal_min, optimal_max
-            
-            # Obtener rango seguro (óptimo)
-            o_min = float(config.get("min_value", config.get("optimal_min", config.get("min", -9999)))) 
-            o_max = float(config.get("max_value", config.get("optimal_max", config.get("max", 9999))))
-            
-            # Calcular umbrales críticos y de alerta automáticamente si no están definidos
-            # Si solo tienen min_value y max_value, calculamos:
-            # - Zona de alerta: 20% del rango desde los límites
-            # - Zona crítica: fuera del rango seguro
-            
-            has_explicit_critical = "critical_min" in config or "critical_max" in config
-            
-            if has_explicit_critical:
-                # Usar valores explícitos si están definidos
-                c_min = float(config.get("critical_min", config.get("min", -9999)))
-                c_max = float(config.get("critical_max", config.get("max", 9999)))
-                
-                # Evaluación con zonas explícitas
-                state = HealthStatus.OK
-                
-                # Critico
-                if value < c_min or value > c_max:
-                    state = HealthStatus.CRITICAL
-                # Warning (Zona entre Crítico y Óptimo)
-                elif value < o_min or value > o_max:
-                    state = HealthStatus.WARNING
-            else:
-                # Cálculo automático de zonas basado en 20% del rango
-                range_size = o_max - o_min
-                alert_margin = range_size * 0.20  # 20% del rango
-                
-                # Zona de alerta: cuando el valor se acerca al 20% del límite
-                # Ejemplo: rango 0-10 → alerta <2 o >8, crítico <0 o >10
-                alert_min = o_min + alert_margin
-                alert_max = o_max - alert_margin
-                
-                state = HealthStatus.OK
-                
-                # Crítico: fuera del rango seguro
-                if value < o_min or value > o_max:
-                    state = HealthStatus.CRITICAL
-                # Alerta: dentro del rango pero en la zona de 20%
-                elif value < alert_min or value > alert_max:
-                    state = HealthStatus.WARNING
+            state = HealthStatus.OK
+            # Crítico: fuera del rango crítico (o del seguro si no hay críticos explícitos)
+            if value < c_min or value > c_max:
+                state = HealthStatus.CRITICAL
+            # Alerta: zona entre crítico y óptimo (o el 20% cercano a los límites)
+            elif value < w_min or value > w_max:
+                state = HealthStatus.WARNING
             
             # Prioridad de Estados: Critical > Warning > OK
             if state == HealthStatus.CRITICAL:
@@ -0,0 +1,149 @@
+"""
+Índice en memoria del historial particionado por dispositivo.
+
+El historial cacheado se ordena UNA vez por (device_id, timestamp) y se guarda
+como una tabla Arrow inmutable. Cada dispositivo queda como un bloque contiguo
+de filas con su arreglo de timestamps ordenado, de modo que "los últimos `delta`
+de cada dispositivo" se resuelve con un searchsorted por dispositivo y un
+slice de la tabla (sin copia). Solo la ventana visible se convierte a pandas.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+NON_SENSOR_COLUMNS = {"timestamp", "device_id", "location", "id", "_id", "lat", "lon", "device_name"}
+
+
+class DeviceTimeStore:
+
+    def __init__(self, df: pd.DataFrame):
+        self._bounds: Dict[str, Tuple[int, int]] = {}
+        self._params_by_device: Dict[str, frozenset] = {}
+        self.sensor_columns: List[str] = []
+        self._ts = np.empty(0, dtype=np.int64)
+        self._version: Optional[str] = None
+
+        if df is None or df.empty or "device_id" not in df.columns or "timestamp" not in df.columns:
+            self.table = pa.Table.from_pandas(df if df is not None else pd.DataFrame(), preserve_index=False)
+            return
+
+        frame = df[df["device_id"].notna() & df["timestamp"].notna()]
+        frame = frame.sort_values(["device_id", "timestamp"], kind="stable").reset_index(drop=True)
+
+        # Límites [inicio, fin) de cada bloque de dispositivo
+        codes, uniques = pd.factorize(frame["device_id"], sort=False)
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], len(frame)]
+        self._bounds = {str(uniques[codes[s]]): (int(s), int(e)) for s, e in zip(starts, ends)}
+
+        # Qué sensores tienen al menos un dato por dispositivo (para los selectores)
+        numeric_cols = frame.select_dtypes(include=["number"]).columns
+        self.sensor_columns = [c for c in numeric_cols if c not in NON_SENSOR_COLUMNS]
+        has_data = frame[self.sensor_columns].notna().groupby(codes).any()
+        self._params_by_device = {
+            str(uniques[code]): frozenset(col for col in self.sensor_columns if row[col])
+            for code, row in has_data.iterrows()
+        }
+
+        # Tabla Arrow inmutable: única copia que queda en el caché
+        ts_col = frame["timestamp"]
+        if getattr(ts_col.dt, "tz", None) is not None:
+            ts_col = ts_col.dt.tz_localize(None)
+        frame["timestamp"] = ts_col.astype("datetime64[ns]")
+        self.table = pa.Table.from_pandas(frame, preserve_index=False)
+
+        # Timestamps como int64 (ns) de solo lectura: base de todos los searchsorted
+        ts = frame["timestamp"].values.view(np.int64).copy()
+        ts.flags.writeable = False
+        self._ts = ts
+
+    @classmethod
+    def from_table(cls, table: pa.Table) -> "DeviceTimeStore":
+        """Reconstruye el índice desde .table (p.ej. leída del caché compartido entre réplicas)."""
+        return cls(table.to_pandas())
+
+    @property
+    def empty(self) -> bool:
+        return self.table.num_rows == 0
+
+    @property
+    def num_rows(self) -> int:
+        return self.table.num_rows
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria de la tabla + índice (para el límite del caché de frames)."""
+        return int(self.table.nbytes + self._ts.nbytes)
+
+    @property
+    def version(self) -> str:
+        """
+        Huella del contenido (filas, último timestamp, sensores). Cambia cuando el store
+        se recarga con datos nuevos; sirve de versión para cachés derivados (figuras).
+        """
+        if self._version is None:
+            _, last = self.time_bounds()
+            raw = f"{self.num_rows}|{last.value if last is not None else 0}|{','.join(self.sensor_columns)}"
+            self._version = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+        return self._version
+
+    @property
+    def devices(self) -> List[str]:
+        return sorted(self._bounds.keys())
+
+    def time_bounds(self) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        if self.empty or not self._ts.size:
+            return None, None
+        # Cada bloque está ordenado: el mínimo/máximo global está en los extremos de algún bloque
+        firsts = self._ts[[s for s, _ in self._bounds.values()]]
+        lasts = self._ts[[e - 1 for _, e in self._bounds.values()]]
+        return pd.Timestamp(int(firsts.min())), pd.Timestamp(int(lasts.max()))
+
+    def params_with_data(self, devices: Optional[List[str]] = None) -> List[str]:
+        """Sensores con datos para los dispositivos dados (todos si devices es vacío)."""
+        if not devices:
+            return list(self.sensor_columns)
+        found = set()
+        for dev in devices:
+            found |= self._params_by_device.get(dev, frozenset())
+        return [c for c in self.sensor_columns if c in found]
+
+    def _window_bounds(self, device_id: str, delta: Optional[timedelta]) -> Optional[Tuple[int, int]]:
+        bounds = self._bounds.get(device_id)
+        if bounds is None:
+            return None
+        start, end = bounds
+        if delta is None or end <= start:
+            return start, end
+        # t_min = t_max - delta, buscado solo dentro del bloque del dispositivo
+        t_min = self._ts[end - 1] - pd.Timedelta(delta).value
+        start = start + int(np.searchsorted(self._ts[start:end], t_min, side="left"))
+        return start, end
+
+    def window_tables(self, devices: List[str], delta: Optional[timedelta]) -> Dict[str, pa.Table]:
+        """Últimos `delta` de cada dispositivo como slices de la tabla Arrow (sin copiar)."""
+        result = {}
+        for dev in devices:
+            bounds = self._window_bounds(dev, delta)
+            if bounds and bounds[1] > bounds[0]:
+                result[dev] = self.table.slice(bounds[0], bounds[1] - bounds[0])
+        return result
+
+    def window_table(self, devices: List[str], delta: Optional[timedelta]) -> pa.Table:
+        """Ventana de varios dispositivos en una tabla (concatenación de slices, sin copiar)."""
+        tables = list(self.window_tables(devices, delta).values())
+        if not tables:
+            return self.table.slice(0, 0)
+        return tables[0] if len(tables) == 1 else pa.concat_tables(tables)
+
+    def window(self, devices: List[str], delta: Optional[timedelta]) -> Dict[str, pd.DataFrame]:
+        """Igual que window_tables(), convertido a pandas por dispositivo."""
+        return {dev: table.to_pandas() for dev, table in self.window_tables(devices, delta).items()}
+
+    def window_frame(self, devices: List[str], delta: Optional[timedelta]) -> pd.DataFrame:
+        """Ventana visible como DataFrame: solo estas filas se materializan en pandas."""
+        return self.window_table(devices, delta).to_pandas()
@@ -0,0 +1,311 @@
+"""
+Caché de frames compartido por todo el proceso, con límite de memoria.
+
+st.cache_data guarda una entrada por combinación de argumentos sin tope de
+tamaño y entrega una copia por cada hit; además cada sesión guardaba su propio
+DataFrame en session_state. Con varios usuarios conectados la memoria crecía
+sin control. Aquí:
+    - Una sola copia por consulta, compartida entre sesiones (los valores son
+      de solo lectura: quien necesite modificarlos debe copiar).
+    - Cada entrada registra su tamaño real (memory_usage(deep=True)).
+    - Al superar FRAME_CACHE_MAX_BYTES se desalojan las entradas usadas hace más tiempo (LRU).
+    - Las sesiones guardan solo la clave (handle) y piden el frame con get().
+Con `cached_frame(..., shared=True)` los resultados además se guardan en el caché
+compartido entre réplicas (modules/cache_backend.py) como segundo nivel.
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from modules.cache_backend import cache_key, get_cache_backend, table_from_bytes, table_to_bytes
+from modules.metrics import record_cache_request
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Mientras otra réplica carga la misma clave: cuánto esperar su resultado antes de cargar por cuenta propia
+SHARED_LOAD_LEASE_SECONDS = 120
+SHARED_LOAD_WAIT_SECONDS = 60
+
+
+def estimate_nbytes(value: Any) -> int:
+    """Tamaño en memoria de un valor cacheado (DataFrame, objetos con .nbytes, bytes/str)."""
+    if value is None:
+        return 0
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, (int, float)):
+        return int(nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+def _freeze(value: Any) -> Hashable:
+    """Argumentos a clave hashable (listas/sets/dicts -> tuplas)."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted((_freeze(v) for v in value), key=repr))
+    if isinstance(value, dict):
+        return tuple(sorted(((k, _freeze(v)) for k, v in value.items()), key=repr))
+    return value
+
+
+class FrameCache:
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Valor cacheado o None si no existe / expiró / fue desalojado."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry["expires_at"] is not None and entry["expires_at"] < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["value"]
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None, nbytes: Optional[int] = None) -> Hashable:
+        """Guarda el valor y devuelve su clave (el handle que guardan las sesiones)."""
+        size = estimate_nbytes(value) if nbytes is None else nbytes
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                print(f"[frame_cache] {key!r} ocupa {size / 1e6:.1f} MB, más que el límite "
+                      f"({self.max_bytes / 1e6:.0f} MB): no se guarda")
+                return key
+            self._entries[key] = {
+                "value": value,
+                "nbytes": size,
+                "expires_at": time.monotonic() + ttl if ttl else None,
+            }
+            self.total_bytes += size
+            self._evict()
+        return key
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None,
+                    keep: Optional[Callable[[Any], bool]] = None, record_miss: bool = True) -> Any:
+        """
+        get() y, si falta, carga una sola vez aunque varias sesiones pidan la misma clave a la vez.
+        `keep(value)` decide si el resultado se guarda (p.ej. no guardar frames vacíos).
+        Con record_miss=False el loader registra él mismo si fue miss (p.ej. _load_shared,
+        que puede resolver con el caché entre réplicas sin ir a MongoDB).
+        """
+        namespace = key[0] if isinstance(key, tuple) and key else "default"
+        value = self.get(key)
+        if value is not None:
+            record_cache_request(namespace, "hit")
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                # Otra sesión pudo cargarlo mientras esperábamos
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None and (entry["expires_at"] is None or entry["expires_at"] >= time.monotonic()):
+                        self._entries.move_to_end(key)
+                        record_cache_request(namespace, "hit")
+                        return entry["value"]
+                if record_miss:
+                    record_cache_request(namespace, "miss")
+                value = loader()
+                if keep is None or keep(value):
+                    self.put(key, value, ttl=ttl)
+        finally:
+            # También si el loader falla: si no, el lock de cada clave fallida quedaría para siempre
+            with self._lock:
+                self._key_locks.pop(key, None)
+        return value
+
+    def clear(self, namespace: Optional[Hashable] = None):
+        """Vacía el caché completo o solo las claves (namespace, ...) de un namespace."""
+        with self._lock:
+            keys = [k for k in self._entries
+                    if namespace is None or (isinstance(k, tuple) and k and k[0] == namespace)]
+            for key in keys:
+                self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry["nbytes"]
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry["nbytes"]
+            self.evictions += 1
+            print(f"[frame_cache] Desalojado {key!r} ({entry['nbytes'] / 1e6:.1f} MB); "
+                  f"en uso {self.total_bytes / 1e6:.1f}/{self.max_bytes / 1e6:.0f} MB")
+
+
+@st.cache_resource(show_spinner=False)
+def get_frame_cache() -> FrameCache:
+    """Instancia única por proceso (compartida por todas las sesiones)."""
+    max_bytes = int(os.getenv("FRAME_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+    print(f"[frame_cache] Límite de memoria: {max_bytes / 1e6:.0f} MB")
+    return FrameCache(max_bytes)
+
+
+def _has_data(value: Any) -> bool:
+    if value is None or getattr(value, "empty", False):
+        return False
+    return getattr(value, "num_rows", 1) > 0
+
+
+def _to_table(value: Any) -> Optional[pa.Table]:
+    """Tabla Arrow a guardar en el caché compartido (tablas, DataFrames u objetos con .table)."""
+    if isinstance(value, pa.Table):
+        return value
+    if isinstance(value, pd.DataFrame):
+        return pa.Table.from_pandas(value, preserve_index=False)
+    table = getattr(value, "table", None)
+    return table if isinstance(table, pa.Table) else None
+
+
+def _load_shared(key: Hashable, loader: Callable[[], Any], ttl: Optional[float],
+                 decode: Optional[Callable[[pa.Table], Any]]) -> Any:
+    """
+    Carga pasando por el caché compartido entre réplicas: si otra réplica ya guardó
+    la clave se usa esa copia; si la está cargando, se espera su resultado.
+    Cualquier error del backend degrada a cargar desde MongoDB.
+    """
+    backend = get_cache_backend()
+    shared_key = cache_key(key[0], key[1:])
+
+    def fetch() -> Optional[Any]:
+        try:
+            data = backend.get(shared_key)
+            if data is None:
+                return None
+            table = table_from_bytes(data)
+            return decode(table) if decode else table
+        except Exception as e:
+            print(f"[frame_cache] Error leyendo {shared_key} del caché compartido: {e}")
+            return None
+
+    value = fetch()
+    if value is not None:
+        record_cache_request(key[0], "shared_hit")
+        return value
+
+    def acquire() -> bool:
+        try:
+            return backend.acquire_lease(shared_key, SHARED_LOAD_LEASE_SECONDS)
+        except Exception as e:
+            print(f"[frame_cache] Error tomando lease de {shared_key}: {e}")
+            return True
+
+    owner = acquire()
+    if not owner:
+        deadline = time.monotonic() + SHARED_LOAD_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(0.5)
+            value = fetch()
+            if value is not None:
+                record_cache_request(key[0], "shared_hit")
+                return value
+            # Lease liberado sin resultado (la carga falló o vino vacía): no seguir esperando
+            owner = acquire()
+            if owner:
+                break
+        else:
+            print(f"[frame_cache] {shared_key}: otra réplica no terminó a tiempo, cargando localmente")
+        if owner:
+            # Pudo guardarse justo antes de liberar el lease
+            value = fetch()
+            if value is not None:
+                try:
+                    backend.release_lease(shared_key)
+                except Exception:
+                    pass
+                record_cache_request(key[0], "shared_hit")
+                return value
+
+    try:
+        # Recién aquí se consulta MongoDB: es el único miss real
+        record_cache_request(key[0], "miss")
+        value = loader()
+        table = _to_table(value) if _has_data(value) else None
+        if table is not None:
+            try:
+                backend.set(shared_key, table_to_bytes(table), ttl=ttl)
+            except Exception as e:
+                print(f"[frame_cache] Error guardando {shared_key} en el caché compartido: {e}")
+        return value
+    finally:
+        if owner:
+            try:
+                backend.release_lease(shared_key)
+            except Exception:
+                pass
+
+
+def cached_frame(namespace: str, ttl: Optional[float] = None, shared: bool = False,
+                 decode: Optional[Callable[[pa.Table], Any]] = None):
+    """
+    Decorador equivalente a st.cache_data pero sobre el FrameCache compartido:
+    la clave es (namespace, *args, **kwargs) y el resultado NO se copia por llamada.
+    Los resultados vacíos no se guardan (un fallo transitorio no queda cacheado).
+    Con shared=True, en un fallo del caché del proceso se consulta el caché entre réplicas
+    (el resultado viaja como tabla Arrow; `decode(table)` reconstruye el valor original).
+    La función decorada expone .clear() y .key(*args, **kwargs) como handle.
+    """
+    def decorator(func: Callable[..., Any]):
+        def make_key(*args, **kwargs) -> Hashable:
+            return (namespace, _freeze(args), _freeze(kwargs))
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(*args, **kwargs)
+            if shared:
+                loader = lambda: _load_shared(key, lambda: func(*args, **kwargs), ttl, decode)
+            else:
+                loader = lambda: func(*args, **kwargs)
+            return get_frame_cache().get_or_load(key, loader, ttl=ttl, keep=_has_data, record_miss=not shared)
+
+        def clear():
+            get_frame_cache().clear(namespace)
+            if shared:
+                get_cache_backend().clear(namespace)
+
+        wrapper.clear = clear
+        wrapper.key = make_key
+        return wrapper
+    return decorator
@@ -0,0 +1,104 @@
+"""
+Compactación de memoria para los DataFrames de historial cacheados.
+
+Los loaders de gráficas e historial devuelven frames que se quedan en caché y se
+copian en cada hit; con varias sesiones abiertas el tamaño de esos frames decide
+si el contenedor sobrevive. Aquí se reducen sin perder información:
+    - device_id / location -> category
+    - sensores float64 -> float32 solo si la conversión es exacta para los decimales guardados
+    - timestamp -> datetime64[ns] (8 bytes, nunca objetos Python)
+"""
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_COLUMNS = ("device_id", "location")
+NON_SENSOR_COLUMNS = {"timestamp", "device_id", "location", "device_name", "_id", "alerts"}
+
+# Máximo de decimales que se consideran "datos de sensor" (el firmware redondea a 2)
+MAX_SENSOR_DECIMALS = 4
+# Con |x| * 10^d < 2^23 el paso de float32 es menor que medio decimal: ida y vuelta exacta
+FLOAT32_EXACT_LIMIT = 2 ** 23
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    """Memoria real del frame (incluye strings y categorías)."""
+    if df is None:
+        return 0
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def _fits_float32(values: np.ndarray) -> bool:
+    """True si todos los valores se recuperan exactos desde float32 (redondeando a sus decimales)."""
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return True
+
+    max_abs = float(np.abs(finite).max())
+    for decimals in range(MAX_SENSOR_DECIMALS + 1):
+        if np.array_equal(np.round(finite, decimals), finite):
+            return max_abs * (10 ** decimals) < FLOAT32_EXACT_LIMIT
+    return False
+
+
+def compact_history_frame(df: pd.DataFrame, label: str = "historial") -> pd.DataFrame:
+    """Convierte el frame a dtypes compactos y reporta los bytes ahorrados.
+
+    El resumen queda en df.attrs["compaction"] para quien quiera mostrarlo.
+    """
+    if df is None or df.empty:
+        return df
+
+    before = frame_nbytes(df)
+    df = df.copy()
+
+    if "timestamp" in df.columns:
+        ts = pd.to_datetime(df["timestamp"], errors="coerce")
+        if ts.dt.tz is None:
+            ts = ts.astype("datetime64[ns]")
+        df["timestamp"] = ts
+
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+
+    downcast = []
+    for col in df.columns:
+        if col in NON_SENSOR_COLUMNS or df[col].dtype != np.float64:
+            continue
+        if _fits_float32(df[col].to_numpy()):
+            df[col] = df[col].astype(np.float32)
+            downcast.append(col)
+
+    after = frame_nbytes(df)
+    saved = before - after
+    df.attrs["compaction"] = {
+        "bytes_before": before,
+        "bytes_after": after,
+        "bytes_saved": saved,
+        "float32_columns": downcast,
+    }
+
+    pct = (saved / before * 100) if before else 0.0
+    print(f"[frame_compaction] {label}: {len(df):,} filas, {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB "
+          f"(ahorro {saved / 1e6:.1f} MB, {pct:.0f}%; float32: {len(downcast)} columnas)")
+    return df
+
+
+def expand_for_export(df: pd.DataFrame) -> pd.DataFrame:
+    """Revierte float32 -> float64 con el valor decimal original (para CSV/Excel).
+
+    openpyxl escribiría 7.519999980926514 en lugar de 7.52; pasar por la
+    representación corta de float32 recupera exactamente el decimal guardado.
+    """
+    if df is None or df.empty:
+        return df
+
+    float32_cols = [c for c in df.columns if df[c].dtype == np.float32]
+    if not float32_cols:
+        return df
+
+    df = df.copy()
+    for col in float32_cols:
+        df[col] = pd.to_numeric(df[col].astype(str), errors="coerce")
+    return df
+
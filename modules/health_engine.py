@@ -0,0 +1,95 @@
+"""
+Evaluación de salud vectorizada para lotes de lecturas.
+
+Aplica exactamente las mismas reglas que DeviceManager._evaluate_health
+(umbrales específicos del dispositivo > globales, zonas vía resolve_limits,
+alertas explícitas = crítico), pero sobre columnas NumPy en lugar de fila por
+fila. Lo usa el evaluador en segundo plano (scripts/alert_evaluator.py) para
+procesar miles de lecturas por segundo.
+
+Severidad: 0 = OK, 1 = WARNING, 2 = CRITICAL (ver HEALTH_SEVERITY).
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+from modules.device_manager import DeviceManager, HealthStatus, HEALTH_SEVERITY, SEVERITY_HEALTH, resolve_limits
+
+NON_SENSOR_COLUMNS = {"timestamp", "device_id", "location", "alerts", "_source_id", "_id"}
+
+
+def evaluate_severity(df: pd.DataFrame, manager: DeviceManager) -> np.ndarray:
+    """Severidad de cada fila de un frame plano (device_id, timestamp, una columna por sensor, alerts)."""
+    n = len(df)
+    severity = np.zeros(n, dtype=np.int8)
+    if n == 0:
+        return severity
+
+    codes, devices = pd.factorize(df["device_id"].astype(str), sort=False)
+    sensor_cols = [c for c in df.columns if c not in NON_SENSOR_COLUMNS]
+
+    for col in sensor_cols:
+        values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+
+        # Límites por dispositivo (pocos dispositivos) -> un arreglo por fila con take()
+        limits = np.full((len(devices), 4), np.nan)
+        for i, dev in enumerate(devices):
+            config = manager.threshold_config(dev, col)
+            if config:
+                limits[i] = resolve_limits(config)
+        if np.isnan(limits).all():
+            continue
+        c_min, c_max, w_min, w_max = (limits[codes, k] for k in range(4))
+
+        # NaN (sin dato o sin umbral) compara False: no cambia la severidad
+        with np.errstate(invalid="ignore"):
+            critical = (values < c_min) | (values > c_max)
+            warning = (values < w_min) | (values > w_max)
+        col_severity = np.where(critical, 2, np.where(warning, 1, 0)).astype(np.int8)
+        np.maximum(severity, col_severity, out=severity)
+
+    # Alertas explícitas del dispositivo -> crítico
+    if "alerts" in df.columns:
+        has_alerts = df["alerts"].map(lambda a: bool(a) if isinstance(a, (list, str)) else False).to_numpy(dtype=bool)
+        severity[has_alerts] = HEALTH_SEVERITY[HealthStatus.CRITICAL]
+
+    return severity
+
+
+def detect_transitions(df: pd.DataFrame, severity: np.ndarray,
+                       previous: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+    """
+    Cambios de salud por dispositivo en orden temporal.
+    `previous` es la última severidad conocida de cada dispositivo (del estado persistido);
+    devuelve las filas donde la severidad difiere de la lectura anterior del mismo dispositivo,
+    con columnas from_severity / to_severity. Un dispositivo sin estado previo solo genera
+    evento si su primera lectura ya no es OK.
+    """
+    previous = previous or {}
+    frame = df.assign(_severity=severity, _order=np.arange(len(df)))
+    frame = frame.sort_values(["device_id", "timestamp", "_order"], kind="stable")
+
+    prev = frame.groupby("device_id", sort=False, observed=True)["_severity"].shift(1).astype("float64")
+    first = prev.isna()
+    prev[first] = frame.loc[first, "device_id"].map(lambda d: previous.get(str(d), np.nan)).astype("float64")
+
+    current = frame["_severity"]
+    changed = (prev.notna() & prev.ne(current)) | (prev.isna() & current.gt(0))
+    result = frame[changed].copy()
+    result["from_severity"] = prev[changed]
+    result["to_severity"] = result["_severity"]
+    return result.drop(columns=["_severity", "_order"])
+
+
+def latest_per_device(df: pd.DataFrame, severity: np.ndarray) -> pd.DataFrame:
+    """Última lectura (por timestamp) de cada dispositivo con su severidad."""
+    frame = df.assign(_severity=severity, _order=np.arange(len(df)))
+    frame = frame.sort_values(["device_id", "timestamp", "_order"], kind="stable")
+    return frame.groupby("device_id", sort=False, observed=True).tail(1).drop(columns=["_order"])
+
+
+def severity_label(severity: float) -> Optional[str]:
+    """0/1/2 -> "ok"/"warning"/"critical" (None si no hay estado previo)."""
+    if severity is None or pd.isna(severity):
+        return None
+    return SEVERITY_HEALTH[int(severity)].value
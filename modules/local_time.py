@@ -0,0 +1,83 @@
+"""
+Zona horaria de la app.
+
+MongoDB guarda los timestamps en UTC. Internamente (normalización, consultas,
+comparaciones online/offline) se trabaja en UTC y la conversión a hora local se
+hace UNA vez, sobre la columna completa, al armar los DataFrames que consumen
+las vistas. La zona es IANA y configurable (APP_TIMEZONE), así que el cambio de
+horario de verano/invierno de Chile (UTC-3 / UTC-4) queda cubierto.
+
+Convención: "local" = datetime naive en hora de APP_TIMEZONE (lo que ve el usuario);
+"utc" = datetime con tzinfo UTC.
+"""
+import os
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Optional
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+DEFAULT_TIMEZONE = "America/Santiago"
+
+
+@lru_cache(maxsize=1)
+def get_zone() -> ZoneInfo:
+    name = os.getenv("APP_TIMEZONE", DEFAULT_TIMEZONE)
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        print(f"[local_time] Zona horaria inválida '{name}', usando {DEFAULT_TIMEZONE}")
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def now_utc() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def now_local() -> datetime:
+    """Hora actual local (naive)."""
+    return datetime.now(get_zone()).replace(tzinfo=None)
+
+
+def to_local(value: Optional[datetime]) -> Optional[datetime]:
+    """Un datetime UTC (aware, o naive asumido UTC) a hora local naive."""
+    if value is None or value is pd.NaT:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(get_zone()).replace(tzinfo=None)
+
+
+def to_utc(value: datetime) -> datetime:
+    """
+    Hora local naive (p.ej. la elegida en un date_input) a UTC aware.
+    En el cambio de hora, las horas repetidas toman la primera ocurrencia y las
+    inexistentes se corren hacia adelante (semántica de zoneinfo con fold=0).
+    """
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc)
+    return value.replace(tzinfo=get_zone()).astimezone(timezone.utc)
+
+
+def to_local_series(values: Any, unit: Optional[str] = None) -> pd.Series:
+    """
+    Conversión vectorizada UTC -> local naive de una columna completa.
+    Acepta datetimes aware/naive (naive = UTC), datetime64 o epoch int64 (indicar `unit`: "s", "ms", "ns").
+    Valores no convertibles quedan NaT.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if unit is not None:
+        utc = pd.to_datetime(series, unit=unit, utc=True, errors="coerce")
+    else:
+        utc = pd.to_datetime(series, utc=True, errors="coerce")
+    return utc.dt.tz_convert(get_zone()).dt.tz_localize(None)
+
+
+def to_utc_series(values: Any) -> pd.Series:
+    """Inversa de to_local_series: columna en hora local naive -> UTC aware (vectorizado)."""
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    local = pd.to_datetime(series, errors="coerce")
+    if getattr(local.dt, "tz", None) is not None:
+        return local.dt.tz_convert(timezone.utc)
+    return local.dt.tz_localize(get_zone(), ambiguous="NaT", nonexistent="shift_forward").dt.tz_convert(timezone.utc)
@@ -0,0 +1,299 @@
+"""
+Métricas de la app y la capa de datos en formato de texto de Prometheus.
+
+Sin dependencias nuevas: contadores, gauges e histogramas mínimos, seguros entre
+hilos, en un registro por proceso. Solo biblioteca estándar, porque home.py lo
+importa al arrancar (el listener del pool de pymongo vive en modules/database.py).
+Con METRICS_PORT definido se sirven en http://<host>:<METRICS_PORT>/metrics (un
+hilo aparte, uno por proceso); sin él se siguen acumulando pero no se exponen.
+
+Métricas (prefijo biofloc_):
+    db_query_seconds{method}                 latencia de los métodos de DatabaseConnection
+    normalized_documents_total{label}        documentos normalizados (docs/s = rate(...))
+    normalize_seconds_total{label}           tiempo de normalización
+    frame_cache_requests_total{namespace,result}
+                                             aciertos/fallos por loader (graphs_history,
+                                             history_range, ...); result = hit | miss | shared_hit
+    dashboard_refresh_seconds                duración del fragmento refresh_dashboard_data
+    active_sessions                          sesiones con actividad en los últimos 5 min
+    mongo_pool_connections / mongo_pool_checked_out
+                                             conexiones del pool de pymongo (abiertas / en uso)
+
+Alerta de ejemplo (PromQL): la latencia p95 de refresco del dashboard se desvía:
+    histogram_quantile(0.95, rate(biofloc_dashboard_refresh_seconds_bucket[10m])) > 2
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+PREFIX = "biofloc_"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Una sesión cuenta como activa si tuvo un rerun en esta ventana
+ACTIVE_SESSION_WINDOW_SECONDS = 300
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Valor fijado con set() o calculado al momento del scrape con set_function()."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {_format_value(float(self._function()))}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # por etiquetas: [conteo por bucket (no acumulado)..., suma, total]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0.0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(state[-1])}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print(f"[metrics] Error generando {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    "db_query_seconds", "Latencia de las consultas de DatabaseConnection", ("method",)))
+NORMALIZED_DOCUMENTS = REGISTRY.register(Counter(
+    "normalized_documents_total", "Documentos normalizados", ("label",)))
+NORMALIZE_SECONDS = REGISTRY.register(Counter(
+    "normalize_seconds_total", "Tiempo dedicado a normalizar documentos", ("label",)))
+FRAME_CACHE_REQUESTS = REGISTRY.register(Counter(
+    "frame_cache_requests_total", "Consultas al caché de frames por loader", ("namespace", "result")))
+DASHBOARD_REFRESH_SECONDS = REGISTRY.register(Histogram(
+    "dashboard_refresh_seconds", "Duración del fragmento de refresco del dashboard"))
+ACTIVE_SESSIONS = REGISTRY.register(Gauge(
+    "active_sessions", "Sesiones con actividad en los últimos 5 minutos"))
+MONGO_POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    "mongo_pool_connections", "Conexiones abiertas en el pool de MongoDB", ("address",)))
+MONGO_POOL_CHECKED_OUT = REGISTRY.register(Gauge(
+    "mongo_pool_checked_out", "Conexiones del pool de MongoDB en uso", ("address",)))
+
+
+def timed_query(method: Callable) -> Callable:
+    """Decorador para métodos de DatabaseConnection: registra su latencia."""
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with DB_QUERY_SECONDS.time(method=method.__name__):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def record_cache_request(namespace: str, result: str):
+    FRAME_CACHE_REQUESTS.inc(namespace=namespace, result=result)
+
+
+# --- Sesiones activas ---
+_sessions: Dict[str, float] = {}
+_sessions_lock = threading.Lock()
+
+
+def touch_session(session_id: str):
+    """Marca actividad de una sesión (llamar en cada rerun)."""
+    with _sessions_lock:
+        _sessions[session_id] = time.monotonic()
+
+
+def _active_sessions() -> float:
+    cutoff = time.monotonic() - ACTIVE_SESSION_WINDOW_SECONDS
+    with _sessions_lock:
+        for session_id in [s for s, seen in _sessions.items() if seen < cutoff]:
+            del _sessions[session_id]
+        return float(len(_sessions))
+
+
+ACTIVE_SESSIONS.set_function(_active_sessions)
+
+
+# --- Servidor /metrics ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: Optional[int] = None) -> Optional[int]:
+    """
+    Sirve /metrics en un hilo aparte (una vez por proceso). Sin `port` usa METRICS_PORT;
+    si no está definido no hace nada. Devuelve el puerto en uso o None.
+    """
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server.server_address[1]
+        if port is None:
+            raw = os.getenv("METRICS_PORT")
+            if not raw:
+                return None
+            port = int(raw)
+        host = os.getenv("METRICS_HOST", "0.0.0.0")
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            print(f"[metrics] No se pudo abrir el puerto {port}: {e}")
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"[metrics] Métricas en http://{host}:{_server.server_address[1]}/metrics")
+        return _server.server_address[1]
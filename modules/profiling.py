@@ -0,0 +1,163 @@
+"""
+Perfil de render por rerun (opcional, sin redeploy).
+
+Se activa con ?profile=1 en la URL o PROFILE_VIEWS=1 en el entorno. Cada vista
+marca sus tramos con span(): carga de datos, transformación, construcción de
+figuras y emisión de widgets. Al final de la página aparece un desglose
+colapsable; el tiempo no cubierto por ningún tramo se reporta como
+"sin asignar" (widgets y render de Streamlit).
+
+Con ?profile=cprofile además se corre cProfile sobre el rerun y se muestran las
+funciones más costosas. Solo si PROFILE_DUMP_DIR está definido se guarda el
+.prof en disco (un archivo por rerun: <vista>-<fecha>.prof, abrir con snakeviz o
+pstats). Así un parámetro de URL no puede llenar el disco del servidor.
+
+Sin perfil activo, span() no hace nada (costo: una lectura de contextvar).
+"""
+import cProfile
+import io
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional
+
+import streamlit as st
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Categorías del desglose (en este orden)
+DATA = "datos"
+TRANSFORM = "transformación"
+FIGURE = "figuras"
+WIDGETS = "widgets"
+CATEGORIES = (DATA, TRANSFORM, FIGURE, WIDGETS)
+TOP_FUNCTIONS = 25
+
+
+class RenderProfile:
+
+    def __init__(self, view: str):
+        self.view = view
+        self.spans: List[dict] = []
+        self._depth = 0
+        self.total = 0.0
+
+
+_current: ContextVar[Optional[RenderProfile]] = ContextVar("render_profile", default=None)
+
+
+def profile_mode() -> Optional[str]:
+    """None (apagado), "spans" o "cprofile"."""
+    try:
+        value = str(st.query_params.get("profile", "")).lower()
+    except Exception:
+        value = ""
+    if not value:
+        value = os.getenv("PROFILE_VIEWS", "").lower()
+    if value == "cprofile":
+        return "cprofile"
+    if value in ("1", "true", "yes"):
+        return "spans"
+    return None
+
+
+@contextmanager
+def span(name: str, category: str = TRANSFORM) -> Iterator[None]:
+    """Mide un tramo del rerun actual (no hace nada si el perfil está apagado)."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    entry = {"tramo": name, "categoria": category, "nivel": profile._depth, "segundos": 0.0}
+    profile.spans.append(entry)
+    profile._depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry["segundos"] = time.perf_counter() - started
+        profile._depth -= 1
+
+
+def run_view(view: str, show_view: Callable[[], None]):
+    """Ejecuta show_view de una vista; con el perfil activo mide el rerun y muestra el desglose al final."""
+    mode = profile_mode()
+    if mode is None:
+        show_view()
+        return
+
+    profile = RenderProfile(view)
+    token = _current.set(profile)
+    profiler = cProfile.Profile() if mode == "cprofile" else None
+    started = time.perf_counter()
+    completed = False
+    try:
+        if profiler is not None:
+            try:
+                profiler.enable()
+            except ValueError:
+                # Solo un cProfile activo por proceso (otra sesión ya está perfilando)
+                print("[profiling] cProfile ocupado por otro rerun, solo se miden tramos")
+                profiler = None
+        show_view()
+        completed = True
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        profile.total = time.perf_counter() - started
+        _current.reset(token)
+        # st.rerun()/st.stop() cortan el script: no hay página donde mostrar el desglose
+        if completed:
+            render_profile(profile, profiler)
+
+
+def breakdown(profile: RenderProfile) -> "pd.DataFrame":
+    """Tabla del desglose: tramos medidos + el resto sin asignar."""
+    # home.py importa este módulo al arrancar: pandas solo cuando hay un perfil que mostrar
+    import pandas as pd
+
+    rows = [{"Categoría": s["categoria"], "Tramo": "  " * s["nivel"] + s["tramo"],
+             "ms": s["segundos"] * 1000} for s in profile.spans]
+    covered = sum(s["segundos"] for s in profile.spans if s["nivel"] == 0)
+    rows.append({"Categoría": WIDGETS, "Tramo": "sin asignar (widgets y render)",
+                 "ms": max(profile.total - covered, 0.0) * 1000})
+    df = pd.DataFrame(rows, columns=["Categoría", "Tramo", "ms"])
+    df["%"] = df["ms"] / (profile.total * 1000) * 100 if profile.total else 0.0
+    return df
+
+
+def _dump_stats(profile: RenderProfile, profiler: cProfile.Profile) -> Optional[str]:
+    directory = os.getenv("PROFILE_DUMP_DIR")
+    if not directory:
+        return None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{profile.view}-{datetime.now():%Y%m%d-%H%M%S-%f}.prof")
+        profiler.dump_stats(path)
+        return path
+    except OSError as e:
+        print(f"[profiling] No se pudo guardar el perfil en {directory}: {e}")
+        return None
+
+
+def render_profile(profile: RenderProfile, profiler: Optional[cProfile.Profile] = None):
+    table = breakdown(profile)
+    top_level = table[~table["Tramo"].str.startswith(" ")]
+    per_category = top_level.groupby("Categoría")["ms"].sum()
+    summary = " | ".join(f"{c}: {per_category.get(c, 0.0):.0f} ms" for c in CATEGORIES)
+    print(f"[profiling] {profile.view}: {profile.total * 1000:.0f} ms ({summary})")
+
+    with st.expander(f"Perfil de render ({profile.view}): {profile.total * 1000:.0f} ms", expanded=False):
+        st.caption(summary)
+        st.dataframe(table.round({"ms": 1, "%": 1}), width="stretch", hide_index=True)
+        if profiler is not None:
+            path = _dump_stats(profile, profiler)
+            if path:
+                st.caption(f"cProfile guardado en {path}")
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            st.code(out.getvalue(), language="text")
@@ -0,0 +1,105 @@
+"""
+Índice de búsqueda de texto para el historial.
+
+El filtro de texto de la vista Historial buscaba la consulta en device_id,
+location y el alias, recorriendo TODAS las filas cargadas en cada rerun. Aquí
+los textos se normalizan (minúsculas, espacios colapsados) UNA vez por versión
+de metadatos y la consulta se resuelve contra las categorías: el resultado son
+los códigos categóricos que coinciden, y las filas se seleccionan con una sola
+máscara sobre esos códigos. El costo de buscar depende del número de
+dispositivos/ubicaciones, no del número de filas.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+
+def normalize_text(value) -> str:
+    """Minúsculas y espacios colapsados (misma normalización para índice y consulta)."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    return " ".join(str(value).lower().split())
+
+
+def index_version(devices: Iterable, locations: Iterable, alias_map: Dict[str, str]) -> int:
+    """Huella de los metadatos que alimentan el índice (categorías + alias)."""
+    return hash((tuple(devices), tuple(locations), tuple(sorted((str(k), str(v)) for k, v in alias_map.items()))))
+
+
+class DeviceSearchIndex:
+
+    def __init__(self, devices: Iterable, locations: Iterable, alias_map: Optional[Dict[str, str]] = None):
+        alias_map = alias_map or {}
+        self.devices = list(devices)
+        self.locations = list(locations)
+
+        # Texto buscable por dispositivo: id y alias (separados para no crear coincidencias entre campos)
+        self._device_terms = [
+            (normalize_text(dev), normalize_text(alias_map.get(dev, ""))) for dev in self.devices
+        ]
+        self._location_terms = [normalize_text(loc) for loc in self.locations]
+
+    def match_codes(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Códigos categóricos (device_id, location) cuyo texto contiene la consulta."""
+        q = normalize_text(query)
+        if not q:
+            return np.arange(len(self.devices)), np.arange(len(self.locations))
+        dev_codes = [i for i, (dev, alias) in enumerate(self._device_terms) if q in dev or (alias and q in alias)]
+        loc_codes = [i for i, loc in enumerate(self._location_terms) if q in loc]
+        return np.asarray(dev_codes, dtype=np.int64), np.asarray(loc_codes, dtype=np.int64)
+
+    def matching_devices(self, query: str) -> Set[str]:
+        """Dispositivos cuyo id o alias contiene la consulta."""
+        dev_codes, _ = self.match_codes(query)
+        return {self.devices[i] for i in dev_codes}
+
+    def matching_locations(self, query: str) -> Set[str]:
+        """Ubicaciones cuyo texto contiene la consulta."""
+        _, loc_codes = self.match_codes(query)
+        return {self.locations[i] for i in loc_codes}
+
+    def mask(self, df: pd.DataFrame, query: str) -> np.ndarray:
+        """Máscara booleana de filas que coinciden por dispositivo, alias o ubicación."""
+        dev_codes, loc_codes = self.match_codes(query)
+        mask = np.isin(_codes(df, "device_id", self.devices), dev_codes)
+        if "location" in df.columns and self.locations:
+            mask |= np.isin(_codes(df, "location", self.locations), loc_codes)
+        return mask
+
+    def filter(self, df: pd.DataFrame, query: str) -> pd.DataFrame:
+        if df is None or df.empty or not normalize_text(query):
+            return df
+        return df[self.mask(df, query)]
+
+
+    def filter_table(self, table: pa.Table, query: str) -> pa.Table:
+        """filter() sobre una tabla Arrow cacheada (devuelve una tabla nueva, no modifica la original)."""
+        if table is None or table.num_rows == 0 or not normalize_text(query):
+            return table
+        dev_codes, loc_codes = self.match_codes(query)
+        devices = pa.array([str(self.devices[i]) for i in dev_codes], type=pa.string())
+        mask = pc.is_in(table.column("device_id"), value_set=devices)
+        if "location" in table.column_names and self.locations:
+            locations = pa.array([str(self.locations[i]) for i in loc_codes], type=pa.string())
+            mask = pc.or_(mask, pc.is_in(table.column("location"), value_set=locations))
+        return table.filter(pc.fill_null(mask, False))
+
+
+def _codes(df: pd.DataFrame, col: str, categories: list) -> np.ndarray:
+    """Códigos de la columna respecto a `categories` (gratis si ya es categórica con esas categorías)."""
+    series = df[col]
+    if isinstance(series.dtype, pd.CategoricalDtype) and list(series.cat.categories) == categories:
+        return series.cat.codes.to_numpy()
+    return pd.Categorical(series, categories=categories).codes
+
+
+def categories_of(df: pd.DataFrame, col: str) -> list:
+    """Valores distintos de una columna (las categorías si ya es categórica)."""
+    if col not in df.columns:
+        return []
+    series = df[col]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return list(series.cat.categories)
+    return sorted(series.dropna().unique().tolist(), key=str)
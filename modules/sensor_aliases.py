@@ -0,0 +1,128 @@
+"""
+Catálogo único de nombres de sensores.
+
+Cada esquema de firmware / configuración nombra los sensores a su manera
+(temp, temperatura, TEMP; do, od, oxigeno...). Todos los módulos resuelven el
+nombre canónico aquí: normalización de documentos, columnas de historial y
+gráficas, umbrales globales y por dispositivo. Los alias se compilan una vez en
+un diccionario plano y la resolución queda memoizada.
+
+Los nombres canónicos son los que ya producen los datos normalizados
+(temperature, oxygen, ph, ...), para no invalidar configuraciones guardadas.
+"""
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping
+
+import pandas as pd
+
+# nombre canónico -> alias aceptados (sin distinguir mayúsculas)
+SENSOR_CATALOG: Dict[str, tuple] = {
+    "temperature": ("temp", "temperatura"),
+    "oxygen": ("do", "od", "oxigeno", "oxígeno", "dissolved_oxygen"),
+    "ph": (),
+    "humidity": ("humedad",),
+    "turbidez": ("turbidity",),
+    "orp": (),
+    "ec": ("conductividad", "conductivity"),
+}
+
+_ALIAS_LOOKUP: Dict[str, str] = {}
+for _canonical, _aliases in SENSOR_CATALOG.items():
+    _ALIAS_LOOKUP[_canonical] = _canonical
+    for _alias in _aliases:
+        _ALIAS_LOOKUP[_alias] = _canonical
+
+
+@lru_cache(maxsize=4096)
+def canonical_sensor(name: str) -> str:
+    """Nombre canónico de un sensor (los desconocidos quedan en minúsculas y sin espacios)."""
+    key = str(name).lower().strip()
+    return _ALIAS_LOOKUP.get(key, key)
+
+
+def raw_field_names(sensors: Iterable[str]) -> List[str]:
+    """
+    Nombres con que un sensor canónico puede venir guardado en `sensors`/`datos`
+    (sus alias en minúsculas, MAYÚSCULAS y Capitalizado), para proyecciones de MongoDB.
+    """
+    names = set()
+    for sensor in sensors:
+        canonical = canonical_sensor(sensor)
+        for name in (canonical, *SENSOR_CATALOG.get(canonical, ())):
+            names.update((name, name.upper(), name.capitalize()))
+    # Rutas inválidas en una proyección
+    return sorted(n for n in names if n and "." not in n and not n.startswith("$"))
+
+
+def canonicalize_keys(mapping: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Claves de un diccionario por sensor (p.ej. umbrales) a nombre canónico.
+    Si dos alias chocan, gana la entrada cuya clave ya es el nombre canónico.
+    """
+    result: Dict[str, Any] = {}
+    exact = set()
+    for key, value in (mapping or {}).items():
+        canonical = canonical_sensor(key)
+        if canonical in exact:
+            continue
+        if canonical not in result or str(key).lower().strip() == canonical:
+            result[canonical] = value
+            if str(key).lower().strip() == canonical:
+                exact.add(canonical)
+    return result
+
+
+def parse_threshold_fields(raw: Mapping[str, Any]) -> Dict[str, Dict[str, float]]:
+    """
+    Umbrales por dispositivo tal como se guardan en `umbrales` a {sensor canónico: config}.
+    Soporta el formato plano ({temp_min: 16, ph_max: 8.2} -> min_value/max_value), que es
+    el que guarda Configuración, y el anidado antiguo ({temperature: {min_value: ...}}).
+    """
+    flat: Dict[str, Dict[str, float]] = {}
+    nested: Dict[str, Dict[str, Any]] = {}
+    for key, value in (raw or {}).items():
+        if isinstance(value, dict):
+            nested[key] = value
+            continue
+        if isinstance(value, list):
+            continue
+        parts = str(key).lower().rsplit("_", 1)
+        if len(parts) != 2 or parts[1] not in ("min", "max"):
+            continue
+        sensor, threshold_type = canonical_sensor(parts[0]), parts[1]
+        try:
+            flat.setdefault(sensor, {})[f"{threshold_type}_value"] = float(value)
+        except (TypeError, ValueError):
+            continue
+    # El formato plano (el vigente) tiene prioridad sobre el anidado antiguo
+    structured = {sensor: dict(config) for sensor, config in canonicalize_keys(nested).items()}
+    for sensor, config in flat.items():
+        structured[sensor] = {**structured.get(sensor, {}), **config}
+    return structured
+
+
+def normalize_sensor_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Renombra columnas a su nombre canónico en una sola pasada. Si varias columnas
+    caen en el mismo sensor (p.ej. "temp" y "temperatura"), se combinan: en cada fila
+    gana la columna canónica y luego las demás en orden.
+    """
+    if df is None or df.empty:
+        return df
+
+    groups: Dict[str, List[str]] = {}
+    for col in df.columns:
+        groups.setdefault(canonical_sensor(col), []).append(col)
+
+    if all(len(cols) == 1 and cols[0] == canonical for canonical, cols in groups.items()):
+        return df
+
+    merged = {}
+    for canonical, cols in groups.items():
+        if len(cols) == 1:
+            merged[canonical] = df[cols[0]]
+            continue
+        ordered = sorted(cols, key=lambda c: c != canonical)
+        merged[canonical] = df[ordered].bfill(axis=1).iloc[:, 0]
+    return pd.DataFrame(merged, index=df.index)
+
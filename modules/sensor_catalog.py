@@ -0,0 +1,183 @@
+"""
+Catálogo persistente de sensores por dispositivo (colección `sensor_catalog`).
+
+Un documento por dispositivo:
+    {_id: device_id, location, first_seen, last_seen, samples,
+     sensors: {temperature: {first_seen, last_seen, samples}, ...}, updated_at}
+
+Se mantiene de forma incremental desde las lecturas nuevas (lo hace el evaluador
+en segundo plano, ver scripts/alert_evaluator.py) o se construye una vez con una
+agregación $objectToArray sobre el histórico. Las vistas lo leen (cacheado) en
+lugar de redescubrir sensores desde los datos en cada rerun.
+Nombres de sensores canónicos (sensor_aliases); timestamps en UTC.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+import pandas as pd
+import streamlit as st
+from pymongo import UpdateOne
+
+from modules.database import DatabaseConnection
+from modules.sensor_aliases import canonical_sensor
+
+NON_SENSOR_COLUMNS = {"timestamp", "device_id", "location", "alerts", "_source_id", "_id"}
+
+
+def _valid_name(name: str) -> bool:
+    # No se puede usar como ruta de $set/$inc
+    return bool(name) and "." not in name and not name.startswith("$")
+
+
+def catalog_updates(df: pd.DataFrame) -> List[UpdateOne]:
+    """
+    Operaciones de actualización del catálogo para un lote plano de lecturas
+    (timestamp en UTC tal como viene de los documentos normalizados, device_id,
+    location, una columna por sensor). No se reconstruye UTC desde hora local: la
+    hora repetida del cambio de horario se perdería o quedaría desordenada.
+    """
+    if df is None or df.empty or "device_id" not in df.columns or "timestamp" not in df.columns:
+        return []
+
+    frame = df.assign(_ts=pd.to_datetime(df["timestamp"], utc=True, errors="coerce"))
+    frame = frame[frame["_ts"].notna() & frame["device_id"].notna()]
+    if frame.empty:
+        return []
+    sensor_cols = [c for c in frame.columns
+                   if c not in NON_SENSOR_COLUMNS and c != "_ts" and pd.api.types.is_numeric_dtype(frame[c])]
+
+    grouped = frame.groupby("device_id", sort=False, observed=True)
+    ts_min, ts_max, total = grouped["_ts"].min(), grouped["_ts"].max(), grouped.size()
+    last_location = grouped["location"].last() if "location" in frame.columns else None
+
+    # Por sensor: primera/última lectura con dato y cantidad de muestras (vectorizado por columna)
+    per_sensor = {}
+    for col in sensor_cols:
+        name = canonical_sensor(col)
+        if not _valid_name(name):
+            continue
+        ts_with_value = frame["_ts"].where(frame[col].notna())
+        stats = ts_with_value.groupby(frame["device_id"], sort=False, observed=True).agg(["min", "max", "count"])
+        per_sensor[name] = stats[stats["count"] > 0]
+
+    now = datetime.now(timezone.utc)
+    updates = []
+    for device_id in total.index:
+        ops: Dict[str, Dict[str, Any]] = {
+            "$min": {"first_seen": ts_min[device_id].to_pydatetime()},
+            "$max": {"last_seen": ts_max[device_id].to_pydatetime()},
+            "$inc": {"samples": int(total[device_id])},
+            "$set": {"updated_at": now},
+        }
+        if last_location is not None and pd.notna(last_location[device_id]):
+            ops["$set"]["location"] = str(last_location[device_id])
+        for name, stats in per_sensor.items():
+            if device_id not in stats.index:
+                continue
+            row = stats.loc[device_id]
+            ops["$min"][f"sensors.{name}.first_seen"] = row["min"].to_pydatetime()
+            ops["$max"][f"sensors.{name}.last_seen"] = row["max"].to_pydatetime()
+            ops["$inc"][f"sensors.{name}.samples"] = int(row["count"])
+        updates.append(UpdateOne({"_id": str(device_id)}, ops, upsert=True))
+    return updates
+
+
+def record_readings(db: DatabaseConnection, df: pd.DataFrame) -> int:
+    """Aplica un lote de lecturas (timestamps en UTC) al catálogo. Devuelve los dispositivos actualizados."""
+    if db.db is None:
+        return 0
+    updates = catalog_updates(df)
+    if updates:
+        db.db[DatabaseConnection.SENSOR_CATALOG_COLLECTION].bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def bootstrap_catalog(db: DatabaseConnection, until_id: Optional[Any] = None) -> int:
+    """
+    Construye el catálogo completo desde el histórico con una sola agregación
+    ($objectToArray sobre sensors/datos). Pensado para correr una vez; luego el
+    catálogo se mantiene con record_readings(). `until_id` limita a lecturas con
+    _id <= until_id (la marca de agua desde la que sigue el modo incremental).
+    Devuelve los dispositivos escritos.
+    """
+    if db.collection is None:
+        return 0
+
+    pipeline = [{"$match": {"_id": {"$lte": until_id}}}] if until_id is not None else []
+    pipeline += [
+        {"$project": {
+            "device_id": {"$ifNull": ["$device_id", {"$ifNull": ["$dispositivo_id", "$metadata.device_id"]}]},
+            "location": 1,
+            # Date real: $min/$max sobre el crudo compararían por tipo BSON (y epoch s contra ms)
+            "timestamp": DatabaseConnection.timestamp_as_date(),
+            "sensors": {"$objectToArray": {"$ifNull": ["$sensors", {"$ifNull": ["$datos", {}]}]}},
+        }},
+        # En orden cronológico para que $last tome la ubicación de la lectura más reciente
+        {"$sort": {"timestamp": 1}},
+        {"$unwind": "$sensors"},
+        {"$group": {
+            "_id": {"device_id": "$device_id", "sensor": "$sensors.k"},
+            "first_seen": {"$min": "$timestamp"},
+            "last_seen": {"$max": "$timestamp"},
+            "samples": {"$sum": 1},
+            "location": {"$last": "$location"},
+        }},
+    ]
+
+    def to_utc(value: Any) -> Optional[datetime]:
+        # Date ya normalizada en el pipeline (naive = UTC si el cliente no es tz_aware)
+        return db._normalize_document({"timestamp": value})["timestamp"]
+
+    catalog: Dict[str, Dict[str, Any]] = {}
+    for group in db.collection.aggregate(pipeline, allowDiskUse=True):
+        device_id = group["_id"].get("device_id")
+        name = canonical_sensor(group["_id"].get("sensor") or "")
+        if device_id is None or not _valid_name(name):
+            continue
+        first, last = to_utc(group["first_seen"]), to_utc(group["last_seen"])
+        doc = catalog.setdefault(str(device_id), {"sensors": {}, "location": group.get("location")})
+        # Alias que caen en el mismo nombre canónico se combinan
+        entry = doc["sensors"].setdefault(name, {"first_seen": first, "last_seen": last, "samples": 0})
+        entry["samples"] += int(group["samples"])
+        if first is not None and (entry["first_seen"] is None or first < entry["first_seen"]):
+            entry["first_seen"] = first
+        if last is not None and (entry["last_seen"] is None or last > entry["last_seen"]):
+            entry["last_seen"] = last
+
+    now = datetime.now(timezone.utc)
+    updates = []
+    for device_id, doc in catalog.items():
+        sensors = doc["sensors"]
+        firsts = [s["first_seen"] for s in sensors.values() if s["first_seen"] is not None]
+        lasts = [s["last_seen"] for s in sensors.values() if s["last_seen"] is not None]
+        updates.append(UpdateOne({"_id": device_id}, {"$set": {
+            "location": doc["location"],
+            "sensors": sensors,
+            "first_seen": min(firsts) if firsts else None,
+            "last_seen": max(lasts) if lasts else None,
+            # Muestras del dispositivo ~ las del sensor más frecuente (una lectura trae varios sensores)
+            "samples": max((s["samples"] for s in sensors.values()), default=0),
+            "updated_at": now,
+        }}, upsert=True))
+    if updates:
+        db.db[DatabaseConnection.SENSOR_CATALOG_COLLECTION].bulk_write(updates, ordered=False)
+    print(f"[sensor_catalog] Catálogo inicial: {len(updates)} dispositivos")
+    return len(updates)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_sensor_catalog(active_since: Optional[datetime] = None) -> Dict[str, List[str]]:
+    """
+    {device_id: [sensores]} desde la colección (cacheado 60 s; {} si aún no existe).
+    `active_since` (UTC) deja solo lo que tuvo lecturas desde ese momento.
+    """
+    return DatabaseConnection().get_sensor_catalog(active_since)
+
+
+def known_sensors() -> Set[str]:
+    """Todos los sensores vistos en cualquier dispositivo."""
+    return {name for sensors in load_sensor_catalog().values() for name in sensors}
+
+
+def sensors_for_device(device_id: str) -> List[str]:
+    return load_sensor_catalog().get(str(device_id), [])
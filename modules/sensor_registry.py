@@ -89,10 +89,10 @@ class SensorRegistry:
         
         if container_cols:
             for col in container_cols:
-                # Inspeccionar el primer registro no nulo
-                first_valid = df[col].dropna().iloc[0] if not df[col].dropna().empty else {}
-                if isinstance(first_valid, dict):
-                    discovered.update(first_valid.keys())
+                # Unión de las claves de TODOS los registros (cada dispositivo puede traer sensores distintos)
+                for value in df[col].dropna():
+                    if isinstance(value, dict):
+                        discovered.update(value.keys())
                     
         # 2. Las columnas que NO son contenedores, son sensores planos (Legacy)
         flat_sensors = potential_sensors - container_cols
@@ -0,0 +1,114 @@
+"""
+Decodificación por lotes de timestamps guardados como texto.
+
+El firmware antiguo del ESP32 guarda `timestamp` como string ISO. Parsear cada
+documento con pd.to_datetime(valor) infiere el formato desde cero cada vez.
+Aquí el formato se detecta una vez por "huella" del string (los dígitos
+reemplazados por 'd', p.ej. "dddd-dd-ddTdd:dd:dd.dddddd+dd:dd") y queda en
+caché para todo el proceso. Con el formato explícito se parsea la columna
+completa de una pasada; solo lo que no calza con ningún formato conocido cae
+a inferencia por valor (y se reporta cuántos fueron).
+"""
+import re
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# Formatos candidatos (los más comunes primero). %z acepta "Z", "+00:00" y "-0300".
+CANDIDATE_FORMATS = [
+    "%Y-%m-%dT%H:%M:%S.%f%z",
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M:%S.%f%z",
+    "%Y-%m-%d %H:%M:%S%z",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M%z",
+    "%Y-%m-%dT%H:%M",
+    "%Y-%m-%d",
+]
+
+# Máximo de formatos distintos a probar por lote antes de pasar a inferencia
+MAX_FORMATS_PER_BATCH = 4
+# Huellas recordadas (strings basura tienen huellas únicas: no dejar crecer el caché sin tope)
+MAX_CACHED_FINGERPRINTS = 256
+
+_DIGITS = re.compile(r"\d")
+_format_cache: Dict[str, Optional[str]] = {}
+_cache_lock = threading.Lock()
+
+
+def fingerprint(value: str) -> str:
+    """Forma del string sin los dígitos: dos timestamps con la misma huella comparten formato."""
+    return _DIGITS.sub("d", value.strip())
+
+
+def detect_format(value: str) -> Optional[str]:
+    """Formato explícito para un string (cacheado por huella); None si ninguno calza."""
+    key = fingerprint(value)
+    with _cache_lock:
+        if key in _format_cache:
+            return _format_cache[key]
+
+    fmt = None
+    for candidate in CANDIDATE_FORMATS:
+        try:
+            datetime.strptime(value.strip(), candidate)
+        except ValueError:
+            continue
+        fmt = candidate
+        break
+
+    with _cache_lock:
+        if len(_format_cache) < MAX_CACHED_FINGERPRINTS:
+            _format_cache[key] = fmt
+    return fmt
+
+
+def known_formats() -> Dict[str, Optional[str]]:
+    """Copia del caché huella -> formato (para diagnóstico)."""
+    with _cache_lock:
+        return dict(_format_cache)
+
+
+def parse_timestamp_strings(values: Sequence[Optional[str]], label: Optional[str] = None) -> Tuple[pd.Series, int]:
+    """
+    Parsea una columna de strings a datetime UTC (aware). Naive = UTC, igual que Mongo.
+    Devuelve (serie UTC con NaT donde no se pudo parsear, nº de valores que necesitaron inferencia).
+    """
+    strings = pd.Series(values, dtype=object)
+    result = pd.Series(pd.NaT, index=strings.index, dtype="datetime64[ns, UTC]")
+    remaining = strings.map(lambda v: isinstance(v, str) and bool(v.strip()))
+    if not remaining.any():
+        return result, 0
+
+    tried = set()
+    while remaining.any() and len(tried) < MAX_FORMATS_PER_BATCH:
+        # El formato se detecta con el primer valor pendiente; la columna completa se parsea con él
+        fmt = detect_format(strings[remaining].iloc[0])
+        if fmt is None or fmt in tried:
+            break
+        tried.add(fmt)
+        pending = strings[remaining].str.strip()
+        parsed = pd.to_datetime(pending, format=fmt, utc=True, errors="coerce")
+        ok = parsed.notna()
+        result.loc[ok[ok].index] = parsed[ok]
+        remaining.loc[ok[ok].index] = False
+
+    n_fallback = int(remaining.sum())
+    if n_fallback:
+        # Valores atípicos: inferencia valor por valor (lo lento que se quiere evitar)
+        inferred = pd.to_datetime(strings[remaining], format="mixed", utc=True, errors="coerce")
+        result.loc[remaining[remaining].index] = inferred
+        print(f"[timestamp_decoder] {label or 'lote'}: {n_fallback:,} de {len(strings):,} "
+              f"timestamps de texto sin formato conocido (inferencia)")
+    return result, n_fallback
+
+
+def decode_timestamps(values: Sequence[Optional[str]], label: Optional[str] = None) -> List[Optional[datetime]]:
+    """Igual que parse_timestamp_strings, como lista de datetimes UTC (None si no se pudo)."""
+    parsed, _ = parse_timestamp_strings(values, label=label)
+    return [None if ts is pd.NaT else ts for ts in parsed.astype(object)]
@@ -0,0 +1,301 @@
+"""
+Evaluador de alertas en segundo plano para Biofloc Monitor.
+Corre como proceso independiente (no necesita navegadores abiertos): sigue las
+lecturas nuevas de la colección, evalúa la salud con los mismos umbrales que el
+dashboard (DeviceManager: específicos del dispositivo > globales) en lotes
+vectorizados y registra cada cambio de estado en `alerts_events`.
+
+Colecciones que escribe:
+    sensor_catalog Sensores vistos por dispositivo (primera/última lectura, muestras).
+                   Se construye una vez desde el histórico y luego se actualiza por lote.
+    alerts_events  Un documento por transición (ok -> warning, warning -> critical, ...).
+                   _id = _id de la lectura que la provocó (reintentos idempotentes).
+    alerts_state   Estado actual por dispositivo (lo lee el dashboard) y el documento
+                   "__evaluator__" con la marca de agua (_id de la última lectura
+                   procesada) y el heartbeat.
+
+Seguimiento de lecturas nuevas:
+    - Por defecto, polling por _id (marca de agua). Solo se procesan lecturas con
+      _id generado hace más de --settle-seconds para no saltarse inserciones que
+      llegan con un poco de atraso desde otros clientes.
+    - --change-stream usa un change stream de MongoDB (requiere replica set / Atlas).
+
+Ejemplos:
+    python scripts/alert_evaluator.py                    # corre indefinidamente
+    python scripts/alert_evaluator.py --once             # procesa lo pendiente y termina
+    python scripts/alert_evaluator.py --backfill-hours 6 # primera corrida: evalúa las últimas 6 h
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import pandas as pd
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from modules.config_manager import ConfigManager
+from modules.database import DatabaseConnection
+from modules.device_manager import DeviceManager
+from modules.health_engine import evaluate_severity, detect_transitions, latest_per_device, severity_label
+from modules.sensor_catalog import bootstrap_catalog, record_readings
+
+EVALUATOR_ID = DatabaseConnection.EVALUATOR_STATE_ID
+PROJECTION = DatabaseConnection.reading_projection()
+
+
+class AlertEvaluator:
+
+    def __init__(self, db: DatabaseConnection, thresholds_ttl: float = 60.0):
+        self.db = db
+        self.readings = db.collection
+        self.events = db.db[DatabaseConnection.ALERTS_EVENTS_COLLECTION]
+        self.state = db.db[DatabaseConnection.ALERTS_STATE_COLLECTION]
+        self.thresholds_ttl = thresholds_ttl
+        self._manager: Optional[DeviceManager] = None
+        self._manager_loaded_at = 0.0
+        self.processed = 0
+        self.events_written = 0
+
+    # --- Configuración de umbrales (misma fuente que el dashboard) ---
+    def device_manager(self) -> DeviceManager:
+        if self._manager is None or time.monotonic() - self._manager_loaded_at > self.thresholds_ttl:
+            config_manager = ConfigManager(self.db)
+            global_thresholds = config_manager.get_all_configured_sensors()
+            all_meta = config_manager.get_device_metadata()
+            dev_specifics = {k: v.get('thresholds', {}) for k, v in all_meta.items()}
+            self._manager = DeviceManager(global_thresholds, {}, dev_specifics)
+            self._manager_loaded_at = time.monotonic()
+        return self._manager
+
+    # --- Estado persistido ---
+    def load_watermark(self, backfill_hours: float) -> ObjectId:
+        doc = self.state.find_one({"_id": EVALUATOR_ID}) or {}
+        if doc.get("last_id") is not None:
+            return doc["last_id"]
+        # Primera corrida: no re-evaluar todo el histórico
+        start = datetime.now(timezone.utc) - timedelta(hours=backfill_hours)
+        print(f"[alert_evaluator] Sin marca de agua previa: comenzando desde {start:%Y-%m-%d %H:%M} UTC")
+        return ObjectId.from_datetime(start)
+
+    def ensure_catalog(self, until_id: ObjectId):
+        """Primera corrida: construir el catálogo de sensores hasta la marca de agua (luego es incremental)."""
+        catalog = self.db.db[DatabaseConnection.SENSOR_CATALOG_COLLECTION]
+        if catalog.estimated_document_count() == 0:
+            bootstrap_catalog(self.db, until_id=until_id)
+
+    def previous_severity(self, device_ids: List[str]) -> Dict[str, int]:
+        cursor = self.state.find({"_id": {"$in": device_ids}}, {"severity": 1})
+        return {str(doc["_id"]): int(doc["severity"]) for doc in cursor if doc.get("severity") is not None}
+
+    def heartbeat(self, last_id: Optional[ObjectId] = None, resume_token: Optional[Dict[str, Any]] = None):
+        fields = {"heartbeat_at": datetime.now(timezone.utc), "processed": self.processed,
+                  "events_written": self.events_written}
+        if last_id is not None:
+            fields["last_id"] = last_id
+        if resume_token is not None:
+            fields["resume_token"] = resume_token
+        self.state.update_one({"_id": EVALUATOR_ID}, {"$set": fields}, upsert=True)
+
+    def seed_state(self, until_id: ObjectId):
+        """
+        Estado inicial de los dispositivos con lecturas que aún no están en alerts_state
+        (p.ej. los que ya estaban offline al arrancar el evaluador), desde su última
+        lectura hasta la marca de agua. Sin esto el índice del dashboard no cubriría
+        toda la flota. Lo posterior a la marca lo evalúa el seguimiento normal: sembrar
+        con una lectura más nueva dejaría como "anterior" una severidad del futuro.
+        """
+        have = {str(doc_id) for doc_id in self.state.distinct("_id")}
+        missing = [d for d in self.db.known_device_ids(include_registry=False) if d not in have]
+        if not missing:
+            return
+        # Lecturas hasta la marca de agua: ya cuentan en el catálogo
+        raw_docs = self.db.latest_documents(missing, until_id=until_id)
+        self.process_batch(raw_docs, record_catalog=False)
+        print(f"[alert_evaluator] Estado inicial sembrado para {len(raw_docs)} dispositivos")
+
+    # --- Procesamiento de un lote ---
+    def process_batch(self, raw_docs: List[Dict[str, Any]], record_catalog: bool = True) -> int:
+        """Evalúa un lote de lecturas crudas y persiste transiciones y estado. Devuelve nº de eventos."""
+        norm_docs = []
+        for norm in self.db._normalize_documents(raw_docs, label="alert_evaluator"):
+            if norm.get("timestamp") is not None and norm.get("device_id") not in (None, "", "unknown"):
+                norm_docs.append(norm)
+        self.processed += len(raw_docs)
+        if not norm_docs:
+            return 0
+
+        df = self.db._parse_historical_flat(norm_docs)
+        # _parse_historical_flat deja hora local naive (para las vistas); lo que se persiste
+        # (eventos, estado, catálogo) va en UTC, tomado directo de los documentos normalizados
+        df["timestamp"] = pd.to_datetime([doc["timestamp"] for doc in norm_docs], utc=True, errors="coerce")
+        df["device_id"] = df["device_id"].astype(str)
+        df["alerts"] = [doc["alerts"] for doc in norm_docs]
+        df["_source_id"] = [doc["_source_id"] for doc in norm_docs]
+        df = df[df["timestamp"].notna()].reset_index(drop=True)
+        if df.empty:
+            return 0
+
+        # Catálogo de sensores por dispositivo (incremental)
+        if record_catalog:
+            record_readings(self.db, df)
+
+        manager = self.device_manager()
+        severity = evaluate_severity(df, manager)
+        devices = df["device_id"].unique().tolist()
+        transitions = detect_transitions(df, severity, self.previous_severity(devices))
+
+        sensor_cols = [c for c in df.columns if c not in ("timestamp", "device_id", "location", "alerts", "_source_id")]
+        now = datetime.now(timezone.utc)
+
+        if not transitions.empty:
+            events = []
+            for row in transitions.to_dict("records"):
+                events.append({
+                    "_id": row["_source_id"],
+                    "device_id": row["device_id"],
+                    "location": row.get("location"),
+                    "timestamp": row["timestamp"].to_pydatetime(),
+                    "from": severity_label(row["from_severity"]),
+                    "to": severity_label(row["to_severity"]),
+                    "sensor_data": {c: float(row[c]) for c in sensor_cols if row.get(c) == row.get(c) and row.get(c) is not None},
+                    "alerts": row.get("alerts") or [],
+                    "created_at": now,
+                })
+            try:
+                self.events.insert_many(events, ordered=False)
+            except BulkWriteError as e:
+                # Duplicados (lote reprocesado tras un reinicio): se ignoran
+                non_duplicate = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+                if non_duplicate:
+                    raise
+            self.events_written += len(events)
+
+        # Estado actual por dispositivo (solo si la lectura es más nueva que la guardada)
+        updates = []
+        for row in latest_per_device(df, severity).to_dict("records"):
+            ts = row["timestamp"].to_pydatetime()
+            updates.append(UpdateOne(
+                {"_id": row["device_id"], "$or": [{"timestamp": {"$lte": ts}}, {"timestamp": {"$exists": False}}]},
+                {"$set": {
+                    "health": severity_label(row["_severity"]),
+                    "severity": int(row["_severity"]),
+                    "timestamp": ts,
+                    "location": row.get("location"),
+                    "reading_id": row["_source_id"],
+                    "updated_at": now,
+                }},
+                upsert=True,
+            ))
+        if updates:
+            try:
+                self.state.bulk_write(updates, ordered=False)
+            except BulkWriteError as e:
+                # Upsert que choca con un estado más nuevo (lectura atrasada): se ignora
+                non_duplicate = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+                if non_duplicate:
+                    raise
+
+        return len(transitions)
+
+    # --- Modos de seguimiento ---
+    def run_polling(self, batch_size: int, poll_interval: float, settle_seconds: float,
+                    backfill_hours: float, once: bool = False) -> ObjectId:
+        """Sigue lecturas nuevas por _id. Con once=True devuelve el _id hasta el que se evaluó."""
+        last_id = self.load_watermark(backfill_hours)
+        self.ensure_catalog(last_id)
+        self.seed_state(last_id)
+        print(f"[alert_evaluator] Polling por _id desde {last_id} (lotes de {batch_size})")
+        while True:
+            upper = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=settle_seconds))
+            t0 = time.perf_counter()
+            raw_docs = list(self.readings.find({"_id": {"$gt": last_id, "$lt": upper}}, PROJECTION)
+                            .sort("_id", 1).limit(batch_size))
+            if raw_docs:
+                n_events = self.process_batch(raw_docs)
+                last_id = raw_docs[-1]["_id"]
+                elapsed = time.perf_counter() - t0
+                print(f"[alert_evaluator] {len(raw_docs):,} lecturas, {n_events} transiciones "
+                      f"({len(raw_docs) / max(elapsed, 1e-9):,.0f} lecturas/s)")
+            self.heartbeat(last_id=last_id)
+
+            if len(raw_docs) < batch_size:
+                if once:
+                    return last_id
+                time.sleep(poll_interval)
+
+    def run_change_stream(self, batch_size: int, poll_interval: float, backfill_hours: float):
+        state = self.state.find_one({"_id": EVALUATOR_ID}) or {}
+        resume_token = state.get("resume_token")
+        options = {"resume_after": resume_token} if resume_token else {}
+
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        with self.readings.watch(pipeline, max_await_time_ms=int(poll_interval * 1000), **options) as stream:
+            caught_up_id = None
+            if resume_token:
+                self.seed_state(self.load_watermark(backfill_hours))
+            else:
+                # Sin token: el stream se abre ANTES de ponerse al día por _id, así lo que se
+                # inserte durante la puesta al día queda en el stream en lugar de perderse
+                caught_up_id = self.run_polling(batch_size, poll_interval, 0, backfill_hours, once=True)
+            print("[alert_evaluator] Escuchando change stream de inserciones")
+            batch: List[Dict[str, Any]] = []
+            deadline = time.monotonic() + poll_interval
+            while stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    doc = change["fullDocument"]
+                    # Lo ya evaluado en la puesta al día no se reprocesa
+                    if caught_up_id is None or doc["_id"] > caught_up_id:
+                        batch.append(doc)
+                if batch and (len(batch) >= batch_size or time.monotonic() >= deadline):
+                    n_events = self.process_batch(batch)
+                    print(f"[alert_evaluator] {len(batch):,} lecturas, {n_events} transiciones")
+                    self.heartbeat(last_id=batch[-1]["_id"], resume_token=stream.resume_token)
+                    batch = []
+                if time.monotonic() >= deadline:
+                    if not batch:
+                        self.heartbeat(resume_token=stream.resume_token)
+                    deadline = time.monotonic() + poll_interval
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Evaluador de alertas en segundo plano")
+    parser.add_argument("--batch-size", type=int, default=20000, help="Lecturas por lote")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Segundos entre consultas si no hay pendientes")
+    parser.add_argument("--settle-seconds", type=float, default=5.0,
+                        help="Atraso tolerado para inserciones concurrentes (modo polling)")
+    parser.add_argument("--backfill-hours", type=float, default=0.0,
+                        help="Horas hacia atrás a evaluar si no hay marca de agua previa")
+    parser.add_argument("--change-stream", action="store_true", help="Usar change streams en lugar de polling")
+    parser.add_argument("--once", action="store_true", help="Procesar lo pendiente y terminar (modo cron)")
+    args = parser.parse_args(argv)
+
+    db = DatabaseConnection()
+    if db.collection is None:
+        print("[ERROR] No se pudo conectar a MongoDB")
+        return
+
+    evaluator = AlertEvaluator(db)
+    evaluator.events.create_index([("device_id", 1), ("timestamp", -1)])
+    try:
+        if args.change_stream and not args.once:
+            evaluator.run_change_stream(args.batch_size, args.poll_interval, args.backfill_hours)
+        else:
+            evaluator.run_polling(args.batch_size, args.poll_interval, args.settle_seconds,
+                                  args.backfill_hours, once=args.once)
+    except KeyboardInterrupt:
+        pass
+    print(f"[OK] Evaluador detenido: {evaluator.processed:,} lecturas, {evaluator.events_written:,} eventos.")
+
+
+if __name__ == "__main__":
+    main()
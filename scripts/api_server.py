@@ -0,0 +1,318 @@
+"""
+API HTTP de solo lectura para consumidores automáticos (controladores, Grafana).
+
+Corre junto a la app (proceso aparte, sin Streamlit) y reutiliza DatabaseConnection,
+DeviceManager y los mismos cachés de frames: el historial pasa por
+cargar_datos_rango, así que con CACHE_BACKEND configurado comparte lo que ya
+cargaron las réplicas del dashboard (y al revés).
+
+Endpoints (GET):
+    /latest                                        Última lectura por dispositivo.
+    /devices/{id}/history?start=&end=&bucket=&sensors=
+                                                   Historial de un dispositivo. start/end en ISO,
+                                                   hora local de APP_TIMEZONE (por defecto las
+                                                   últimas 24 h); bucket opcional (5min, 1h, 1D)
+                                                   promedia cada sensor por intervalo; sensors
+                                                   opcional (p.ej. ph,temperature) limita los
+                                                   campos que se leen de MongoDB.
+    /health-summary                                Conexión y salud por dispositivo + totales.
+    /metrics                                       Métricas Prometheus de este proceso (modules/metrics.py).
+
+Formato: JSON por defecto; Arrow IPC (stream) con ?format=arrow o
+Accept: application/vnd.apache.arrow.stream. Las fechas van en hora local naive,
+igual que en el dashboard.
+
+Caché HTTP: cada respuesta lleva un ETag derivado de la versión de los datos
+(_id de la lectura más reciente). Un If-None-Match que coincide responde 304 sin
+volver a consultar ni serializar.
+
+Ejemplos:
+    python scripts/api_server.py --port 8600
+    curl http://localhost:8600/devices/biofloc-01/history?start=2024-06-01T00:00&bucket=1h
+    curl -H 'Accept: application/vnd.apache.arrow.stream' http://localhost:8600/latest -o latest.arrow
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import pandas as pd
+import pyarrow as pa
+
+from modules.cache_backend import table_to_bytes
+from modules.config_manager import ConfigManager
+from modules.database import DatabaseConnection
+from modules.device_manager import DeviceManager
+from modules.frame_cache import cached_frame
+from modules.local_time import get_zone, now_local
+from modules.metrics import REGISTRY
+from modules.sensor_aliases import canonical_sensor
+from views.history import cargar_datos_rango
+
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+# La versión de los datos se consulta como máximo una vez por este intervalo
+VERSION_TTL_SECONDS = 1.0
+# Conexión (online/offline) cambia con el reloj aunque no lleguen datos: el ETag de salud rota con esta ventana
+HEALTH_ETAG_WINDOW_SECONDS = 10
+THRESHOLDS_TTL_SECONDS = 60
+MAX_HISTORY_DAYS = 31
+HISTORY_ROUTE = re.compile(r"^/devices/([^/]+)/history/?$")
+
+
+class ApiError(Exception):
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class DataVersion:
+    """_id de la lectura más reciente (consulta por índice, cacheada VERSION_TTL_SECONDS)."""
+
+    def __init__(self, db: DatabaseConnection):
+        self.db = db
+        self._lock = threading.Lock()
+        self._value = ""
+        self._checked_at = 0.0
+
+    def current(self) -> str:
+        with self._lock:
+            if time.monotonic() - self._checked_at < VERSION_TTL_SECONDS:
+                return self._value
+            try:
+                doc = self.db.collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+                self._value = str(doc["_id"]) if doc else "empty"
+            except Exception as e:
+                print(f"[api_server] Error leyendo versión de datos: {e}")
+                self._value = f"error-{int(time.time())}"
+            self._checked_at = time.monotonic()
+            return self._value
+
+
+@cached_frame("api_latest", ttl=30)
+def latest_frame(version: str) -> pd.DataFrame:
+    """Última lectura por dispositivo (la versión en la clave invalida al llegar datos nuevos)."""
+    return DatabaseConnection().get_latest_by_device()
+
+
+def flatten_latest(df: pd.DataFrame) -> pd.DataFrame:
+    """sensor_data {nombre: valor} a una columna por sensor."""
+    if df.empty:
+        return df
+    sensors = pd.DataFrame([s if isinstance(s, dict) else {} for s in df["sensor_data"]], index=df.index)
+    sensors = sensors.apply(pd.to_numeric, errors="coerce")
+    base = df[["device_id", "location", "timestamp"]]
+    return pd.concat([base, sensors], axis=1).sort_values("device_id", ignore_index=True)
+
+
+def parse_local_datetime(value: Optional[str], name: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ApiError(400, f"{name} inválido: '{value}' (usar ISO, p.ej. 2024-06-01T08:00)")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(get_zone()).replace(tzinfo=None)
+    return parsed
+
+
+def parse_sensors(raw: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """"ph,Temperatura" -> ("ph", "temperature"): nombres canónicos ordenados (clave de caché estable)."""
+    if not raw:
+        return None
+    sensors = {canonical_sensor(name) for name in raw.split(",") if name.strip()}
+    return tuple(sorted(sensors)) or None
+
+
+def device_history(device_id: str, start: Optional[str], end: Optional[str], bucket: Optional[str],
+                   sensors: Optional[str] = None) -> pd.DataFrame:
+    end_dt = parse_local_datetime(end, "end")
+    if end_dt is None:
+        # Redondeado al minuto siguiente: la clave de caché se mantiene estable durante ese minuto
+        end_dt = now_local().replace(second=0, microsecond=0) + timedelta(minutes=1)
+    start_dt = parse_local_datetime(start, "start") or end_dt - timedelta(hours=24)
+    if start_dt >= end_dt:
+        raise ApiError(400, "start debe ser anterior a end")
+    if end_dt - start_dt > timedelta(days=MAX_HISTORY_DAYS):
+        raise ApiError(400, f"Rango máximo: {MAX_HISTORY_DAYS} días")
+
+    offset = None
+    if bucket:
+        try:
+            offset = pd.tseries.frequencies.to_offset(bucket)
+        except ValueError:
+            raise ApiError(400, f"bucket inválido: '{bucket}' (p.ej. 5min, 1h, 1D)")
+
+    df = cargar_datos_rango(start_dt, end_dt, [device_id], parse_sensors(sensors)).to_pandas()
+    if df.empty:
+        return pd.DataFrame(columns=["timestamp", "device_id", "location"])
+    df = df.sort_values("timestamp", ignore_index=True)
+    if offset is None:
+        return df
+
+    sensor_cols = [c for c in df.select_dtypes(include=["number"]).columns]
+    grouped = df.set_index("timestamp").resample(offset)
+    result = grouped[sensor_cols].mean()
+    result.insert(0, "samples", grouped.size())
+    result = result[result["samples"] > 0].reset_index()
+    result.insert(1, "device_id", device_id)
+    return result
+
+
+class ApiService:
+    """Arma las respuestas; el handler HTTP solo enruta y serializa."""
+
+    def __init__(self, db: DatabaseConnection):
+        self.db = db
+        self.version = DataVersion(db)
+        self._manager_lock = threading.Lock()
+        self._thresholds: Optional[Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]] = None
+        self._thresholds_loaded_at = 0.0
+
+    def thresholds(self) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        """(globales, por dispositivo), misma fuente que el dashboard; recargados cada THRESHOLDS_TTL_SECONDS."""
+        with self._manager_lock:
+            if self._thresholds is None or time.monotonic() - self._thresholds_loaded_at > THRESHOLDS_TTL_SECONDS:
+                config_manager = ConfigManager(self.db)
+                all_meta = config_manager.get_device_metadata()
+                self._thresholds = (config_manager.get_all_configured_sensors(),
+                                    {k: v.get('thresholds', {}) for k, v in all_meta.items()})
+                self._thresholds_loaded_at = time.monotonic()
+            return self._thresholds
+
+    def etag(self, path: str, query: Dict[str, List[str]], fmt: str) -> str:
+        parts = [path, fmt, self.version.current(), json.dumps(query, sort_keys=True)]
+        if path == "/health-summary":
+            parts.append(str(int(time.time() // HEALTH_ETAG_WINDOW_SECONDS)))
+        return '"' + hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest() + '"'
+
+    def latest(self) -> pd.DataFrame:
+        return flatten_latest(latest_frame(self.version.current()))
+
+    def health_summary(self) -> Tuple[pd.DataFrame, Dict[str, int]]:
+        global_thresholds, dev_specifics = self.thresholds()
+        manager = DeviceManager(global_thresholds, {}, dev_specifics,
+                                precomputed_health=self.db.get_precomputed_health())
+        devices = manager.get_all_devices_info(latest_frame(self.version.current()))
+        rows = [{
+            "device_id": d.device_id,
+            "location": d.location,
+            "last_update": d.last_update,
+            "connection": d.connection.value,
+            "health": d.health.value,
+            "alerts": d.alerts,
+        } for d in devices]
+        frame = pd.DataFrame(rows, columns=["device_id", "location", "last_update", "connection", "health", "alerts"])
+        return frame.sort_values("device_id", ignore_index=True), manager.calculate_summary_metrics(devices)
+
+
+def frame_to_json(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    return json.loads(df.to_json(orient="records", date_format="iso", date_unit="s"))
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    service: ApiService = None
+    server_version = "BioflocAPI/1.0"
+
+    def do_GET(self):
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        path = url.path.rstrip("/") or "/"
+        query = parse_qs(url.query)
+        fmt = "arrow" if (query.get("format", [""])[0] == "arrow"
+                          or ARROW_MIME in self.headers.get("Accept", "")) else "json"
+        if path == "/metrics":
+            self._send(200, REGISTRY.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+            return
+        try:
+            history_match = HISTORY_ROUTE.match(path)
+            if path not in ("/latest", "/health-summary") and not history_match:
+                raise ApiError(404, f"Ruta desconocida: {path}")
+
+            etag = self.service.etag(path, query, fmt)
+            if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                self._send(304, b"", None, etag)
+                return
+
+            if path == "/latest":
+                body, content_type = self._encode(self.service.latest(), fmt)
+            elif path == "/health-summary":
+                devices, summary = self.service.health_summary()
+                body, content_type = self._encode(devices, fmt, {"summary": summary})
+            else:
+                device_id = unquote(history_match.group(1))
+                df = device_history(device_id, query.get("start", [None])[0], query.get("end", [None])[0],
+                                    query.get("bucket", [None])[0], query.get("sensors", [None])[0])
+                body, content_type = self._encode(df, fmt, {"device_id": device_id})
+            self._send(200, body, content_type, etag)
+        except ApiError as e:
+            self._send(e.status, json.dumps({"error": str(e)}).encode("utf-8"), "application/json")
+        except Exception as e:
+            print(f"[api_server] Error en {self.path}: {e}")
+            self._send(500, json.dumps({"error": "Error interno"}).encode("utf-8"), "application/json")
+        finally:
+            print(f"[api_server] GET {self.path} ({fmt}) {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def _encode(self, df: pd.DataFrame, fmt: str, extra: Optional[Dict[str, Any]] = None) -> Tuple[bytes, str]:
+        if fmt == "arrow":
+            return table_to_bytes(pa.Table.from_pandas(df, preserve_index=False)), ARROW_MIME
+        payload = {"timezone": str(get_zone()), **(extra or {}), "data": frame_to_json(df)}
+        return json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+
+    def _send(self, status: int, body: bytes, content_type: Optional[str], etag: Optional[str] = None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # El registro por request lo hace do_GET (con duración)
+        pass
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="API HTTP de solo lectura (JSON / Arrow)")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"), help="Interfaz a escuchar")
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", 8600)), help="Puerto")
+    args = parser.parse_args(argv)
+
+    db = DatabaseConnection()
+    if db.collection is None:
+        print("[ERROR] No se pudo conectar a MongoDB")
+        return 1
+
+    ApiHandler.service = ApiService(db)
+    server = ThreadingHTTPServer((args.host, args.port), ApiHandler)
+    print(f"[api_server] Escuchando en http://{args.host}:{args.port} (/latest, /devices/<id>/history, /health-summary)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    print("[OK] API detenida.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Benchmarks offline de los caminos críticos de la capa de datos.
+No necesita MongoDB: trabaja sobre documentos sintéticos generados con
+load_generator.py (misma mezcla de esquemas legacy que en producción).
+
+Mide:
+    - DatabaseConnection._normalize_document(s) / _parse_historical_flat / _rows_to_dataframe
+    - timestamp_decoder.parse_timestamp_strings (timestamps ISO de texto)
+    - views.graphs.filtrar_dataframe / sensor_aliases.normalize_sensor_columns
+    - DeviceManager.get_all_devices_info
+    - views.dashboard.build_card_html
+
+Los resultados se guardan en JSON para comparar contra una corrida base:
+    python scripts/benchmark_data_layer.py --output base.json
+    python scripts/benchmark_data_layer.py --baseline base.json --output nuevo.json
+    python scripts/benchmark_data_layer.py --quick          # solo escalas pequeñas
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import pandas as pd
+
+from load_generator import build_fleet, iter_readings, parse_schema_mix, DEFAULT_SCHEMA_MIX
+from modules.database import DatabaseConnection
+from modules.device_manager import DeviceManager
+from modules.sensor_registry import SensorRegistry
+from modules.timestamp_decoder import parse_timestamp_strings
+from views.dashboard import build_card_html
+from modules.sensor_aliases import normalize_sensor_columns
+from views.graphs import filtrar_dataframe
+
+ROW_SCALES = [1_000, 100_000, 1_000_000]
+DEVICE_SCALES = [10, 100, 1_000]
+QUICK_ROW_SCALES = [1_000, 10_000]
+QUICK_DEVICE_SCALES = [10, 100]
+
+SENSORS_PER_DEVICE = 4
+HISTORY_DEVICES = 50  # Dispositivos en los datasets de historial (escala por filas)
+
+
+def _offline_db() -> DatabaseConnection:
+    """DatabaseConnection sin cliente: los métodos medidos no tocan la red."""
+    db = DatabaseConnection.__new__(DatabaseConnection)
+    db.client = None
+    return db
+
+
+def synthetic_raw_docs(n_rows: int, n_devices: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Documentos crudos tal como los guarda el firmware (mezcla de esquemas)."""
+    fleet = build_fleet(n_devices, SENSORS_PER_DEVICE, parse_schema_mix(DEFAULT_SCHEMA_MIX), seed)
+    steps = max(1, -(-n_rows // n_devices))
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(seconds=60 * steps)
+    docs = []
+    for doc in iter_readings(fleet, start, end, 60, random.Random(seed)):
+        docs.append(doc)
+        if len(docs) >= n_rows:
+            break
+    return docs
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Ejecuta fn `repeat` veces y devuelve min/mediana en segundos."""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return {"min_s": min(timings), "median_s": statistics.median(timings), "repeat": repeat}
+
+
+def _repeat_for(n: int, base_repeat: int) -> int:
+    # Las escalas grandes tardan segundos por corrida: con una o dos basta
+    if n >= 1_000_000:
+        return 1
+    if n >= 100_000:
+        return min(base_repeat, 2)
+    return base_repeat
+
+
+def bench_rows(n_rows: int, base_repeat: int) -> List[Dict[str, Any]]:
+    db = _offline_db()
+    repeat = _repeat_for(n_rows, base_repeat)
+    results = []
+
+    raw_docs = synthetic_raw_docs(n_rows, HISTORY_DEVICES)
+    norm_docs = db._normalize_documents(raw_docs)
+
+    stats = measure(lambda: [db._normalize_document(d) for d in raw_docs], repeat)
+    results.append({"name": "DatabaseConnection._normalize_document", "scale": n_rows, "unit": "rows", **stats})
+
+    stats = measure(lambda: db._normalize_documents(raw_docs), repeat)
+    results.append({"name": "DatabaseConnection._normalize_documents", "scale": n_rows, "unit": "rows", **stats})
+
+    # Timestamps ISO como los escribe el firmware antiguo: columna completa de texto
+    base = datetime.now(timezone.utc)
+    iso_strings = [(base - timedelta(seconds=i)).isoformat() for i in range(n_rows)]
+    stats = measure(lambda: parse_timestamp_strings(iso_strings), repeat)
+    results.append({"name": "timestamp_decoder.parse_timestamp_strings[iso]", "scale": n_rows, "unit": "rows", **stats})
+    del iso_strings
+
+    stats = measure(lambda: db._parse_historical_flat(norm_docs), repeat)
+    results.append({"name": "DatabaseConnection._parse_historical_flat", "scale": n_rows, "unit": "rows", **stats})
+
+    df = db._parse_historical_flat(norm_docs)
+    del raw_docs, norm_docs
+
+    # Columnas con alias (como llegan de esquemas mixtos) para normalize_sensor_columns
+    df_aliases = df.rename(columns={"temperature": "temp"})
+    df_aliases["temperatura"] = df_aliases["temp"].where(df_aliases.index % 2 == 0)
+    stats = measure(lambda: normalize_sensor_columns(df_aliases), repeat)
+    results.append({"name": "sensor_aliases.normalize_sensor_columns", "scale": n_rows, "unit": "rows", **stats})
+    del df_aliases
+
+    df = df.sort_values("timestamp")
+    devices = sorted(df["device_id"].unique().tolist())[:5]
+    for label, delta in (("1h", timedelta(hours=1)), ("1w", timedelta(weeks=1))):
+        stats = measure(lambda: filtrar_dataframe(df, devices, delta), repeat)
+        results.append({"name": f"views.graphs.filtrar_dataframe[{label}]", "scale": n_rows, "unit": "rows", **stats})
+
+    return results
+
+
+def bench_devices(n_devices: int, base_repeat: int) -> List[Dict[str, Any]]:
+    db = _offline_db()
+    repeat = _repeat_for(n_devices * 100, base_repeat)
+    results = []
+
+    # Una lectura reciente por dispositivo (equivalente a get_latest_by_device)
+    norm_docs = [db._normalize_document(d) for d in synthetic_raw_docs(n_devices, n_devices)]
+    stats = measure(lambda: db._rows_to_dataframe(norm_docs), repeat)
+    results.append({"name": "DatabaseConnection._rows_to_dataframe", "scale": n_devices, "unit": "devices", **stats})
+
+    latest_df = db._rows_to_dataframe(norm_docs)
+    SensorRegistry._ensure_loaded()
+    thresholds = {k: v.to_dict() for k, v in SensorRegistry._defaults.items()}
+
+    stats = measure(lambda: DeviceManager(thresholds, {}).get_all_devices_info(latest_df), repeat)
+    results.append({"name": "DeviceManager.get_all_devices_info", "scale": n_devices, "unit": "devices", **stats})
+
+    devices = DeviceManager(thresholds, {}).get_all_devices_info(latest_df)
+    stats = measure(lambda: [build_card_html(d, thresholds) for d in devices], repeat)
+    results.append({"name": "views.dashboard.build_card_html", "scale": n_devices, "unit": "devices", **stats})
+
+    return results
+
+
+def print_table(results: List[Dict[str, Any]], baseline: Optional[Dict[str, Any]] = None):
+    base_index = {}
+    if baseline:
+        base_index = {(r["name"], r["scale"]): r for r in baseline.get("results", [])}
+
+    header = f"{'Caso':<50} {'Escala':>17} {'Mediana':>12} {'Items/s':>14}"
+    if base_index:
+        header += f" {'Base':>12} {'Cambio':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        throughput = r["scale"] / r["median_s"] if r["median_s"] > 0 else float("inf")
+        line = f"{r['name']:<50} {r['scale']:>9,} {r['unit']:<7} {r['median_s'] * 1000:>9.1f} ms {throughput:>14,.0f}"
+        base = base_index.get((r["name"], r["scale"]))
+        if base:
+            ratio = r["median_s"] / base["median_s"] if base["median_s"] > 0 else float("inf")
+            line += f" {base['median_s'] * 1000:>9.1f} ms {ratio:>8.2f}x"
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmarks offline de la capa de datos")
+    parser.add_argument("--rows", type=int, nargs="*", help=f"Escalas de filas (por defecto {ROW_SCALES})")
+    parser.add_argument("--devices", type=int, nargs="*", help=f"Escalas de dispositivos (por defecto {DEVICE_SCALES})")
+    parser.add_argument("--quick", action="store_true", help="Solo escalas pequeñas (chequeo rápido)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones por caso en escalas pequeñas")
+    parser.add_argument("--output", default="bench_output.json", help="Archivo JSON de resultados")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args(argv)
+
+    row_scales = args.rows or (QUICK_ROW_SCALES if args.quick else ROW_SCALES)
+    device_scales = args.devices or (QUICK_DEVICE_SCALES if args.quick else DEVICE_SCALES)
+
+    results = []
+    for n in row_scales:
+        print(f"[bench] Escala {n:,} filas...")
+        results.extend(bench_rows(n, args.repeat))
+    for n in device_scales:
+        print(f"[bench] Escala {n:,} dispositivos...")
+        results.extend(bench_devices(n, args.repeat))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print()
+    print_table(results, baseline)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[OK] Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Benchmarks end-to-end de las consultas contra un mongod LOCAL con datos de prueba.
+Complementa a benchmark_data_layer.py (que es solo en memoria): aquí se mide lo
+que realmente duele en producción, la agregación de get_latest_by_device, las
+consultas $or por timestamp de cargar_datos_rango y la carga semanal de
+cargar_historial_completo.
+
+Flujo:
+    1. Siembra (una sola vez, reproducible por seed) un dataset con load_generator.py.
+    2. Ejecuta cada camino de lectura en frío y en caliente.
+    3. Captura las consultas reales emitidas (command monitoring) y sus `explain`.
+    4. Imprime una tabla comparativa y guarda JSON (opcionalmente contra una base).
+
+Ejemplos:
+    python scripts/benchmark_queries.py --devices 200 --days 30
+    python scripts/benchmark_queries.py --indexes recommended --baseline sin_indices.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from bson import SON
+from pymongo import MongoClient, monitoring
+
+import load_generator
+
+BENCH_META_COLLECTION = "_bench_meta"
+RECOMMENDED_INDEXES = [
+    [("timestamp", -1)],
+    [("timestamp", -1), ("_id", -1)],
+    [("device_id", 1), ("timestamp", -1)],
+    [("dispositivo_id", 1), ("timestamp", -1)],
+]
+
+
+class QueryRecorder(monitoring.CommandListener):
+    """Registra los find/aggregate que emite la app para luego hacer explain."""
+
+    def __init__(self):
+        self.commands: List[SON] = []
+        self.enabled = False
+
+    def started(self, event):
+        if self.enabled and event.command_name in ("find", "aggregate"):
+            cmd = SON((k, v) for k, v in event.command.items()
+                      if not k.startswith("$") and k not in ("lsid", "txnNumber", "cursor", "batchSize"))
+            if event.command_name == "aggregate":
+                cmd["cursor"] = {}
+            self.commands.append(cmd)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def ensure_dataset(client: MongoClient, args) -> Dict[str, Any]:
+    """Siembra el dataset solo si no existe uno con los mismos parámetros."""
+    fingerprint = {
+        "devices": args.devices, "sensors": args.sensors, "rate": args.rate,
+        "days": args.days, "schema_mix": args.schema_mix, "seed": args.seed,
+    }
+    meta_coll = client[args.db][BENCH_META_COLLECTION]
+    current = meta_coll.find_one({"_id": args.collection}) or {}
+
+    if current.get("fingerprint") == fingerprint and not args.reseed:
+        print(f"[bench] Dataset existente reutilizado ({current.get('count', 0):,} documentos)")
+        return fingerprint
+
+    print("[bench] Sembrando dataset de prueba...")
+    load_generator.main([
+        "--uri", args.uri, "--db", args.db, "--collection", args.collection,
+        "--devices", str(args.devices), "--sensors", str(args.sensors),
+        "--rate", str(args.rate), "--days", str(args.days),
+        "--schema-mix", args.schema_mix, "--seed", str(args.seed), "--drop",
+    ])
+    count = client[args.db][args.collection].estimated_document_count()
+    meta_coll.replace_one({"_id": args.collection},
+                          {"fingerprint": fingerprint, "count": count, "created_at": datetime.now()}, upsert=True)
+    return fingerprint
+
+
+def apply_index_mode(collection, mode: str):
+    if mode == "none":
+        collection.drop_indexes()
+        print("[bench] Índices secundarios eliminados")
+    elif mode == "recommended":
+        for keys in RECOMMENDED_INDEXES:
+            collection.create_index(keys)
+        print(f"[bench] Índices recomendados creados: {RECOMMENDED_INDEXES}")
+    print(f"[bench] Índices actuales: {sorted(collection.index_information().keys())}")
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Extrae lo relevante de un explain (plan ganador y trabajo realizado)."""
+    planner = explain.get("queryPlanner")
+    stats = explain.get("executionStats")
+    # En agregaciones el plan viene dentro de la etapa $cursor
+    if planner is None:
+        for stage in explain.get("stages", []):
+            cursor = stage.get("$cursor")
+            if cursor:
+                planner = cursor.get("queryPlanner")
+                stats = cursor.get("executionStats")
+                break
+    planner = planner or {}
+    stats = stats or {}
+
+    stages = []
+    node = planner.get("winningPlan", {})
+    node = node.get("queryPlan", node)  # Formato del motor SBE
+    while node:
+        stages.append(node.get("stage", "?"))
+        if "inputStage" in node:
+            node = node["inputStage"]
+        elif node.get("inputStages"):
+            node = node["inputStages"][0]
+        else:
+            node = None
+
+    return {
+        "plan": " <- ".join(stages) or "?",
+        "n_returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "explain_ms": stats.get("executionTimeMillis"),
+    }
+
+
+def run_case(name: str, fn: Callable[[], Any], repeat: int, recorder: QueryRecorder,
+             clear: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    if clear:
+        clear()
+    recorder.commands = []
+    recorder.enabled = True
+    t0 = time.perf_counter()
+    result = fn()
+    cold = time.perf_counter() - t0
+    recorder.enabled = False
+    commands = list(recorder.commands)
+
+    warm = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        warm.append(time.perf_counter() - t0)
+
+    rows = len(result) if hasattr(result, "__len__") else None
+    return {
+        "name": name,
+        "cold_s": cold,
+        "warm_median_s": statistics.median(warm) if warm else None,
+        "rows": rows,
+        "queries": len(commands),
+        "_commands": commands,
+    }
+
+
+def attach_explains(db, results: List[Dict[str, Any]]):
+    for r in results:
+        commands = r.pop("_commands")
+        r["explain"] = []
+        for cmd in commands:
+            try:
+                raw = db.command("explain", cmd, verbosity="executionStats")
+                r["explain"].append(summarize_explain(raw))
+            except Exception as e:
+                r["explain"].append({"plan": f"error: {e}"})
+
+
+def print_table(results: List[Dict[str, Any]], baseline: Optional[Dict[str, Any]] = None):
+    base_index = {r["name"]: r for r in (baseline or {}).get("results", [])}
+    header = f"{'Camino':<42} {'Frío':>10} {'Caliente':>10} {'Filas':>9} {'Docs exam.':>11} {'Keys exam.':>11}  Plan"
+    if base_index:
+        header += "  | Base frío/caliente"
+    print(header)
+    print("-" * len(header))
+
+    def ms(v):
+        return f"{v * 1000:8.1f}ms" if v is not None else f"{'-':>10}"
+
+    for r in results:
+        first = r["explain"][0] if r["explain"] else {}
+        docs = sum(e.get("docs_examined") or 0 for e in r["explain"])
+        keys = sum(e.get("keys_examined") or 0 for e in r["explain"])
+        line = (f"{r['name']:<42} {ms(r['cold_s'])} {ms(r['warm_median_s'])} {r['rows'] if r['rows'] is not None else '-':>9} "
+                f"{docs:>11,} {keys:>11,}  {first.get('plan', '-')}")
+        base = base_index.get(r["name"])
+        if base:
+            line += f"  | {ms(base['cold_s'])} {ms(base['warm_median_s'])}"
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmarks de consultas contra un mongod local")
+    parser.add_argument("--uri", default=load_generator.DEFAULT_URI)
+    parser.add_argument("--db", default=load_generator.DEFAULT_DB)
+    parser.add_argument("--collection", default="SensorReadings_BENCH")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--sensors", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=60.0)
+    parser.add_argument("--days", type=float, default=14.0)
+    parser.add_argument("--schema-mix", default=load_generator.DEFAULT_SCHEMA_MIX)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reseed", action="store_true", help="Regenerar el dataset aunque ya exista")
+    parser.add_argument("--indexes", choices=["keep", "none", "recommended"], default="keep",
+                        help="Estado de índices antes de medir")
+    parser.add_argument("--repeat", type=int, default=3, help="Corridas en caliente por camino")
+    parser.add_argument("--output", default="bench_queries.json")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args(argv)
+
+    client = MongoClient(args.uri, tz_aware=True)
+    try:
+        client.admin.command("ping")
+    except Exception as e:
+        print(f"[ERROR] Error de conexion: {e}")
+        return
+
+    fingerprint = ensure_dataset(client, args)
+    apply_index_mode(client[args.db][args.collection], args.indexes)
+
+    # La app lee la conexión desde variables de entorno: apuntarla al dataset local
+    os.environ["MONGO_URI"] = args.uri
+    os.environ["MONGO_DB"] = args.db
+    os.environ["MONGO_COLLECTION"] = args.collection
+    os.environ["MONGO_TLS"] = "false"
+
+    recorder = QueryRecorder()
+    monitoring.register(recorder)
+
+    from modules.database import DatabaseConnection
+    from views.graphs import cargar_historial_completo
+    from views.history import cargar_datos_rango
+
+    app_db = DatabaseConnection()
+    if app_db.collection is None:
+        print("[ERROR] La app no pudo conectarse al dataset local")
+        return
+
+    sample_doc = client[args.db][args.collection].find_one({"device_id": {"$exists": True}}, {"device_id": 1})
+    sample_device = (sample_doc or {}).get("device_id", "")
+    now = datetime.now()
+
+    cases = [
+        ("DatabaseConnection.get_latest_by_device[aggregate]",
+         lambda: app_db.get_latest_by_device(strategy="aggregate"), None),
+        ("DatabaseConnection.get_latest_by_device[point]", lambda: app_db.get_latest_by_device(strategy="point"), None),
+        ("DatabaseConnection.get_latest_for_single_device", lambda: app_db.get_latest_for_single_device(sample_device), None),
+        ("DatabaseConnection.fetch_data", app_db.fetch_data, None),
+        ("views.graphs.cargar_historial_completo", cargar_historial_completo, None),
+        ("views.history.cargar_datos_rango[24h]", lambda: cargar_datos_rango(now - timedelta(hours=24), now, None),
+         cargar_datos_rango.clear),
+        ("views.history.cargar_datos_rango[7d]", lambda: cargar_datos_rango(now - timedelta(days=7), now, None),
+         cargar_datos_rango.clear),
+        ("DatabaseConnection.fetch_history_page[7d]", lambda: app_db.fetch_history_page(now - timedelta(days=7), now)[0], None),
+        ("DatabaseConnection.count_history_by_device[7d]",
+         lambda: app_db.count_history_by_device(now - timedelta(days=7), now), None),
+    ]
+
+    results = []
+    for name, fn, clear in cases:
+        print(f"[bench] {name}...")
+        results.append(run_case(name, fn, args.repeat, recorder, clear))
+    attach_explains(client[args.db], results)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print()
+    print_table(results, baseline)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "dataset": fingerprint,
+            "documents": client[args.db][args.collection].estimated_document_count(),
+            "indexes": sorted(client[args.db][args.collection].index_information().keys()),
+            "server_version": client.server_info().get("version"),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"\n[OK] Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Reporte de tiempos de import del arranque de la app.
+Ejecuta `python -X importtime` en un proceso limpio por cada punto de entrada
+(home.py sin vistas, y cada vista por separado) y muestra qué paquetes
+de terceros se llevan el tiempo. Sirve para vigilar el cold start del contenedor.
+
+Ejemplos:
+    python scripts/import_time_report.py
+    python scripts/import_time_report.py --top 25 --targets views.graphs
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Lo que se importa al arrancar (login) y lo que carga cada página al abrirse por primera vez
+DEFAULT_TARGETS = [
+    "modules.styles",
+    "modules.database",
+    "views.dashboard",
+    "views.graphs",
+    "views.history",
+    "views.settings",
+]
+
+
+def measure_imports(target: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """Importa `target` en un proceso nuevo; devuelve (segundos totales, [(módulo, self_us, cumulative_us)])."""
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else f"exit {proc.returncode}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        # Formato: "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    total = sum(self_us for _, self_us, _ in rows) / 1e6
+    return total, rows
+
+
+def top_packages(rows: List[Tuple[str, int, int]], top: int) -> List[Tuple[str, float]]:
+    """Tiempo propio agrupado por paquete raíz (pandas, plotly, pymongo...)."""
+    per_package: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        per_package[name.split(".")[0]] += self_us
+    ranked = sorted(per_package.items(), key=lambda kv: kv[1], reverse=True)
+    return [(pkg, us / 1e6) for pkg, us in ranked[:top]]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Tiempos de import por vista (python -X importtime)")
+    parser.add_argument("--targets", nargs="*", default=DEFAULT_TARGETS, help="Módulos a medir")
+    parser.add_argument("--top", type=int, default=10, help="Paquetes a listar por módulo")
+    args = parser.parse_args(argv)
+
+    for target in args.targets:
+        try:
+            total, rows = measure_imports(target)
+        except RuntimeError as e:
+            print(f"[ERROR] {target}: {e}")
+            continue
+
+        print(f"\n{target}: {total * 1000:.0f} ms en {len(rows)} módulos")
+        for pkg, seconds in top_packages(rows, args.top):
+            print(f"    {pkg:<28} {seconds * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
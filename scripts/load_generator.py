@@ -0,0 +1,272 @@
+"""
+Generador de carga sintética de alto volumen para Biofloc Monitor.
+Basado en mock_data_generator.py, pero configurable para pruebas de capacidad:
+N dispositivos, M sensores por dispositivo, frecuencia de muestreo, duración
+y una mezcla de esquemas legacy (dispositivo_id, datos, timestamps string/epoch).
+
+Pensado para un mongod LOCAL. Para apuntar a un cluster remoto hay que pasar
+--allow-remote de forma explícita.
+
+Ejemplos:
+    # 500 dispositivos, 6 sensores, 1 lectura/minuto durante 90 días
+    python scripts/load_generator.py --devices 500 --sensors 6 --rate 60 --days 90 --drop
+
+    # Modo "live": 50 dispositivos insertando una lectura cada 5 segundos
+    python scripts/load_generator.py --devices 50 --rate 5 --live
+"""
+
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from pymongo import MongoClient
+
+from mock_data_generator import SENSOR_VALUES
+
+DEFAULT_URI = os.getenv("LOADGEN_MONGO_URI", "mongodb://localhost:27017")
+DEFAULT_DB = os.getenv("LOADGEN_MONGO_DB", "BioflocLoadTest")
+DEFAULT_COLLECTION = os.getenv("LOADGEN_MONGO_COLLECTION", "SensorReadings_LOAD")
+
+LOCATIONS = ["Invernadero 1", "Invernadero 2", "Laboratorio", "Zona Tesis", "Exterior", "Cuarentena"]
+
+# Variantes de esquema que la app sigue soportando (ver DatabaseConnection._normalize_document).
+# Cada dispositivo recibe UNA variante (en la práctica depende del firmware del ESP32).
+SCHEMA_VARIANTS = ["canonical", "nested", "dispositivo_id", "datos", "iso", "epoch_s", "epoch_ms"]
+DEFAULT_SCHEMA_MIX = "canonical=60,nested=10,dispositivo_id=10,datos=10,iso=5,epoch_ms=5"
+
+# Unidades para la variante anidada {"value": ..., "unit": ...}
+SENSOR_UNITS = {"temperature": "C", "ph": "pH", "do": "mg/L", "ammonia": "mg/L", "nitrite": "mg/L", "nitrate": "mg/L"}
+
+
+def parse_schema_mix(mix: str) -> Dict[str, float]:
+    """Convierte 'canonical=60,iso=40' en pesos normalizados por variante."""
+    weights = {}
+    for part in mix.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCHEMA_VARIANTS:
+            raise ValueError(f"Variante de esquema desconocida: '{name}' (válidas: {', '.join(SCHEMA_VARIANTS)})")
+        weights[name] = float(weight) if weight else 1.0
+
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("La mezcla de esquemas debe tener al menos un peso positivo")
+    return {k: v / total for k, v in weights.items()}
+
+
+def build_fleet(n_devices: int, n_sensors: int, schema_mix: Dict[str, float], seed: int = 42) -> List[Dict[str, Any]]:
+    """Define la flota simulada de forma reproducible (mismo seed -> misma flota)."""
+    rng = random.Random(seed)
+    known_sensors = list(SENSOR_VALUES.keys())
+    # Si se piden más sensores de los conocidos, se completan con sensores genéricos
+    sensor_names = known_sensors[:n_sensors] + [f"sensor_{i:02d}" for i in range(max(0, n_sensors - len(known_sensors)))]
+
+    variants = list(schema_mix.keys())
+    weights = list(schema_mix.values())
+
+    fleet = []
+    for i in range(n_devices):
+        fleet.append({
+            "id": f"LOAD-{i:05d}",
+            "loc": LOCATIONS[i % len(LOCATIONS)],
+            "sensors": sensor_names,
+            "schema": rng.choices(variants, weights=weights, k=1)[0],
+        })
+    return fleet
+
+
+def build_reading(device: Dict[str, Any], ts: datetime, rng: random.Random, anomaly_rate: float = 0.0) -> Dict[str, Any]:
+    """Genera un documento crudo con el esquema asignado al dispositivo."""
+    schema = device["schema"]
+
+    sensors_data = {}
+    for sensor_name in device["sensors"]:
+        config = SENSOR_VALUES.get(sensor_name, {"base": 50.0, "range": 10.0})
+        if anomaly_rate and rng.random() < anomaly_rate and "critical_high" in config:
+            value = config["critical_high"] + rng.uniform(0, 2)
+        else:
+            value = config["base"] + rng.uniform(-config["range"], config["range"])
+        value = round(value, 2)
+
+        if schema == "nested":
+            sensors_data[sensor_name] = {"value": value, "unit": SENSOR_UNITS.get(sensor_name, ""), "valid": True}
+        else:
+            sensors_data[sensor_name] = value
+
+    if schema == "iso":
+        timestamp = ts.isoformat()
+    elif schema == "epoch_s":
+        timestamp = int(ts.timestamp())
+    elif schema == "epoch_ms":
+        timestamp = int(ts.timestamp() * 1000)
+    else:
+        timestamp = ts
+
+    doc = {
+        "dispositivo_id" if schema == "dispositivo_id" else "device_id": device["id"],
+        "timestamp": timestamp,
+        "location": device["loc"],
+        "datos" if schema == "datos" else "sensors": sensors_data,
+    }
+    return doc
+
+
+def iter_readings(fleet: List[Dict[str, Any]], start: datetime, end: datetime, rate_seconds: float,
+                  rng: random.Random, anomaly_rate: float = 0.0) -> Iterator[Dict[str, Any]]:
+    """Recorre el intervalo [start, end) emitiendo una lectura por dispositivo y paso."""
+    step = timedelta(seconds=rate_seconds)
+    current = start
+    while current < end:
+        for device in fleet:
+            yield build_reading(device, current, rng, anomaly_rate)
+        current += step
+
+
+def _insert_worker(uri: str, db_name: str, coll_name: str, fleet: List[Dict[str, Any]], start: datetime,
+                   end: datetime, rate_seconds: float, batch_size: int, seed: int, anomaly_rate: float) -> int:
+    """Proceso del pool: inserta las lecturas de su sub-flota en lotes desordenados."""
+    client = MongoClient(uri)
+    collection = client[db_name][coll_name]
+    rng = random.Random(seed)
+
+    inserted = 0
+    batch = []
+    for doc in iter_readings(fleet, start, end, rate_seconds, rng, anomaly_rate):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+
+    client.close()
+    return inserted
+
+
+def run_backfill(args, fleet: List[Dict[str, Any]]):
+    """Carga histórica: reparte la flota entre procesos y escribe en paralelo."""
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=args.days, hours=args.hours)
+    expected = int((end - start).total_seconds() // args.rate) * len(fleet)
+
+    workers = max(1, min(args.workers, len(fleet)))
+    chunks = [fleet[i::workers] for i in range(workers)]
+
+    print(f"[INFO] {len(fleet)} dispositivos x {len(fleet[0]['sensors']) if fleet else 0} sensores, "
+          f"1 lectura cada {args.rate}s desde {start:%Y-%m-%d %H:%M} UTC")
+    print(f"[INFO] ~{expected:,} documentos esperados, {workers} procesos, lotes de {args.batch_size}")
+
+    t0 = time.time()
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_insert_worker, args.uri, args.db, args.collection, chunk, start, end,
+                        args.rate, args.batch_size, args.seed + idx, args.anomaly_rate)
+            for idx, chunk in enumerate(chunks) if chunk
+        ]
+        for future in as_completed(futures):
+            total += future.result()
+            elapsed = time.time() - t0
+            print(f"[INFO] {total:,} documentos insertados ({total / max(elapsed, 1e-9):,.0f} docs/s)")
+
+    elapsed = time.time() - t0
+    print(f"[OK] Backfill terminado: {total:,} documentos en {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} docs/s)")
+
+
+def run_live(args, fleet: List[Dict[str, Any]], collection):
+    """Modo live: una lectura por dispositivo cada --rate segundos, a ritmo fijo."""
+    rng = random.Random(args.seed)
+    deadline = None
+    if args.days or args.hours:
+        deadline = time.monotonic() + timedelta(days=args.days, hours=args.hours).total_seconds()
+
+    print(f"[INFO] Modo live: {len(fleet)} dispositivos cada {args.rate}s (Ctrl+C para detener)")
+    next_tick = time.monotonic()
+    total = 0
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            now = datetime.now(timezone.utc)
+            batch = [build_reading(device, now, rng, args.anomaly_rate) for device in fleet]
+            for i in range(0, len(batch), args.batch_size):
+                collection.insert_many(batch[i:i + args.batch_size], ordered=False)
+            total += len(batch)
+
+            next_tick += args.rate
+            lag = next_tick - time.monotonic()
+            if lag > 0:
+                time.sleep(lag)
+            else:
+                # No alcanzamos el ritmo pedido: re-sincronizar en vez de acumular atraso
+                print(f"[WARN] Tick atrasado {-lag:.2f}s ({len(batch)} docs por tick)")
+                next_tick = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    print(f"[OK] Modo live detenido: {total:,} documentos insertados.")
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Generador de carga sintética para pruebas de capacidad")
+    parser.add_argument("--uri", default=DEFAULT_URI, help="URI de MongoDB (por defecto mongod local)")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION)
+    parser.add_argument("--devices", type=int, default=500, help="Número de dispositivos (N)")
+    parser.add_argument("--sensors", type=int, default=4, help="Sensores por dispositivo (M)")
+    parser.add_argument("--rate", type=float, default=60.0, help="Segundos entre lecturas de un dispositivo")
+    parser.add_argument("--days", type=float, default=0.0, help="Duración del histórico (o del modo live)")
+    parser.add_argument("--hours", type=float, default=0.0)
+    parser.add_argument("--schema-mix", default=DEFAULT_SCHEMA_MIX,
+                        help=f"Pesos por variante de esquema ({', '.join(SCHEMA_VARIANTS)})")
+    parser.add_argument("--anomaly-rate", type=float, default=0.001, help="Fracción de lecturas en zona crítica")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Documentos por insert_many")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Procesos del pool")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--live", action="store_true", help="Insertar continuamente a ritmo fijo")
+    parser.add_argument("--drop", action="store_true", help="Vaciar la colección antes de generar")
+    parser.add_argument("--allow-remote", action="store_true", help="Permitir URIs que no sean localhost")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+
+    is_local = any(host in args.uri for host in ("localhost", "127.0.0.1", "[::1]"))
+    if not is_local and not args.allow_remote:
+        print("[ERROR] La URI no apunta a un mongod local. Usa --allow-remote si es intencional.")
+        return
+    if not args.live and not (args.days or args.hours):
+        print("[ERROR] Indica la duración del histórico con --days y/o --hours (o usa --live).")
+        return
+
+    fleet = build_fleet(args.devices, args.sensors, parse_schema_mix(args.schema_mix), args.seed)
+
+    client = MongoClient(args.uri)
+    try:
+        client.admin.command("ping")
+    except Exception as e:
+        print(f"[ERROR] Error de conexion: {e}")
+        return
+    collection = client[args.db][args.collection]
+
+    if args.drop:
+        collection.drop()
+        print(f"[INFO] Coleccion '{args.collection}' eliminada.")
+
+    if args.live:
+        run_live(args, fleet, collection)
+    else:
+        run_backfill(args, fleet)
+
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,23 @@ DB_NAME = os.getenv("MONGO_DB")
 DEMO_COLLECTION = "SensorReadings_DEMO"
 
 
+# Valores base para cada tipo de sensor
+SENSOR_VALUES = {
+    "temperature": {"base": 28.0, "range": 2.0, "critical_high": 42.0, "warning_high": 32.0},
+    "ph": {"base": 7.5, "range": 0.3, "critical_high": 9.5, "warning_high": 8.5},
+    "do": {"base": 6.0, "range": 1.0, "critical_low": 2.0, "warning_low": 4.0},
+    "ammonia": {"base": 0.1, "range": 0.05, "critical_high": 1.0, "warning_high": 0.5},
+    "nitrite": {"base": 0.05, "range": 0.02, "critical_high": 0.5, "warning_high": 0.25},
+    "nitrate": {"base": 20.0, "range": 5.0, "critical_high": 100.0, "warning_high": 50.0},
+    "humidity": {"base": 65.0, "range": 10.0},
+    "salinity": {"base": 35.0, "range": 2.0},
+    "turbidity": {"base": 15.0, "range": 5.0},
+    "tds": {"base": 500.0, "range": 50.0},
+    "conductivity": {"base": 1200.0, "range": 100.0},
+    "chlorophyll": {"base": 8.0, "range": 2.0},
+}
+
+
 def generate_mock_data():
     """Genera datos de prueba con variedad de sensores por dispositivo."""
     if not URI:
@@ -78,22 +95,6 @@ def generate_mock_data():
          "sensors": ["temperature", "ph", "do", "ammonia", "nitrite"]},
     ]
 
-    # Valores base para cada tipo de sensor
-    sensor_values = {
-        "temperature": {"base": 28.0, "range": 2.0, "critical_high": 42.0, "warning_high": 32.0},
-        "ph": {"base": 7.5, "range": 0.3, "critical_high": 9.5, "warning_high": 8.5},
-        "do": {"base": 6.0, "range": 1.0, "critical_low": 2.0, "warning_low": 4.0},
-        "ammonia": {"base": 0.1, "range": 0.05, "critical_high": 1.0, "warning_high": 0.5},
-        "nitrite": {"base": 0.05, "range": 0.02, "critical_high": 0.5, "warning_high": 0.25},
-        "nitrate": {"base": 20.0, "range": 5.0, "critical_high": 100.0, "warning_high": 50.0},
-        "humidity": {"base": 65.0, "range": 10.0},
-        "salinity": {"base": 35.0, "range": 2.0},
-        "turbidity": {"base": 15.0, "range": 5.0},
-        "tds": {"base": 500.0, "range": 50.0},
-        "conductivity": {"base": 1200.0, "range": 100.0},
-        "chlorophyll": {"base": 8.0, "range": 2.0},
-    }
-
     print(f"[INFO] Generando datos para {len(devices_config)} dispositivos...")
     
     records = []
@@ -112,7 +113,7 @@ def generate_mock_data():
             # Generar valores para cada sensor del dispositivo
             sensors_data = {}
             for sensor_name in dev['sensors']:
-                config = sensor_values.get(sensor_name, {"base": 50.0, "range": 10.0})
+                config = SENSOR_VALUES.get(sensor_name, {"base": 50.0, "range": 10.0})
                 base = config["base"]
                 variation = config["range"]
                 
@@ -154,7 +155,7 @@ def generate_mock_data():
             # Recalcular sensores para el ultimo registro
             sensors_data = {}
             for sensor_name in dev['sensors']:
-                config = sensor_values.get(sensor_name, {"base": 50.0, "range": 10.0})
+                config = SENSOR_VALUES.get(sensor_name, {"base": 50.0, "range": 10.0})
                 base = config["base"]
                 variation = config["range"]
                 
@@ -1,13 +1,19 @@
 import streamlit as st
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import re
 
 from modules.database import DatabaseConnection
 from modules.config_manager import ConfigManager
 from modules.sensor_registry import SensorRegistry
 from modules.device_manager import DeviceManager, ConnectionStatus, HealthStatus, DeviceInfo
+from modules.frame_cache import cached_frame
+from modules.local_time import now_local
+from modules.metrics import DASHBOARD_REFRESH_SECONDS
+from modules.profiling import DATA, TRANSFORM, WIDGETS, span
+from modules.sensor_catalog import known_sensors
 
 # --- SVGs CONSTANTS ---
 ICON_LOC = '<svg xmlns="http://www.w3.org/2000/svg" width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round" style="vertical-align: text-bottom; margin-right: 2px;"><path d="M20 10c0 6-8 12-8 12s-8-6-8-12a8 8 0 0 1 16 0Z"/><circle cx="12" cy="10" r="3"/></svg>'
@@ -17,6 +23,83 @@ ICON_WIFI_OFF = '<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16"
 ICON_GRAPH_BTN = '<svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><rect x="3" y="3" width="18" height="18" rx="2" ry="2" /><line x1="8" y1="12" x2="8" y2="16" /><line x1="12" y1="8" x2="12" y2="16" /><line x1="16" y1="10" x2="16" y2="16" /></svg>'
 ICON_REFRESH = '<svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M3 12a9 9 0 0 1 9-9 9.75 9.75 0 0 1 6.74 2.74L21 8" /><path d="M21 3v5h-5" /><path d="M21 12a9 9 0 0 1-9 9 9.75 9.75 0 0 1-6.74-2.74L3 16" /><path d="M3 21v-5h5" /></svg>'
 
+# Tarjetas por página del grid
+DEVICES_PER_PAGE = 9
+# Lecturas de una página (o de toda la flota) reutilizadas y precargadas durante este tiempo;
+# menor que el intervalo de refresco para que cada refresco traiga datos nuevos
+LATEST_READINGS_TTL_SECONDS = 20
+# El índice de estado se pide en el rerun completo y en el fragment: una sola consulta por rerun
+STATUS_INDEX_TTL_SECONDS = 5
+# Dispositivos con lecturas (para verificar que el índice cubre la flota)
+KNOWN_DEVICES_TTL_SECONDS = 300
+
+# Precarga en segundo plano de la página siguiente (compartido por todas las sesiones)
+_prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dashboard-prefetch")
+
+
+@cached_frame("dashboard_latest", ttl=LATEST_READINGS_TTL_SECONDS)
+def cargar_ultimas_lecturas(device_ids: Optional[Tuple[str, ...]] = None) -> pd.DataFrame:
+    """Última lectura por dispositivo: de `device_ids` (una página) o de toda la flota."""
+    return DatabaseConnection().get_latest_by_device(list(device_ids) if device_ids else None)
+
+
+@cached_frame("dashboard_status", ttl=STATUS_INDEX_TTL_SECONDS)
+def cargar_indice_estado() -> pd.DataFrame:
+    """Índice liviano de la flota (vacío si el evaluador en segundo plano no está activo)."""
+    return DatabaseConnection().get_device_status_index()
+
+
+@st.cache_data(ttl=KNOWN_DEVICES_TTL_SECONDS, show_spinner=False)
+def cargar_ids_con_lecturas() -> Tuple[str, ...]:
+    return tuple(DatabaseConnection().known_device_ids(include_registry=False))
+
+
+def indice_de_flota() -> pd.DataFrame:
+    """
+    Índice de estado solo si cubre a todos los dispositivos con lecturas. Si falta alguno
+    (el evaluador aún no sembró su estado) se devuelve vacío y se usa el camino completo,
+    para no perder dispositivos del grid ni de los KPIs.
+    """
+    index_df = cargar_indice_estado()
+    if index_df.empty:
+        return index_df
+    if set(cargar_ids_con_lecturas()) - set(index_df["device_id"]):
+        return index_df.iloc[0:0]
+    return index_df
+
+
+def precargar_lecturas(device_ids: Tuple[str, ...]):
+    """Deja en caché las lecturas de una página sin bloquear el rerun."""
+    def run():
+        try:
+            cargar_ultimas_lecturas(device_ids)
+        except Exception as e:
+            print(f"[dashboard] Error precargando página: {e}")
+    if device_ids:
+        _prefetch_pool.submit(run)
+
+
+def construir_device_manager(db: DatabaseConnection, config_manager: ConfigManager, thresholds: Dict,
+                             df: Optional[pd.DataFrame] = None) -> DeviceManager:
+    """
+    DeviceManager con umbrales globales y específicos + salud precalculada. Con `df` además
+    sincroniza los sensores detectados. Si algo falla, solo con los umbrales recibidos.
+    """
+    prev_states = st.session_state.get('device_health_states', {})
+    try:
+        if df is not None:
+            # Catálogo persistente si existe; si no, descubrir desde las últimas lecturas
+            detected = known_sensors() or SensorRegistry.discover_sensors_from_dataframe(df)
+            config_manager.sync_with_detected_sensors(detected)
+        global_thresholds = config_manager.get_all_configured_sensors()
+        all_meta = config_manager.get_device_metadata()
+        dev_specifics = {k: v.get('thresholds', {}) for k, v in all_meta.items()}
+        return DeviceManager(global_thresholds, prev_states, dev_specifics,
+                             precomputed_health=db.get_precomputed_health())
+    except Exception:
+        return DeviceManager(thresholds, prev_states)
+
+
 def initialize_dashboard_state():
     if 'dashboard_page' not in st.session_state:
         st.session_state.dashboard_page = 0
@@ -130,80 +213,89 @@ def show_view():
             keys_to_delete = [k for k in st.session_state.keys() if k.startswith('live_data_')]
             for k in keys_to_delete:
                 del st.session_state[k]
+            cargar_ultimas_lecturas.clear()
+            cargar_indice_estado.clear()
+            cargar_ids_con_lecturas.clear()
             st.rerun()
     
     # --- Data Loading ---
+    # Con el evaluador activo basta el índice liviano (filtros y paginación): el fragment
+    # trae lecturas completas solo de la página visible. Sin él, se evalúa toda la flota.
     all_devices = []
     
     try:
-        df = db.get_latest_by_device()
-        prev_states = st.session_state.get('device_health_states', {})
+        with span("índice de estado", DATA):
+            index_df = indice_de_flota()
         
-        if df is None or df.empty:
-            all_devices = []
+        if not index_df.empty:
+            all_devices = DeviceManager(thresholds).get_status_infos(index_df)
         else:
-            try:
-                detected = SensorRegistry.discover_sensors_from_dataframe(df)
-                config_manager.sync_with_detected_sensors(detected)
-                global_thresholds = config_manager.get_all_configured_sensors() 
-                thresholds = global_thresholds
-                
-                all_meta = config_manager.get_device_metadata()
-                dev_specifics = {k: v.get('thresholds', {}) for k, v in all_meta.items()}
-                device_manager = DeviceManager(global_thresholds, prev_states, dev_specifics)
-            except: 
-                device_manager = DeviceManager(thresholds, prev_states)
+            with span("get_latest_by_device", DATA):
+                df = cargar_ultimas_lecturas()
             
-            all_devices = device_manager.get_all_devices_info(df)
-            st.session_state['device_health_states'] = device_manager.get_health_states()
+            if df is not None and not df.empty:
+                with span("umbrales y sincronización de sensores", DATA):
+                    device_manager = construir_device_manager(db, config_manager, thresholds, df)
+                    thresholds = device_manager.global_thresholds
+                
+                with span("evaluación de salud", TRANSFORM):
+                    all_devices = device_manager.get_all_devices_info(df)
+                st.session_state['device_health_states'] = device_manager.get_health_states()
 
     except Exception as e:
         st.error(f"Error fetching devices: {str(e)}")
         return
     
     # Solo necesitamos pasar config_manager, el fragment cargará los datos
-    render_dashboard_content(all_devices, thresholds, config_manager)
+    with span("filtros y tarjetas", WIDGETS):
+        render_dashboard_content(all_devices, thresholds, config_manager)
 
 
 @st.fragment(run_every=30)
 def refresh_dashboard_data(all_devices, thresholds, config_manager):
     """Fragment que se auto-refresca cada 30 segundos"""
-    from datetime import datetime
-    
+    with DASHBOARD_REFRESH_SECONDS.time():
+        _render_refresh(all_devices, thresholds, config_manager)
+
+
+def _render_refresh(all_devices, thresholds, config_manager):
+    """Cuerpo del fragment de refresco (separado para medir su duración)."""
     # Recargar datos frescos
     db = DatabaseConnection()
-    df = db.get_latest_by_device()
-    
-    if df is not None and not df.empty:
-        prev_states = st.session_state.get('device_health_states', {})
+    with span("índice de estado (refresco)", DATA):
+        index_df = indice_de_flota()
+    por_pagina = not index_df.empty
+    summary = None
+    
+    if por_pagina:
+        # Estado de toda la flota desde el índice; KPIs contados en MongoDB
+        all_devices = DeviceManager(thresholds).get_status_infos(index_df)
+        with span("conteo por estado", DATA):
+            summary = db.count_devices_by_status(DeviceManager.OFFLINE_TIMEOUT_SECONDS) or None
+    else:
+        with span("get_latest_by_device (refresco)", DATA):
+            df = cargar_ultimas_lecturas()
         
-        try:
-            detected = SensorRegistry.discover_sensors_from_dataframe(df)
-            config_manager.sync_with_detected_sensors(detected)
-            global_thresholds = config_manager.get_all_configured_sensors()
+        if df is not None and not df.empty:
+            device_manager = construir_device_manager(db, config_manager, thresholds, df)
             
-            all_meta = config_manager.get_device_metadata()
-            dev_specifics = {k: v.get('thresholds', {}) for k, v in all_meta.items()}
-            device_manager = DeviceManager(global_thresholds, prev_states, dev_specifics)
-        except:
-            device_manager = DeviceManager(thresholds, prev_states)
-        
-        # Actualizar lista de dispositivos con datos frescos
-        all_devices = device_manager.get_all_devices_info(df)
-        st.session_state['device_health_states'] = device_manager.get_health_states()
-        
-        # IMPORTANTE: Actualizar el cache de cada dispositivo para que las tarjetas muestren datos frescos
-        for device in all_devices:
-            state_key = f"live_data_{device.device_id}"
-            st.session_state[state_key] = device
+            # Actualizar lista de dispositivos con datos frescos
+            with span("evaluación de salud (refresco)", TRANSFORM):
+                all_devices = device_manager.get_all_devices_info(df)
+            st.session_state['device_health_states'] = device_manager.get_health_states()
+            
+            # IMPORTANTE: Actualizar el cache de cada dispositivo para que las tarjetas muestren datos frescos
+            for device in all_devices:
+                state_key = f"live_data_{device.device_id}"
+                st.session_state[state_key] = device
     
     # Mostrar indicador de última actualización
-    refresh_time = datetime.now().strftime("%H:%M:%S")
+    refresh_time = now_local().strftime("%H:%M:%S")
     st.caption(f" Última actualización: {refresh_time} • Auto-actualizando cada 30 segundos")
     
     # Renderizar KPIs
     device_manager_for_metrics = DeviceManager(thresholds, {})
-    render_summary_metrics(device_manager_for_metrics, all_devices)
+    render_summary_metrics(device_manager_for_metrics, all_devices, summary)
     
     st.markdown("<br>", unsafe_allow_html=True)
     
@@ -224,7 +316,52 @@ def refresh_dashboard_data(all_devices, thresholds, config_manager):
         st.info("No se encontraron dispositivos con los filtros actuales.")
         return
     
-    render_device_grid(filtered_devices, thresholds, config_manager, show_offline)
+    stale_ids = frozenset()
+    if por_pagina:
+        online_ids = {d.device_id for d in filtered_devices if d.connection != ConnectionStatus.OFFLINE}
+        filtered_devices = completar_pagina(filtered_devices, db, config_manager, thresholds)
+        # Dispositivos de la página que pasaron a offline con la lectura completa: se muestran
+        # como tales en lugar de correr la página (el resto respeta el filtro)
+        stale_ids = frozenset(d.device_id for d in filtered_devices
+                              if d.device_id in online_ids and d.connection == ConnectionStatus.OFFLINE)
+    
+    render_device_grid(filtered_devices, thresholds, config_manager, show_offline, stale_ids)
+
+
+def pagina_actual(total_items: int) -> Tuple[int, int, int, int]:
+    """(página, inicio, fin, total de páginas) del grid según session_state."""
+    total_pages = max(1, (total_items + DEVICES_PER_PAGE - 1) // DEVICES_PER_PAGE)
+    if st.session_state.dashboard_page >= total_pages: st.session_state.dashboard_page = 0
+    current_page = st.session_state.dashboard_page
+    start = current_page * DEVICES_PER_PAGE
+    return current_page, start, start + DEVICES_PER_PAGE, total_pages
+
+
+def completar_pagina(devices: List[DeviceInfo], db: DatabaseConnection, config_manager: ConfigManager,
+                     thresholds: Dict) -> List[DeviceInfo]:
+    """
+    Lecturas completas y salud solo para los dispositivos de la página visible (el resto
+    queda con la info del índice) y precarga en segundo plano la página siguiente.
+    El costo del refresco depende del tamaño de página, no de la flota.
+    """
+    current_page, start, end, total_pages = pagina_actual(len(devices))
+    page_ids = tuple(d.device_id for d in devices[start:end])
+    
+    with span(f"lecturas de la página ({len(page_ids)})", DATA):
+        df = cargar_ultimas_lecturas(page_ids)
+    
+    if df is not None and not df.empty:
+        device_manager = construir_device_manager(db, config_manager, thresholds, df)
+        with span("evaluación de salud (página)", TRANSFORM):
+            page_infos = {d.device_id: d for d in device_manager.get_all_devices_info(df)}
+        st.session_state['device_health_states'] = device_manager.get_health_states()
+        for dev_id, device in page_infos.items():
+            st.session_state[f"live_data_{dev_id}"] = device
+        devices = devices[:start] + [page_infos.get(d.device_id, d) for d in devices[start:end]] + devices[end:]
+    
+    if current_page + 1 < total_pages:
+        precargar_lecturas(tuple(d.device_id for d in devices[end:end + DEVICES_PER_PAGE]))
+    return devices
 
 
 def render_dashboard_content(all_devices, thresholds, config_manager):
@@ -351,13 +488,14 @@ def render_live_device_card(device_obj: DeviceInfo, thresholds: Dict, config_man
             db = DatabaseConnection()
             new_df = db.get_latest_for_single_device(dev_id)
             if not new_df.empty:
-                cfg = ConfigManager(db)
+                # Config ya cargada por el dashboard (sin lecturas extra a la BD por tarjeta)
+                cfg = config_manager or ConfigManager(db)
                 # 1. Obtener umbrales globales
                 global_thresholds = cfg.get_all_configured_sensors()
                 
                 # 2. Obtener umbrales ESPECIFICOS del dispositivo
-                all_meta = cfg.get_device_metadata()
-                dev_specifics = {k: v.get('thresholds', {}) for k, v in all_meta.items()}
+                dev_meta = cfg.get_device_metadata().get(dev_id, {})
+                dev_specifics = {dev_id: dev_meta.get('thresholds', {})}
                 
                 # 3. Recuperar estados previos para evitar flasheos
                 prev_states = st.session_state.get('device_health_states', {})
@@ -372,23 +510,17 @@ def render_live_device_card(device_obj: DeviceInfo, thresholds: Dict, config_man
             st.toast(f"Error: {e}")
 
 
-def render_device_grid(devices, thresholds, config_manager=None, show_offline=False):
+def render_device_grid(devices, thresholds, config_manager=None, show_offline=False, stale_ids=frozenset()):
     
-    # Filtrar dispositivos offline si show_offline es False
+    # Filtrar dispositivos offline si show_offline es False (salvo los que recién pasaron a offline)
     if show_offline:
         display_devices = devices
     else:
-        display_devices = [d for d in devices if d.connection != ConnectionStatus.OFFLINE]
+        display_devices = [d for d in devices
+                           if d.connection != ConnectionStatus.OFFLINE or d.device_id in stale_ids]
     
     with st.container():
-        PER_PAGE = 9
-        total_pages = max(1, (len(display_devices) + PER_PAGE - 1) // PER_PAGE)
-        
-        if st.session_state.dashboard_page >= total_pages: st.session_state.dashboard_page = 0
-        current_page = st.session_state.dashboard_page
-        
-        start = current_page * PER_PAGE
-        end = start + PER_PAGE
+        current_page, start, end, total_pages = pagina_actual(len(display_devices))
         page_items = display_devices[start:end]
         
         cols = st.columns(3)
@@ -424,9 +556,11 @@ def render_empty_state():
 </div>
     """), unsafe_allow_html=True)
 
-def render_summary_metrics(manager, devices):
+def render_summary_metrics(manager, devices, metrics: Optional[Dict[str, int]] = None):
+    """KPIs de la flota; `metrics` ya contados (p.ej. en MongoDB) evita recorrer `devices`."""
     with st.container():
-        metrics = manager.calculate_summary_metrics(devices)
+        if metrics is None:
+            metrics = manager.calculate_summary_metrics(devices)
         cols = st.columns(6)
         def m(idx, label, key, bg, txt):
             with cols[idx]:
@@ -735,7 +869,7 @@ def build_card_html(device: DeviceInfo, thresholds: Dict, config_manager: Config
         dt = device.last_update
         if dt.tzinfo: 
             dt = dt.replace(tzinfo=None)
-        if dt.date() == datetime.now().date():
+        if dt.date() == now_local().date():
             ts_str = dt.strftime("%H:%M:%S")
         else:
             ts_str = dt.strftime("%d/%m %H:%M:%S")
@@ -3,16 +3,24 @@ Página de Gráficas y Tendencias - Versión Optimizada
 Arquitectura: Carga completa -> DataFrame cacheado -> Filtrado en memoria
 """
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Tuple
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from modules.database import DatabaseConnection
 from modules.config_manager import ConfigManager
+from modules.frame_compaction import compact_history_frame
+from modules.device_store import DeviceTimeStore
+from modules.frame_cache import FrameCache, cached_frame, get_frame_cache
+from modules.local_time import now_utc, to_local
+from modules.sensor_aliases import normalize_sensor_columns
+from modules.sensor_catalog import load_sensor_catalog
+from modules.profiling import DATA, FIGURE, TRANSFORM, WIDGETS, span
 
 # =============================================================================
 # ICONOS SVG INLINE
@@ -42,27 +50,12 @@ ICON_CLIPBOARD = '<svg xmlns="http://www.w3.org/2000/svg" width="14" height="14"
 
 ICON_LIGHTBULB = '<svg xmlns="http://www.w3.org/2000/svg" width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round" style="vertical-align: middle; margin-right: 4px;"><line x1="9" y1="18" x2="15" y2="18"></line><line x1="10" y1="22" x2="14" y2="22"></line><path d="M15.09 14c.18-.98.65-1.74 1.41-2.5A4.65 4.65 0 0 0 18 8 6 6 0 0 0 6 8c0 1 .23 2.23 1.5 3.5A4.61 4.61 0 0 1 8.91 14"></path></svg>'
 
-# Mapa de normalizacion de nombres de sensores (diferentes esquemas -> nombre estandar)
-SENSOR_ALIASES = {
-    # Temperatura
-    "temperatura": "temperature",
-    "temp": "temperature",
-    "temperature": "temperature",
-    "TEMPERATURA": "temperature",
-    "TEMP": "temperature",
-    # pH
-    "ph": "ph",
-    "PH": "ph",
-    "Ph": "ph",
-    # Oxigeno
-    "oxigeno": "oxygen",
-    "oxygen": "oxygen",
-    "do": "oxygen",
-    "OD": "oxygen",
-    # Otros
-    "humedad": "humidity",
-    "humidity": "humidity",
-}
+# Gráficos visibles al cargar la página; el resto se construye al activar su interruptor
+GRAFICOS_ABIERTOS = 3
+# Hilos para construir las figuras de varios parámetros a la vez
+FIGURE_WORKERS = 4
+# Vigencia de una figura en el caché (la clave ya cambia con los datos; esto libera las que nadie pide)
+FIGURE_CACHE_TTL = 3600
 
 # Labels para mostrar al usuario
 SENSOR_LABELS = {
@@ -73,34 +66,6 @@ SENSOR_LABELS = {
 }
 
 
-def normalize_sensor_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Normaliza nombres de columnas de sensores para unificar datos de diferentes fuentes."""
-    if df.empty:
-        return df
-    
-    df = df.copy()
-    columns_to_rename = {}
-    
-    for col in df.columns:
-        col_lower = col.lower().strip()
-        if col_lower in SENSOR_ALIASES:
-            standard_name = SENSOR_ALIASES[col_lower]
-            # Si ya existe la columna estandar, combinar datos
-            if standard_name in df.columns and standard_name != col:
-                df[standard_name] = df[standard_name].combine_first(df[col])
-                df = df.drop(columns=[col])
-            elif standard_name != col:
-                columns_to_rename[col] = standard_name
-    
-    if columns_to_rename:
-        df = df.rename(columns=columns_to_rename)
-    
-    # Eliminar columnas duplicadas que puedan quedar
-    df = df.loc[:, ~df.columns.duplicated()]
-    
-    return df
-
-
 def get_sensor_display_info(sensor_name: str, sensor_config: dict) -> tuple:
     """Obtiene label y unidad para un sensor, usando config o defaults."""
     # Primero buscar en config del usuario
@@ -121,13 +86,14 @@ def get_sensor_display_info(sensor_name: str, sensor_config: dict) -> tuple:
 # ARQUITECTURA OPTIMIZADA: Carga completa + Cache + Filtrado en memoria
 # =============================================================================
 
-# TTL de 24 horas (86400 segundos) para evitar recargas constantes
+# El cacheo (TTL de 24 horas) lo hace obtener_store_historial sobre el caché de frames compartido
 # El usuario puede forzar la recarga con el botón "Actualizar"
-@st.cache_data(ttl=86400, show_spinner=False)
-def cargar_historial_completo() -> pd.DataFrame:
+def cargar_historial_completo(sensors: Optional[Tuple[str, ...]] = None) -> pd.DataFrame:
     """
     Carga TODO el historial de datos sin límite.
-    Esta función se cachea por 24 HORAS para evitar recargas innecesarias.
+    Con `sensors` (nombres canónicos) solo esos campos viajan desde MongoDB y se
+    descartan las lecturas que no traen ninguno de ellos.
+    Se cachea por 24 HORAS (vía obtener_store_historial) para evitar recargas innecesarias.
     
     Para obtener datos nuevos, el usuario debe presionar "Actualizar".
     
@@ -144,28 +110,21 @@ def cargar_historial_completo() -> pd.DataFrame:
             return pd.DataFrame()
         
         # Definir TIEMPO DE CORTE para sincronización
-        cut_off_time = datetime.now(timezone.utc).astimezone(timezone(timedelta(hours=-3))).replace(tzinfo=None)
+        cut_off_utc = now_utc()
+        cut_off_time = to_local(cut_off_utc)
         print(f"[graphs.py] Tiempo de corte de sincronización: {cut_off_time}")
         
         # Calcular fecha de inicio para la consulta (1 semana atrás + margen de 1 hora)
         start_date = cut_off_time - timedelta(weeks=1, hours=1)
-        start_date_iso = start_date.isoformat()
         
         print(f"[graphs.py] Limitando consulta a datos desde: {start_date}")
 
-        # Proyección optimizada
-        projection = {
-            '_id': 1, 'timestamp': 1, 'device_id': 1, 'dispositivo_id': 1,
-            'sensors': 1, 'datos': 1, 'location': 1, 'metadata': 1
-        }
+        # Proyección mínima (solo los sensores pedidos, si se indicaron)
+        projection = db.reading_projection(sensors)
         
         # Construir Query con filtro de fecha
-        query = {
-            "$or": [
-                {"timestamp": {"$gte": start_date}},        # Para objetos Date
-                {"timestamp": {"$gte": start_date_iso}}     # Para strings ISO
-            ]
-        }
+        # (mismos tramos Date / string ISO / epoch que el Historial)
+        query = {"$or": db._history_time_branches(start_date, cut_off_time)}
         
         # Cargar documentos (intenta sort, fallback a sin sort)
         try:
@@ -181,13 +140,12 @@ def cargar_historial_completo() -> pd.DataFrame:
         # Normalizar documentos y FILTRAR por cut_off_time
         valid_docs = []
         docs_futuros = 0
-        for doc in raw_documents:
-            norm_doc = db._normalize_document(doc)
+        for norm_doc in db._normalize_documents(raw_documents, label="graphs.py historial"):
             ts = norm_doc.get("timestamp")
             
             if ts is not None and norm_doc.get("device_id") != "unknown":
                 # Filtro de sincronización: ignorar datos posteriores al corte
-                if ts > cut_off_time:
+                if ts > cut_off_utc:
                     docs_futuros += 1
                     continue
                     
@@ -203,6 +161,11 @@ def cargar_historial_completo() -> pd.DataFrame:
         
         # Normalizar columnas de sensores
         df = normalize_sensor_columns(df)
+        if sensors:
+            sensor_cols = [c for c in sensors if c in df.columns]
+            if not sensor_cols:
+                return pd.DataFrame()
+            df = df.dropna(subset=sensor_cols, how="all")
         
         # =====================================================================
         # FILTRAR TIMESTAMPS INVÁLIDOS
@@ -230,6 +193,10 @@ def cargar_historial_completo() -> pd.DataFrame:
             for _, row in device_summary.iterrows():
                 print(f"  - {row['device_id']}: último dato = {row['max']} ({row['count']} registros)")
         
+        # Dtypes compactos: este frame vive en el FrameCache compartido (un hit devuelve el
+        # mismo objeto, sin copia): su tamaño es lo que ocupa mientras siga en caché
+        df = compact_history_frame(df, label="graphs.py historial")
+        
         return df
         
     except Exception as e:
@@ -237,77 +204,148 @@ def cargar_historial_completo() -> pd.DataFrame:
         return pd.DataFrame()
 
 
+# Historial + índice por dispositivo en el caché de frames compartido (una sola copia por proceso,
+# con límite de memoria). Se construye una vez por carga: los reruns solo hacen searchsorted sobre él.
+# También se comparte entre réplicas (CACHE_BACKEND): la primera que carga calienta a las demás.
+# Con `sensors` el store tiene solo esos sensores (un store por parámetro graficado).
+@cached_frame("graphs_history", ttl=86400, shared=True, decode=DeviceTimeStore.from_table)
+def obtener_store_historial(sensors: Optional[Tuple[str, ...]] = None) -> DeviceTimeStore:
+    return DeviceTimeStore(cargar_historial_completo(sensors))
+
+
+def catalogo_activo() -> Dict[str, List[str]]:
+    """
+    Sensores por dispositivo con lecturas dentro de la ventana que cargan las gráficas
+    (catálogo persistente; {} si aún no existe). La ventana se redondea a la hora
+    para que el caché del catálogo no cambie de clave en cada rerun.
+    """
+    since = now_utc().replace(minute=0, second=0, microsecond=0) - timedelta(weeks=1, hours=2)
+    return load_sensor_catalog(since)
+
+
 
 def filtrar_dataframe(
     df: pd.DataFrame, 
     dispositivos: List[str], 
     delta: Optional[timedelta],
-    debug: bool = False
+    debug: bool = False,
+    store: Optional[DeviceTimeStore] = None
 ) -> pd.DataFrame:
     """
-    Filtra el DataFrame cacheado por dispositivos y rango de tiempo.
-    Esta operación es rápida porque trabaja en memoria.
+    Filtra el historial cacheado por dispositivos y rango de tiempo.
+    Usa el índice por dispositivo (DeviceTimeStore): cada dispositivo es un bloque
+    ordenado por timestamp y la ventana se resuelve con searchsorted y slices de
+    la tabla Arrow; solo la ventana resultante se convierte a pandas.
+    Si se pasa `store`, `df` se ignora; si no, se construye uno a partir de `df`.
     
     IMPORTANTE: El filtro de tiempo se aplica POR DISPOSITIVO para evitar que
     un dispositivo con mayor latencia "oculte" los datos de otro.
     """
-    if df.empty:
-        return df
-    
-    df_filtrado = df.copy()
+    if store is None:
+        if df is None or df.empty:
+            return df
+        
+        if 'timestamp' not in df.columns or 'device_id' not in df.columns:
+            # Fallback: filtro global si no hay device_id
+            df_filtrado = df
+            if delta is not None and 'timestamp' in df_filtrado.columns:
+                t_max = df_filtrado['timestamp'].max()
+                if pd.notna(t_max):
+                    df_filtrado = df_filtrado[df_filtrado['timestamp'] >= t_max - delta]
+            return df_filtrado
+        
+        store = DeviceTimeStore(df)
     
-    # Filtrar por dispositivos
-    if dispositivos and 'device_id' in df_filtrado.columns:
-        df_filtrado = df_filtrado[df_filtrado['device_id'].isin(dispositivos)]
+    if not dispositivos:
+        dispositivos = store.devices
     
-    # DEBUG: Mostrar t_max por dispositivo ANTES del filtro de tiempo
-    if debug and 'timestamp' in df_filtrado.columns and 'device_id' in df_filtrado.columns:
-        pre_filter = df_filtrado.groupby('device_id').agg({
-            'timestamp': ['min', 'max', 'count']
-        }).reset_index()
-        pre_filter.columns = ['device_id', 't_min', 't_max', 'count']
-        print(f"\n[filtrar_dataframe] ANTES del filtro de tiempo:")
-        for _, row in pre_filter.iterrows():
-            print(f"  - {row['device_id']}: {row['t_min']} -> {row['t_max']} ({row['count']} registros)")
+    df_filtrado = store.window_frame(dispositivos, delta)
     
-    # Filtrar por rango de tiempo POR DISPOSITIVO
-    # Esto evita que un dispositivo con latencia diferente "oculte" a otro
-    if delta is not None and 'timestamp' in df_filtrado.columns and 'device_id' in df_filtrado.columns:
-        # Calcular t_max y t_min por dispositivo (vectorizado, mucho más rápido que apply)
-        device_times = df_filtrado.groupby('device_id')['timestamp'].max().reset_index()
-        device_times.columns = ['device_id', 't_max']
-        device_times['t_min'] = device_times['t_max'] - delta
-        
-        # DEBUG: Mostrar los límites calculados
-        if debug:
-            print(f"\n[filtrar_dataframe] Límites para delta={delta}:")
-            for _, row in device_times.iterrows():
-                print(f"  - {row['device_id']}: t_max={row['t_max']}, filtrando desde t_min={row['t_min']}")
-        
-        # Merge para obtener t_min por registro
-        df_filtrado = df_filtrado.merge(device_times[['device_id', 't_min']], on='device_id', how='left')
-        
-        # Filtrar y limpiar
-        df_filtrado = df_filtrado[df_filtrado['timestamp'] >= df_filtrado['t_min']]
-        df_filtrado = df_filtrado.drop(columns=['t_min'])
-        
-        # DEBUG: Mostrar resultado después del filtro
-        if debug:
-            post_filter = df_filtrado.groupby('device_id')['timestamp'].agg(['min', 'max', 'count']).reset_index()
-            post_filter.columns = ['device_id', 't_min', 't_max', 'count']
-            print(f"\n[filtrar_dataframe] DESPUÉS del filtro de tiempo:")
-            for _, row in post_filter.iterrows():
-                print(f"  - {row['device_id']}: {row['t_min']} -> {row['t_max']} ({row['count']} registros)")
-    elif delta is not None and 'timestamp' in df_filtrado.columns:
-        # Fallback: filtro global si no hay device_id
-        t_max = df_filtrado['timestamp'].max()
-        if pd.notna(t_max):
-            t_min = t_max - delta
-            df_filtrado = df_filtrado[df_filtrado['timestamp'] >= t_min]
+    # DEBUG: Mostrar la ventana resultante por dispositivo
+    if debug:
+        print(f"\n[filtrar_dataframe] Ventana para delta={delta}:")
+        for dev_id, dev_slice in store.window(dispositivos, delta).items():
+            print(f"  - {dev_id}: {dev_slice['timestamp'].iloc[0]} -> {dev_slice['timestamp'].iloc[-1]} ({len(dev_slice)} registros)")
     
     return df_filtrado
 
 
+def construir_figura(chart_data: pd.DataFrame, param: str, label: str, unit: str,
+                     y_range: Optional[List[float]], delta: Optional[timedelta]) -> go.Figure:
+    """Figura de un parámetro: valores por dispositivo + tendencia (SMA)."""
+    unit_str = f" ({unit})" if unit else ""
+    # Crear figura con múltiples trazos
+    fig = go.Figure()
+
+    # Colores distintivos para cada dispositivo
+    colors = ['#3b82f6', '#ef4444', '#10b981', '#f59e0b', '#8b5cf6', '#ec4899', '#06b6d4', '#84cc16']
+
+    # Calcular ventana de SMA basada en cantidad de datos
+    n_total = len(chart_data)
+    window = 5 if n_total < 1000 else (20 if n_total < 10000 else 50)
+
+    # Agregar trazos por dispositivo
+    for idx, (dev_name, dev_data) in enumerate(chart_data.groupby('device_name', sort=False)):
+        color = colors[idx % len(colors)]
+        dev_sorted = dev_data.sort_values('timestamp')
+
+        # Línea de valores reales (fina, semi-transparente)
+        fig.add_trace(go.Scatter(
+            x=dev_sorted['timestamp'],
+            y=dev_sorted[param],
+            mode='lines',
+            name=f'{dev_name}',
+            line=dict(color=color, width=1),
+            opacity=0.5,
+            hovertemplate=f'{dev_name}<br>%{{x}}<br>{label}: %{{y:.2f}}{unit}<extra></extra>',
+            legendgroup=dev_name
+        ))
+
+        # Línea de tendencia (SMA) - gruesa, sólida
+        if len(dev_sorted) > window:
+            sma = dev_sorted[param].rolling(window=window, min_periods=1).mean()
+            fig.add_trace(go.Scatter(
+                x=dev_sorted['timestamp'],
+                y=sma,
+                mode='lines',
+                name=f'{dev_name} (Tendencia)',
+                line=dict(color=color, width=2.5),
+                opacity=1.0,
+                hoverinfo='skip',
+                legendgroup=dev_name,
+                showlegend=True
+            ))
+
+    # Personalización del layout
+    fig.update_layout(
+        hovermode="x unified",
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1,
+            title=None
+        ),
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=380,
+        template="plotly_white",
+        xaxis=dict(
+            tickformat="%H:%M" if (delta and delta <= timedelta(hours=24)) else "%d/%m %H:%M",
+            showgrid=True,
+            gridcolor='rgba(0,0,0,0.05)'
+        ),
+        yaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(0,0,0,0.05)',
+            range=y_range,
+            title=f'{label}{unit_str}'
+        )
+    )
+
+    return fig
+
+
 def show_view():
     # --- HEADER ---
     col_h1, col_h2 = st.columns([4, 1])
@@ -318,39 +356,50 @@ def show_view():
             print(f"\n[graphs.py] ========================================")
             print(f"[graphs.py] BOTÓN ACTUALIZAR PRESIONADO - Limpiando cache...")
             print(f"[graphs.py] ========================================")
-            cargar_historial_completo.clear()
+            obtener_store_historial.clear()
             st.rerun()
     
     # --- CONEXION Y CONFIG ---
     try:
-        db = DatabaseConnection()
-        config_manager = ConfigManager(db)
-        sensor_config = config_manager.get_all_configured_sensors()
-        device_metadata = config_manager.get_device_metadata()
+        with span("configuración y metadatos", DATA):
+            db = DatabaseConnection()
+            config_manager = ConfigManager(db)
+            sensor_config = config_manager.get_all_configured_sensors()
+            device_metadata = config_manager.get_device_metadata()
     except Exception as e:
         st.error(f"Error de conexión: {str(e)}")
         return
     
-    # --- CARGA INICIAL DE DATOS (CACHEADA POR 24 HORAS) ---
-    with st.spinner("Cargando historial completo (solo la primera vez, después será instantáneo)..."):
-        df_completo = cargar_historial_completo()
+    # --- DISPOSITIVOS Y SENSORES DISPONIBLES ---
+    # Con catálogo no hace falta cargar el historial completo para armar los filtros:
+    # cada gráfico carga después solo su sensor. Sin catálogo se usa el store completo.
+    with span("catálogo de sensores", DATA):
+        catalogo = catalogo_activo()
+    store = None
+    if not catalogo:
+        with st.spinner("Cargando historial completo (solo la primera vez, después será instantáneo)..."):
+            with span("obtener_store_historial", DATA):
+                store = obtener_store_historial()
     
-    if df_completo is None or df_completo.empty:
+    if (store is not None and store.empty) or (store is None and not catalogo):
         st.warning("No se encontraron datos en la base de datos.")
         st.markdown(f"{ICON_LIGHTBULB} Verifica que los dispositivos estén enviando datos correctamente.", unsafe_allow_html=True)
         return
     
     # Mostrar info de cache
-    total_registros = len(df_completo)
-    fecha_min_data = df_completo['timestamp'].min()
-    fecha_max_data = df_completo['timestamp'].max()
+    if store is not None:
+        total_registros = store.num_rows
+        fecha_min_data, fecha_max_data = store.time_bounds()
+        dataset_info = f"Dataset: {total_registros:,} registros | Desde: {fecha_min_data.strftime('%d/%m/%Y %H:%M') if pd.notna(fecha_min_data) else 'N/A'}"
+    else:
+        dataset_info = f"Dataset: {len(catalogo)} dispositivos activos en la última semana"
     
     # --- FILTROS EN CONTENEDOR ---
     with st.container(border=True):
         st.markdown(f"<div style='margin-bottom: 10px; font-weight: 600; color: #475569;'>{ICON_SETTINGS} Configuración de Visualización</div>", unsafe_allow_html=True)
         
         # Info del dataset cargado
-        st.markdown(f"<span style='font-size: 0.85rem; color: #64748b;'>{ICON_DATABASE} Dataset: {total_registros:,} registros | Desde: {fecha_min_data.strftime('%d/%m/%Y %H:%M') if pd.notna(fecha_min_data) else 'N/A'}</span>", unsafe_allow_html=True)
+        st.markdown(f"<span style='font-size: 0.85rem; color: #64748b;'>{ICON_DATABASE} {dataset_info}</span>", unsafe_allow_html=True)
         
         c_time, c_dev, c_param = st.columns([1, 1, 1])
         
@@ -386,7 +435,7 @@ def show_view():
             delta = time_options[selected_range]
         
         # Obtener dispositivos disponibles
-        all_devices = sorted(df_completo['device_id'].unique().tolist())
+        all_devices = store.devices if store is not None else sorted(catalogo)
         
         def get_device_alias(dev_id):
             """Obtiene el alias del dispositivo o retorna None si no hay alias."""
@@ -475,20 +524,11 @@ def show_view():
             # Guardar selección actual para próximo rerun
             st.session_state.graphs_prev_devices = selected_devices
         
-        # Filtrar para obtener parámetros disponibles
-        excluded = ['timestamp', 'device_id', 'location', 'id', '_id', 'lat', 'lon', 'device_name']
-        numeric_cols = df_completo.select_dtypes(include=['number']).columns
-        params = [c for c in numeric_cols if c not in excluded]
-        
-        # Filtrar parámetros disponibles para dispositivos seleccionados
-        available_params = []
-        if selected_devices:
-            subset_df = df_completo[df_completo['device_id'].isin(selected_devices)]
-            for col in params:
-                if col in subset_df.columns and subset_df[col].notna().any():
-                    available_params.append(col)
+        # Parámetros con datos para los dispositivos seleccionados (catálogo o store)
+        if store is not None:
+            available_params = store.params_with_data(selected_devices)
         else:
-            available_params = params
+            available_params = sorted({s for d in selected_devices for s in catalogo.get(d, [])})
         
         # Calcular default inicial para parámetros
         if url_device_id and url_device_id in devices:
@@ -519,7 +559,26 @@ def show_view():
 
     # --- FILTRAR DATOS EN MEMORIA (RÁPIDO) ---
     # DEBUG desactivado para producción
-    filtered_df = filtrar_dataframe(df_completo, selected_devices, delta, debug=False)
+    # Versión de los datos de cada parámetro (clave del caché de figuras)
+    versiones = {}
+    if store is not None:
+        with span("filtrar_dataframe", TRANSFORM):
+            filtered_df = filtrar_dataframe(None, selected_devices, delta, debug=False, store=store)
+        versiones = {param: store.version for param in selected_params}
+    else:
+        # Un store por parámetro: solo viajan desde MongoDB los sensores graficados
+        partes = []
+        for param in selected_params:
+            with span(f"obtener_store_historial {param}", DATA):
+                param_store = obtener_store_historial((param,))
+            if param_store.empty:
+                continue
+            versiones[param] = param_store.version
+            with span(f"filtrar_dataframe {param}", TRANSFORM):
+                parte = filtrar_dataframe(None, selected_devices, delta, debug=False, store=param_store)
+            if not parte.empty:
+                partes.append(parte)
+        filtered_df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
     
     if filtered_df.empty:
         st.warning("No hay datos para la selección actual.")
@@ -530,8 +589,9 @@ def show_view():
         alias = device_display_map.get(dev_id, dev_id)
         return alias
     
-    filtered_df = filtered_df.copy()
-    filtered_df['device_name'] = filtered_df['device_id'].apply(get_display_name)
+    # filtered_df ya es un frame propio (convertido desde los slices Arrow), no hace falta copiar
+    # device_id es categórico: pasar a str para que los groupby no arrastren dispositivos no seleccionados
+    filtered_df['device_name'] = filtered_df['device_id'].astype(str).map(get_display_name)
 
     # --- INFO DE RANGO ---
     t_min = filtered_df['timestamp'].min()
@@ -540,148 +600,169 @@ def show_view():
     
     # Info de dispositivos en datos
     devices_in_data = filtered_df['device_name'].nunique()
+    # Con un store por parámetro una lectura puede aparecer en varias partes
+    total_lecturas = len(filtered_df.drop_duplicates(subset=['device_id', 'timestamp']))
     
     st.markdown(
         f"""<div style='text-align: center; color: #64748b; font-size: 0.9rem; margin: 10px 0;'>
-        {ICON_CHART} Mostrando: {intervalo_str} | Registros: {len(filtered_df):,} | Dispositivos: {devices_in_data}
+        {ICON_CHART} Mostrando: {intervalo_str} | Registros: {total_lecturas:,} | Dispositivos: {devices_in_data}
         </div>""", 
         unsafe_allow_html=True
     )
 
     # --- GRÁFICOS ---
     st.markdown("<br>", unsafe_allow_html=True)
-    
-    # Opción de escala compartida (con estado persistente)
-    use_shared_scale = st.checkbox(
-        "Usar escala Y compartida entre dispositivos", 
-        value=True,
-        key="graphs_shared_scale"
-    )
 
+    # Datos limpios por gráfico y figuras de los gráficos visibles, construidas en paralelo
+    # (o tomadas del caché de figuras). Cada gráfico es un fragment: sus controles
+    # (mostrar, escala, estadísticas) solo reconstruyen ese gráfico.
+    dispositivos_clave = tuple(sorted(selected_devices))
+    nombres_clave = tuple(get_display_name(d) for d in dispositivos_clave)
+    graficos = []
+    tareas = {}
     for param in selected_params:
-        label, unit = get_sensor_display_info(param, sensor_config)
-        unit_str = f" ({unit})" if unit else ""
-        
-        # Datos limpios para este gráfico
         chart_data = filtered_df[['timestamp', 'device_id', 'device_name', param]].dropna(subset=[param])
-        
         if chart_data.empty:
             continue
-        
         # Ordenar por dispositivo y timestamp
-        chart_data = chart_data.sort_values(['device_name', 'timestamp'])
+        with span(f"preparar {param}", TRANSFORM):
+            chart_data = chart_data.sort_values(['device_name', 'timestamp'])
+        label, unit = get_sensor_display_info(param, sensor_config)
+        # Todo lo que determina la figura salvo la escala (que se elige dentro del fragment)
+        clave_base = (param, dispositivos_clave, nombres_clave, delta, versiones.get(param), label, unit)
+        por_defecto = len(graficos) < GRAFICOS_ABIERTOS
+        visible = st.session_state.get(f"graphs_show_{param}", por_defecto)
+        if visible:
+            compartida = st.session_state.get(f"graphs_shared_scale_{param}", True)
+            tareas[clave_base + (compartida,)] = (chart_data, param, label, unit, rango_y(chart_data, param, compartida), delta)
+        graficos.append((param, chart_data, label, unit, por_defecto, clave_base))
+
+    with span(f"figuras en paralelo ({len(tareas)})", FIGURE):
+        figuras = construir_figuras(tareas)
+
+    for param, chart_data, label, unit, por_defecto, clave_base in graficos:
+        grafico_parametro(param, chart_data, label, unit, delta, por_defecto, clave_base, figuras)
+
+
+def rango_y(chart_data: pd.DataFrame, param: str, compartida: bool) -> Optional[List[float]]:
+    """Rango Y común a todos los dispositivos (con 10% de margen) o None para autoescala."""
+    if not compartida:
+        return None
+    y_min = chart_data[param].min()
+    y_max = chart_data[param].max()
+    y_margin = (y_max - y_min) * 0.1 if y_max != y_min else 1
+    return [y_min - y_margin, y_max + y_margin]
+
+
+class FiguraCacheada:
+    """Figura guardada en el FrameCache (de solo lectura); nbytes = arreglos de sus trazos."""
+
+    def __init__(self, figure: go.Figure):
+        self.figure = figure
+        self.nbytes = sum(np.asarray(values).nbytes for trace in figure.data
+                          for values in (trace.x, trace.y) if values is not None)
+
+
+def obtener_figura(clave: tuple, args: tuple, cache: Optional[FrameCache] = None) -> go.Figure:
+    """
+    construir_figura(*args) pasando por el caché de figuras del proceso, compartido entre
+    sesiones. `clave` incluye la versión de los datos: al recargar el store con datos
+    nuevos las figuras anteriores dejan de usarse y salen por LRU.
+    """
+    cache = cache or get_frame_cache()
+    entrada = cache.get_or_load(("graphs_figure",) + clave, lambda: FiguraCacheada(construir_figura(*args)),
+                                ttl=FIGURE_CACHE_TTL)
+    return entrada.figure
 
-        with st.container(border=True):
-            # Header del gráfico con promedios por dispositivo
+
+def construir_figuras(tareas: Dict[tuple, tuple]) -> Dict[tuple, go.Figure]:
+    """Obtiene varias figuras independientes (clave -> argumentos de construir_figura) en hilos."""
+    cache = get_frame_cache()
+    if len(tareas) <= 1:
+        return {clave: obtener_figura(clave, args, cache) for clave, args in tareas.items()}
+    with ThreadPoolExecutor(max_workers=min(FIGURE_WORKERS, len(tareas)), thread_name_prefix="graphs-fig") as pool:
+        futuros = {clave: pool.submit(obtener_figura, clave, args, cache) for clave, args in tareas.items()}
+        return {clave: futuro.result() for clave, futuro in futuros.items()}
+
+
+def expander_perezoso(label: str, key: str):
+    """
+    Expander cuyo contenido solo se calcula abierto. Devuelve (expander, abierto).
+    En versiones de Streamlit sin on_change en expander el contenido se calcula siempre.
+    """
+    try:
+        expander = st.expander(label, expanded=False, key=key, on_change="rerun")
+        return expander, bool(expander.open)
+    except TypeError:
+        return st.expander(label, expanded=False), True
+
+
+@st.fragment
+def grafico_parametro(param: str, chart_data: pd.DataFrame, label: str, unit: str,
+                      delta: Optional[timedelta], por_defecto: bool, clave_base: tuple,
+                      figuras: Dict[tuple, go.Figure]):
+    """
+    Tarjeta de un parámetro: promedios por dispositivo, gráfico y estadísticas.
+    `figuras` trae las figuras ya obtenidas en el rerun completo; si el usuario cambia
+    la escala dentro del fragment, la figura se obtiene aquí.
+    """
+    unit_str = f" ({unit})" if unit else ""
+
+    with st.container(border=True):
+        # Header del gráfico con los controles del propio gráfico
+        col_titulo, col_escala, col_mostrar = st.columns([3, 2, 1])
+        with col_titulo:
             st.markdown(f"### {label}{unit_str}")
-            
-            # Calcular promedios por dispositivo
-            promedios_dispositivos = chart_data.groupby('device_name')[param].mean()
-            promedio_global = chart_data[param].mean()
-            
-            # Mostrar promedios por dispositivo en columnas dinámicas
-            num_dispositivos = len(promedios_dispositivos)
-            cols_promedios = st.columns(num_dispositivos + 1)  # +1 para el promedio global
-            
-            for idx, (dev_name, avg_val) in enumerate(promedios_dispositivos.items()):
-                with cols_promedios[idx]:
-                    st.metric(
-                        label=dev_name,
-                        value=f"{avg_val:.2f}",
-                        help=f"Promedio de {label} para {dev_name}"
-                    )
-            
-            # Última columna: Promedio Global
-            with cols_promedios[-1]:
+        with col_mostrar:
+            visible = st.toggle("Gráfico", value=por_defecto, key=f"graphs_show_{param}")
+        with col_escala:
+            use_shared_scale = st.checkbox(
+                "Escala Y compartida entre dispositivos",
+                value=True,
+                key=f"graphs_shared_scale_{param}",
+                disabled=not visible
+            )
+
+        # Calcular promedios por dispositivo
+        promedios_dispositivos = chart_data.groupby('device_name')[param].mean()
+        promedio_global = chart_data[param].mean()
+
+        # Mostrar promedios por dispositivo en columnas dinámicas
+        num_dispositivos = len(promedios_dispositivos)
+        cols_promedios = st.columns(num_dispositivos + 1)  # +1 para el promedio global
+
+        for idx, (dev_name, avg_val) in enumerate(promedios_dispositivos.items()):
+            with cols_promedios[idx]:
                 st.metric(
-                    label="Global",
-                    value=f"{promedio_global:.2f}",
-                    delta=None,
-                    help=f"Promedio combinado de todos los dispositivos"
-                )
-            
-            # Calcular rango Y si se comparte escala
-            if use_shared_scale:
-                y_min = chart_data[param].min()
-                y_max = chart_data[param].max()
-                y_margin = (y_max - y_min) * 0.1 if y_max != y_min else 1
-                y_range = [y_min - y_margin, y_max + y_margin]
-            else:
-                y_range = None
-            
-            # Crear figura con múltiples trazos
-            fig = go.Figure()
-            
-            # Colores distintivos para cada dispositivo
-            colors = ['#3b82f6', '#ef4444', '#10b981', '#f59e0b', '#8b5cf6', '#ec4899', '#06b6d4', '#84cc16']
-            
-            # Calcular ventana de SMA basada en cantidad de datos
-            n_total = len(chart_data)
-            window = 5 if n_total < 1000 else (20 if n_total < 10000 else 50)
-            
-            # Agregar trazos por dispositivo
-            for idx, (dev_name, dev_data) in enumerate(chart_data.groupby('device_name', sort=False)):
-                color = colors[idx % len(colors)]
-                dev_sorted = dev_data.sort_values('timestamp')
-                
-                # Línea de valores reales (fina, semi-transparente)
-                fig.add_trace(go.Scatter(
-                    x=dev_sorted['timestamp'],
-                    y=dev_sorted[param],
-                    mode='lines',
-                    name=f'{dev_name}',
-                    line=dict(color=color, width=1),
-                    opacity=0.5,
-                    hovertemplate=f'{dev_name}<br>%{{x}}<br>{label}: %{{y:.2f}}{unit}<extra></extra>',
-                    legendgroup=dev_name
-                ))
-                
-                # Línea de tendencia (SMA) - gruesa, sólida
-                if len(dev_sorted) > window:
-                    sma = dev_sorted[param].rolling(window=window, min_periods=1).mean()
-                    fig.add_trace(go.Scatter(
-                        x=dev_sorted['timestamp'],
-                        y=sma,
-                        mode='lines',
-                        name=f'{dev_name} (Tendencia)',
-                        line=dict(color=color, width=2.5),
-                        opacity=1.0,
-                        hoverinfo='skip',
-                        legendgroup=dev_name,
-                        showlegend=True
-                    ))
-            
-            # Personalización del layout
-            fig.update_layout(
-                hovermode="x unified",
-                legend=dict(
-                    orientation="h",
-                    yanchor="bottom",
-                    y=1.02,
-                    xanchor="right",
-                    x=1,
-                    title=None
-                ),
-                margin=dict(l=20, r=20, t=30, b=20),
-                height=380,
-                template="plotly_white",
-                xaxis=dict(
-                    tickformat="%H:%M" if (delta and delta <= timedelta(hours=24)) else "%d/%m %H:%M",
-                    showgrid=True,
-                    gridcolor='rgba(0,0,0,0.05)'
-                ),
-                yaxis=dict(
-                    showgrid=True,
-                    gridcolor='rgba(0,0,0,0.05)',
-                    range=y_range,
-                    title=f'{label}{unit_str}'
+                    label=dev_name,
+                    value=f"{avg_val:.2f}",
+                    help=f"Promedio de {label} para {dev_name}"
                 )
+
+        # Última columna: Promedio Global
+        with cols_promedios[-1]:
+            st.metric(
+                label="Global",
+                value=f"{promedio_global:.2f}",
+                delta=None,
+                help=f"Promedio combinado de todos los dispositivos"
             )
-            
-            st.plotly_chart(fig, width='stretch')
-            
-            # --- ESTADÍSTICAS ---
-            with st.expander("Estadísticas Detalladas", expanded=False):
+
+        if visible:
+            clave = clave_base + (use_shared_scale,)
+            fig = figuras.get(clave)
+            if fig is None:
+                with span(f"figura {param}", FIGURE):
+                    fig = obtener_figura(clave, (chart_data, param, label, unit,
+                                                 rango_y(chart_data, param, use_shared_scale), delta))
+
+            with span(f"plotly_chart {param}", WIDGETS):
+                st.plotly_chart(fig, width='stretch')
+
+        # --- ESTADÍSTICAS (solo se calculan con el expander abierto) ---
+        expander, abierto = expander_perezoso("Estadísticas Detalladas", f"graphs_stats_{param}")
+        with expander:
+            if abierto:
                 stats = chart_data.groupby('device_name')[param].agg(
                     Mínimo='min',
                     Promedio='mean',
@@ -689,15 +770,15 @@ def show_view():
                     Máximo='max',
                     Registros='count'
                 ).reset_index()
-                
+
                 # Formatear columnas numéricas
                 for col in ['Mínimo', 'Promedio', 'Mediana', 'Máximo']:
                     stats[col] = stats[col].map('{:.2f}'.format)
-                
+
                 stats = stats.rename(columns={'device_name': 'Dispositivo'})
-                
+
                 st.dataframe(
                     stats,
                     width='stretch',
                     hide_index=True
-                )
\ No newline at end of file
+                )
@@ -1,13 +1,22 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta, timezone, time as dt_time
+import pyarrow as pa
+from datetime import datetime, timedelta, time as dt_time
 from io import BytesIO
-from typing import List, Dict, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Tuple
 import time
 
 from modules.database import DatabaseConnection
 from modules.config_manager import ConfigManager
+from modules.frame_compaction import compact_history_frame, expand_for_export
+from modules.search_index import DeviceSearchIndex, categories_of, index_version
+from modules.frame_cache import cached_frame, get_frame_cache
+from modules.local_time import now_local, to_utc
+from modules.sensor_aliases import normalize_sensor_columns
+from modules.profiling import DATA, TRANSFORM, WIDGETS, span
+
+# Filas por página en la vista previa (paginación keyset en MongoDB)
+PREVIEW_PAGE_SIZE = 500
 
 # ICONOS SVG
 ICON_SEARCH = '<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><circle cx="11" cy="11" r="8"/><line x1="21" y1="21" x2="16.65" y2="16.65"/></svg>'
@@ -19,121 +28,103 @@ ICON_CLOCK = '<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" vie
 ICON_LIST = '<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><line x1="8" y1="6" x2="21" y2="6"/><line x1="8" y1="12" x2="21" y2="12"/><line x1="8" y1="18" x2="21" y2="18"/><line x1="3" y1="6" x2="3.01" y2="6"/><line x1="3" y1="12" x2="3.01" y2="12"/><line x1="3" y1="18" x2="3.01" y2="18"/></svg>'
 ICON_CPU = '<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><rect x="4" y="4" width="16" height="16" rx="2" ry="2"/><rect x="9" y="9" width="6" height="6"/><line x1="9" y1="1" x2="9" y2="4"/><line x1="15" y1="1" x2="15" y2="4"/><line x1="9" y1="20" x2="9" y2="23"/><line x1="15" y1="20" x2="15" y2="23"/><line x1="20" y1="9" x2="23" y2="9"/><line x1="20" y1="14" x2="23" y2="14"/><line x1="1" y1="9" x2="4" y2="9"/><line x1="1" y1="14" x2="4" y2="14"/></svg>'
 
+def obtener_indice_busqueda(df: pd.DataFrame, alias_map: Dict[str, str]) -> DeviceSearchIndex:
+    """Índice de búsqueda de la sesión; se reconstruye solo si cambian dispositivos, ubicaciones o alias."""
+    devices = categories_of(df, 'device_id')
+    locations = categories_of(df, 'location')
+    version = index_version(devices, locations, alias_map)
+
+    cached = st.session_state.get('history_search_index')
+    if cached is None or cached[0] != version:
+        cached = (version, DeviceSearchIndex(devices, locations, alias_map))
+        st.session_state['history_search_index'] = cached
+    return cached[1]
+
+
 # =============================================================================
 # FUNCIÓN DE CARGA OPTIMIZADA (Paralela + Caché por Rango)
 # =============================================================================
-@st.cache_data(ttl=3600, show_spinner=False)
-def cargar_datos_rango(start_date: datetime, end_date: datetime, devices: Optional[List[str]] = None) -> pd.DataFrame:
+@cached_frame("history_range", ttl=3600, shared=True)
+def cargar_datos_rango(start_date: datetime, end_date: datetime, devices: Optional[List[str]] = None,
+                       sensors: Optional[Tuple[str, ...]] = None) -> pa.Table:
     """
-    Carga datos corrigiendo desfases de zona horaria (UTC vs Local).
-    Estrategia: Busca 1 día extra en el futuro para capturar datos UTC y luego normaliza a Local.
-    Opción para filtrar por devices directamente en BD.
+    Carga el rango [start_date, end_date] (hora local naive) desde MongoDB.
+    Las fechas se traducen a UTC con la zona de la app (respeta horario de verano) y se consultan
+    los mismos tramos de timestamp que la vista previa (Date, string ISO y epoch).
+    Filtro opcional por devices directamente en BD; `sensors` (nombres canónicos) limita
+    los campos de sensores que viajan desde MongoDB.
+    Devuelve una tabla Arrow inmutable (compartida sin copiar desde el caché); .to_pandas() al usarla.
     """
     start_time_total = time.time()
-    
-    # 1. Extender rango de búsqueda en DB generosamente (+/- 2 días)
-    mongo_end_date = end_date + timedelta(days=2)
-    mongo_start_date = start_date - timedelta(days=2)
-    
+
     # Normalizar inputs para comparaciones
     if start_date.tzinfo: start_date = start_date.replace(tzinfo=None)
     if end_date.tzinfo: end_date = end_date.replace(tzinfo=None)
+    start_utc, end_utc = to_utc(start_date), to_utc(end_date)
 
     try:
         db = DatabaseConnection()
         if db.collection is None:
-            return pd.DataFrame()
+            return pa.table({})
+
+        clauses = [{"$or": db._history_time_branches(start_date, end_date)}]
+        if devices:
+            clauses.append(db.device_filter(devices))
 
-        start_iso = start_date.isoformat()
-        mongo_start_iso = mongo_start_date.isoformat()
-        mongo_end_iso = mongo_end_date.isoformat()
-        
-        # Base Query de tiempo EXTENDIDA
-        time_query = {
-            "$or": [
-                {"timestamp": {"$gte": mongo_start_date, "$lte": mongo_end_date}},
-                {"timestamp": {"$gte": mongo_start_iso, "$lte": mongo_end_iso}}
-            ]
-        }
-        
-        projection = {
-            '_id': 1, 'timestamp': 1, 'device_id': 1, 'dispositivo_id': 1,
-            'sensors': 1, 'datos': 1, 'location': 1, 'metadata': 1
-        }
-        
         # Sin sort en DB para velocidad
-        cursor = db.collection.find(time_query, projection)
+        cursor = db.collection.find({"$and": clauses}, db.reading_projection(sensors))
         raw_docs = list(cursor)
         
         valid_docs = []
-        for doc in raw_docs:
-            norm = db._normalize_document(doc)
-            if norm.get("timestamp") and norm.get("device_id") != "unknown":
-                
-                # FILTRO DE DISPOSITIVOS (EN MEMORIA)
-                if devices and norm.get("device_id") not in devices:
-                    continue
-
-                ts = norm["timestamp"]
-                
-                if isinstance(ts, str):
-                    ts = pd.to_datetime(ts)
-                
-                # CONVERSIÓN EXPLÍCITA A UTC-3 (CHILE)
-                target_offset = timedelta(hours=-3)
-                
-                if isinstance(ts, datetime):
-                    if ts.tzinfo is not None:
-                        ts_utc = ts.astimezone(timezone.utc)
-                        ts_local = ts_utc + target_offset
-                        ts = ts_local.replace(tzinfo=None)
-                    else:
-                        # Naive: Asumimos ya local
-                        pass
-                
-                norm["timestamp"] = ts
-                
-                # Filtro FINAL EXACTO
-                if start_date <= ts <= end_date:
-                    valid_docs.append(norm)
+        for norm in db._normalize_documents(raw_docs, label="history.py rango"):
+            ts = norm.get("timestamp")
+            # Filtro FINAL EXACTO en UTC (el tramo string se consulta con margen)
+            if ts is not None and norm.get("device_id") != "unknown" and start_utc <= ts <= end_utc:
+                valid_docs.append(norm)
 
         if not valid_docs:
-            return pd.DataFrame()
+            return pa.table({})
 
         # Convertir a DataFrame
         df = db._parse_historical_flat(valid_docs)
         
         # Limpieza columnas
-        try:
-            cols_map = {}
-            for c in df.columns:
-                clean = c.lower().strip()
-                if clean in ['temp', 'temperatura']: clean = 'temperature'
-                cols_map[c] = clean
-            df = df.rename(columns=cols_map)
-        except:
-            pass
+        df = limpiar_columnas_sensores(df)
         
         # Ordenar DESC
         if 'timestamp' in df.columns:
             df = df.sort_values('timestamp', ascending=False)
             
         print(f"[history.py] Total Global DataFrame: {len(df)} registros.")
-        return df
+        df = compact_history_frame(df, label="history.py rango")
+        return pa.Table.from_pandas(df, preserve_index=False)
 
     except Exception as e:
         print(f"[history.py] Error crítico: {e}")
         st.error(f"Error cargando datos: {e}")
-        return pd.DataFrame()
+        return pa.table({})
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cargar_resumen_rango(start_date: datetime, end_date: datetime, devices: tuple = ()) -> pd.DataFrame:
+    """Conteo y rango de fechas por (dispositivo, ubicación), agregado en MongoDB."""
+    df = DatabaseConnection().count_history_by_device(start_date, end_date, list(devices) or None)
+    print(f"[history.py] Resumen del rango: {int(df['count'].sum()) if not df.empty else 0} registros en {len(df)} grupos.")
+    return df
+
+def limpiar_columnas_sensores(df: pd.DataFrame) -> pd.DataFrame:
+    try:
+        return normalize_sensor_columns(df)
+    except Exception:
+        return df
 
 def convert_df_to_csv(df):
-    return df.to_csv(index=False).encode('utf-8')
+    return expand_for_export(df).to_csv(index=False).encode('utf-8')
 
 def convert_df_to_excel(df):
     output = BytesIO()
     # Cambiado a openpyxl por compatibilidad
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Datos')
+        expand_for_export(df).to_excel(writer, index=False, sheet_name='Datos')
     return output.getvalue()
 
 def show_view():
@@ -143,6 +134,9 @@ def show_view():
     with c2:
         if st.button("Actualizar Tabla", type="primary", key="refresh_btn", help="Recargar datos"):
             cargar_datos_rango.clear()
+            cargar_resumen_rango.clear()
+            st.session_state.pop('history_page', None)
+            st.session_state.pop('history_export', None)
             st.rerun()
 
     # --- 1. CARGA INICIAL ---
@@ -178,7 +172,7 @@ def show_view():
         c_date, c_dev, c_btn = st.columns([2, 2, 1.2])
         
         with c_date:
-            today = datetime.now().date()
+            today = now_local().date()
             default_start = today - timedelta(days=7)
             
             date_range = st.date_input(
@@ -214,10 +208,11 @@ def show_view():
             return
 
         # Inicializar estado
-        if 'history_data' not in st.session_state:
-            st.session_state.history_data = None
         if 'last_params' not in st.session_state:
             st.session_state.last_params = None
+        if 'history_pages' not in st.session_state:
+            # Pila de cursores keyset: inicio de cada página visitada (None = primera página)
+            st.session_state.history_pages = [None]
             
         # Detectar cambios en filtros para limpiar vista vieja
         # Tupla hashable de params actuales
@@ -225,19 +220,14 @@ def show_view():
         
         if st.session_state.last_params != current_params and not buscar:
             # Si cambiaron los params y NO se ha pulsado buscar aun -> Limpiar
-            st.session_state.history_data = None
+            st.session_state.last_params = None
             
         if buscar:
-            # Definir lista de devices a buscar (None = Todos)
-            devs_to_search = sel_devices_pre if sel_devices_pre else None
-            
-            with st.spinner(f"Consultando..."):
-                st.session_state.history_data = cargar_datos_rango(start_time, end_time, devs_to_search)
-                st.session_state.last_params = current_params
-                
-        df = st.session_state.history_data
+            st.session_state.last_params = current_params
+            st.session_state.history_pages = [None]
+            st.session_state.history_export = None
 
-        if df is None:
+        if st.session_state.last_params is None:
             st.markdown(f"""
             <div style="margin-top:20px; padding:15px; border-radius:8px; background-color:#f8fafc; border:1px dashed #cbd5e1; color:#64748b; display:flex; gap:10px; align-items:center;">
                 {ICON_INFO} 
@@ -245,18 +235,15 @@ def show_view():
             </div>
             """, unsafe_allow_html=True)
             return
+
+        # Resumen calculado en el servidor: no se traen documentos para las métricas
+        with st.spinner(f"Consultando..."), span("cargar_resumen_rango", DATA):
+            resumen = cargar_resumen_rango(start_time, end_time, current_params[2])
             
-        if df.empty:
+        if resumen.empty:
             st.warning("No se encontraron registros.")
             return
 
-        # Preprocesamiento
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-            df = df.dropna(subset=['timestamp'])
-            if not df.empty and df['timestamp'].dt.tz is not None:
-                df['timestamp'] = df['timestamp'].dt.tz_localize(None)
-
         # --- FILTROS SECUNDARIOS (Texto) ---
         st.markdown("---")
         
@@ -269,25 +256,25 @@ def show_view():
     
     # Referenciar mapa de alias para uso local
     alias_map = alias_map_pre
+    devs_to_search = list(current_params[2]) or None
 
     # (El filtro de dispositivos ya se aplicó en la consulta a BD)
-    if text_search:
-        s = text_search.lower()
-        if 'location' not in df.columns: df['location'] = ""
-        # Buscar tambien en alias
-        df['temp_alias'] = df['device_id'].map(lambda x: alias_map.get(x, "").lower())
-        
-        df = df[df['device_id'].astype(str).str.lower().str.contains(s) | 
-                df['location'].astype(str).str.lower().str.contains(s) |
-                df['temp_alias'].str.contains(s)]
-        df = df.drop(columns=['temp_alias'])
+    # El texto se resuelve contra los pares (dispositivo, ubicación) del resumen y se traduce a un filtro Mongo
+    with span("índice de búsqueda", TRANSFORM):
+        search_index = obtener_indice_busqueda(resumen, alias_map)
+        search_filter = None
+        if text_search:
+            resumen = search_index.filter(resumen, text_search)
+            search_filter = db.device_filter(sorted(search_index.matching_devices(text_search)),
+                                             sorted(search_index.matching_locations(text_search)))
+
+    total_registros = int(resumen['count'].sum()) if not resumen.empty else 0
 
     # --- MÉTRICAS DE ESTADO ---
-    if not df.empty:
+    if total_registros:
         try:
             # Calcular desglose
-            dev_counts = df['device_id'].value_counts().reset_index()
-            dev_counts.columns = ['device_id', 'count']
+            dev_counts = resumen.groupby('device_id', sort=False)['count'].sum().sort_values(ascending=False).reset_index()
             dev_counts['alias'] = dev_counts['device_id'].apply(lambda x: alias_map.get(x, x))
             
             summary_items = []
@@ -296,9 +283,9 @@ def show_view():
             
             dev_summary_html = " ".join(summary_items)
 
-            min_ts = df['timestamp'].min().strftime('%d/%m %H:%M:%S')
-            max_ts = df['timestamp'].max().strftime('%d/%m %H:%M:%S')
-            total_devs = df['device_id'].nunique()
+            min_ts = pd.Timestamp(resumen['t_min'].min()).strftime('%d/%m %H:%M:%S')
+            max_ts = pd.Timestamp(resumen['t_max'].max()).strftime('%d/%m %H:%M:%S')
+            total_devs = resumen['device_id'].nunique()
             
             st.markdown(f"""
             <div style="background-color:#ffffff; padding:15px; border-radius:8px; font-size:0.9rem; color:#334155; border:1px solid #e2e8f0; margin-top:15px; box-shadow: 0 1px 2px rgba(0,0,0,0.05);">
@@ -307,7 +294,7 @@ def show_view():
                         {ICON_CLOCK} <span style="font-weight:600;">Rango:</span> {min_ts} — {max_ts}
                     </div>
                     <div style="display:flex; align-items:center; gap:6px;">
-                        {ICON_LIST} <span style="font-weight:600;">Total Registros:</span> {len(df)}
+                        {ICON_LIST} <span style="font-weight:600;">Total Registros:</span> {total_registros}
                     </div>
                     <div style="display:flex; align-items:center; gap:6px;">
                         {ICON_CPU} <span style="font-weight:600;">Dispositivos:</span> {total_devs}
@@ -323,11 +310,9 @@ def show_view():
 
     # --- 3. SECCIÓN DE DESCARGA ---
     st.markdown("---")
-    res_txt = f"Registros seleccionados: {len(df)}"
+    res_txt = f"Registros seleccionados: {total_registros}"
     st.markdown(f"#### Exportar Datos ({res_txt})")
     
-    c_down1, c_down2 = st.columns(2)
-    
     # Generar nombre de archivo base
     try:
         f_start = start_d.strftime('%Y%m%d')
@@ -337,33 +322,54 @@ def show_view():
         f_end = "fin"
         
     file_base = f"biofloc_data_{f_start}_{f_end}"
-    
-    with c_down1:
-        csv_data = convert_df_to_csv(df)
-        st.download_button(
-            label="Descargar Selección (CSV)",
-            data=csv_data,
-            file_name=f"{file_base}.csv",
-            mime="text/csv",
-            help="Formato ligero, ideal para análisis de datos masivos.",
-            type="primary",
-            width="stretch"
-        )
 
-    with c_down2:
-        try:
-            excel_data = convert_df_to_excel(df)
+    # La exportación es lo único que necesita el rango completo en memoria: se carga bajo demanda.
+    # El frame vive en el caché compartido; la sesión guarda solo su clave (si se desaloja, se vuelve a preparar)
+    frame_cache = get_frame_cache()
+    export_id = (current_params, text_search)
+    handle = st.session_state.get('history_export')
+    table = frame_cache.get(handle[1]) if handle is not None and handle[0] == export_id else None
+    if table is None:
+        if st.button("Preparar Descarga", type="primary", disabled=not total_registros,
+                     help="Carga el rango completo para generar los archivos CSV/Excel."):
+            with st.spinner("Cargando registros para exportar..."):
+                table = cargar_datos_rango(start_time, end_time, devs_to_search)
+                cache_key = cargar_datos_rango.key(start_time, end_time, devs_to_search)
+                if text_search and table.num_rows:
+                    table = search_index.filter_table(table, text_search)
+                    cache_key = frame_cache.put(("history_export", export_id), table, ttl=3600)
+                st.session_state.history_export = (export_id, cache_key)
+
+    if table is not None:
+        df = table.to_pandas()
+        c_down1, c_down2 = st.columns(2)
+    
+        with c_down1:
+            csv_data = convert_df_to_csv(df)
             st.download_button(
-                label="Descargar Selección (Excel)",
-                data=excel_data,
-                file_name=f"{file_base}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                help="Formato Excel con encabezados y formato de celdas.",
+                label="Descargar Selección (CSV)",
+                data=csv_data,
+                file_name=f"{file_base}.csv",
+                mime="text/csv",
+                help="Formato ligero, ideal para análisis de datos masivos.",
                 type="primary",
                 width="stretch"
             )
-        except Exception as e:
-             st.warning(f"Error generando Excel: {e}")
+
+        with c_down2:
+            try:
+                excel_data = convert_df_to_excel(df)
+                st.download_button(
+                    label="Descargar Selección (Excel)",
+                    data=excel_data,
+                    file_name=f"{file_base}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    help="Formato Excel con encabezados y formato de celdas.",
+                    type="primary",
+                    width="stretch"
+                )
+            except Exception as e:
+                 st.warning(f"Error generando Excel: {e}")
 
     # Separador
     st.markdown("<br>", unsafe_allow_html=True)
@@ -374,11 +380,12 @@ def show_view():
         if st.button("Generar Backup Completo (CSV)"):
             with st.spinner("Generando backup completo..."):
                 # Cargar últimos 10 años
-                now = datetime.now()
+                now = now_local()
                 backup_start = now - timedelta(days=3650)
-                df_all = cargar_datos_rango(backup_start, now)
+                table_all = cargar_datos_rango(backup_start, now)
                 
-                if not df_all.empty:
+                if table_all.num_rows:
+                    df_all = table_all.to_pandas()
                     csv_all = convert_df_to_csv(df_all)
                     st.success(f"Backup generado: {len(df_all)} registros.")
                     st.download_button(
@@ -393,12 +400,50 @@ def show_view():
 
     st.markdown("---")
 
-    # --- 5. VISTA PREVIA ---
-    # --- 5. VISTA PREVIA ---
-    st.markdown(f"**Vista Previa (Últimos {min(500, len(df))} registros)**")
+    # --- 5. VISTA PREVIA (paginada en MongoDB) ---
+    if st.session_state.get('history_pages_filter') != (current_params, text_search):
+        # Otro rango o texto: volver a la primera página
+        st.session_state.history_pages = [None]
+        st.session_state.history_pages_filter = (current_params, text_search)
+    pages = st.session_state.history_pages
+    page_key = (current_params, text_search, len(pages))
+    page_state = st.session_state.get('history_page')
+    if page_state is None or page_state[0] != page_key:
+        if text_search and not search_filter:
+            page_df, next_cursor = pd.DataFrame(), None
+        else:
+            with span("fetch_history_page", DATA):
+                page_df, next_cursor = db.fetch_history_page(start_time, end_time, devs_to_search, after=pages[-1],
+                                                             page_size=PREVIEW_PAGE_SIZE, extra_filter=search_filter)
+            page_df = limpiar_columnas_sensores(page_df)
+        page_state = (page_key, page_df, next_cursor)
+        st.session_state.history_page = page_state
+    _, df, next_cursor = page_state
+
+    page_num = len(pages)
+    # Las páginas pueden salir más cortas que PREVIEW_PAGE_SIZE: el cursor trae cuántos registros van
+    first_row = (pages[-1] or {}).get("offset", 0) + 1
+    if df.empty:
+        st.markdown(f"**Vista Previa (Página {page_num}: sin registros)**")
+    else:
+        st.markdown(f"**Vista Previa (Página {page_num}: registros {first_row}–{first_row + len(df) - 1} de {total_registros}, más recientes primero)**")
+
+    c_prev, c_next, _ = st.columns([1, 1, 4])
+    with c_prev:
+        if st.button("← Anterior", disabled=page_num == 1, width="stretch"):
+            pages.pop()
+            st.rerun()
+    with c_next:
+        if st.button("Siguiente →", disabled=next_cursor is None, width="stretch"):
+            pages.append(next_cursor)
+            st.rerun()
+
+    if df.empty:
+        st.info("No hay registros en esta página.")
+        return
     
     # Preparar DF para mostrar (Alias en vez de ID)
-    df_show = df.head(500).copy()
+    df_show = df.copy()
     if 'device_id' in df_show.columns:
         df_show['Dispositivo'] = df_show['device_id'].apply(lambda x: alias_map.get(x, x))
         
@@ -419,9 +464,10 @@ def show_view():
         unit = sensor_config.get(col, {}).get('unit', '')
         column_config[col] = st.column_config.NumberColumn(f"{label} ({unit})", format="%.2f")
             
-    st.dataframe(
-        df_show,
-        column_config=column_config,
-        use_container_width=True,
-        hide_index=True
-    )
+    with span("tabla vista previa", WIDGETS):
+        st.dataframe(
+            df_show,
+            column_config=column_config,
+            use_container_width=True,
+            hide_index=True
+        )
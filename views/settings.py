@@ -5,6 +5,9 @@ from typing import Dict, Any, List
 from modules.database import DatabaseConnection
 from modules.config_manager import ConfigManager
 from modules.sensor_registry import SensorRegistry
+from modules.sensor_aliases import canonical_sensor, parse_threshold_fields
+from modules.sensor_catalog import sensors_for_device
+from modules.profiling import DATA, TRANSFORM, span
 
 # --- ICONOS SVG ---
 ICON_SAVE = '<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M19 21H5a2 2 0 0 1-2-2V5a2 2 0 0 1 2-2h11l5 5v11a2 2 0 0 1-2 2z"/><polyline points="17 21 17 13 7 13 7 21"/><polyline points="7 3 7 8 15 8"/></svg>'
@@ -85,13 +88,15 @@ def show_view():
             st.markdown(f"<div style='margin-bottom:10px; font-weight:600; color:#475569; display:flex; align-items:center; gap:8px;'>{ICON_DEVICE} Gestión de Alias</div>", unsafe_allow_html=True)
             
             try:
-                recent_df = db.get_latest_by_device()
+                with span("get_latest_by_device", DATA):
+                    recent_df = db.get_latest_by_device()
                 detected_ids = sorted(recent_df['device_id'].unique().tolist()) if not recent_df.empty else []
             except:
                 detected_ids = []
                 recent_df = pd.DataFrame()
             
-            metadata = config_manager.get_device_metadata()
+            with span("metadatos de dispositivos", DATA):
+                metadata = config_manager.get_device_metadata()
             all_ids = sorted(list(set(detected_ids + list(metadata.keys()))))
             
             if not all_ids:
@@ -140,7 +145,9 @@ def show_view():
                 target_dev = st.selectbox("1. Dispositivo", all_ids, key="thr_dev_sel", format_func=format_device_name)
                 
                 # 2. Descubrir Parámetros
-                valid_params = discover_available_params(recent_df, target_dev)
+                # Catálogo persistente (O(1)); si el dispositivo aún no está, inspeccionar sus últimas lecturas
+                with span("parámetros del dispositivo", TRANSFORM):
+                    valid_params = sensors_for_device(target_dev) or discover_available_params(recent_df, target_dev)
 
                 if not valid_params:
                     st.info("No se detectaron parámetros numéricos configurables para este dispositivo (revisar conexión de sensores).")
@@ -166,40 +173,11 @@ def show_view():
                     # 2. Umbrales específicos del dispositivo (tienen prioridad sobre los globales)
                     dev_specifics_raw = config_manager.get_device_thresholds(target_dev)
 
-                    # Mapeo de prefijos almacenados → nombre canónico del sensor
-                    PREFIX_MAP = {
-                        'temp': 'temperature', 'temperatura': 'temperature', 'temperature': 'temperature',
-                        'ph': 'ph', 'do': 'do', 'oxygen': 'oxygen', 'saturation': 'saturation',
-                        'ammonia': 'ammonia', 'nitrite': 'nitrite', 'nitrate': 'nitrate',
-                        'alkalinity': 'alkalinity', 'phosphate': 'phosphate', 'hardness': 'hardness',
-                        'tss': 'tss', 'biofloc_index': 'biofloc_index', 'ec': 'ec',
-                        'orp': 'orp', 'turbidez': 'turbidez',
-                    }
-
-                    dev_specifics = {}
-                    if dev_specifics_raw:
-                        has_new_format = any(isinstance(v, dict) and 'min_value' in v for v in dev_specifics_raw.values())
-                        if not has_new_format:
-                            # Convertir formato plano {temperature_min: X, temperature_max: Y}
-                            # a formato estructurado {temperature: {min_value: X, max_value: Y}}
-                            for key, value in dev_specifics_raw.items():
-                                if isinstance(value, (dict, list)):
-                                    continue
-                                parts = key.lower().rsplit('_', 1)
-                                if len(parts) == 2:
-                                    param_name, threshold_type = parts
-                                    canonical = PREFIX_MAP.get(param_name, param_name)
-                                    if canonical not in dev_specifics:
-                                        dev_specifics[canonical] = {}
-                                    if threshold_type == 'min':
-                                        dev_specifics[canonical]['min_value'] = float(value)
-                                    elif threshold_type == 'max':
-                                        dev_specifics[canonical]['max_value'] = float(value)
-                        else:
-                            dev_specifics = dev_specifics_raw
+                    # Formato plano {temperature_min: X, ...} (o anidado antiguo) -> {sensor canónico: config}
+                    dev_specifics = parse_threshold_fields(dev_specifics_raw)
 
                     # 3. Resolver la conf final: device > global > registry
-                    current_conf = dev_specifics.get(target_param, base_conf)
+                    current_conf = dev_specifics.get(canonical_sensor(target_param), base_conf)
 
                     # Valores finales (con fallback al registry)
                     d_omin = float(current_conf.get("min_value", base_conf["min_value"]))
@@ -248,7 +226,7 @@ def show_view():
                             else:
                                 # Guardar en formato PLANO (temperature_min, ph_max) en lugar de objetos anidados
                                 # Usar el nombre canónico del parámetro tal como viene de los datos
-                                param_key = target_param.lower()
+                                param_key = canonical_sensor(target_param)
                                 
                                 # Crear claves planas
                                 min_key = f"{param_key}_min"